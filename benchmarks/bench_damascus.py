@@ -0,0 +1,309 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Benchmarks of the sweep, HSC mask, and shape hot paths.
+
+Generates synthetic sweep-like FITS catalogs and a Healpix mask locally, then records
+the run time and the peak memory of: loading, chained selection, mask filtering,
+convex & concave hulls, and the FDFC borders & polygons. Everything runs offline.
+
+Examples
+--------
+    $ python benchmarks/bench_damascus.py --rows 100000 1000000 --output bench_abc123.json
+    $ python benchmarks/bench_damascus.py --rows 1000000 --compare bench_abc123.json
+
+Notes
+-----
+    - The time is the best and the median of `--repeat` runs after one warm-up run.
+      The peak memory is the peak of the Python & numpy allocations traced by
+      `tracemalloc` during one extra run, plus the maximum resident set size of the
+      process.
+    - The synthetic catalogs are kept in `--data-dir` and reused when it is given.
+
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+import healpy as hp
+
+from astropy.io import fits
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from damascus import hsc  # noqa: E402
+from damascus import shape  # noqa: E402
+from damascus import utils  # noqa: E402
+from damascus.sweep import SweepCatalog, sweep_bright_galaxy_match  # noqa: E402
+
+SWEEP_NAME = 'sweep-150p000-160p005.fits'
+SWEEP_RA, SWEEP_DEC = (150.0, 160.0), (0.0, 5.0)
+
+TYPES = np.array(['PSF', 'REX', 'EXP', 'DEV', 'COMP', 'DUP'])
+TYPE_PROB = np.array([0.45, 0.25, 0.15, 0.08, 0.05, 0.02])
+BANDS = ['G', 'R', 'Z', 'W1', 'W2', 'W3', 'W4']
+
+
+def make_sweep(output, n_rows, seed=42):
+    '''Write a synthetic sweep catalog with the DR8 column set.'''
+    rng = np.random.default_rng(seed)
+    columns = [
+        fits.Column(name='RELEASE', format='I', array=np.full(n_rows, 8000, dtype=np.int16)),
+        fits.Column(name='BRICKID', format='J',
+                    array=rng.integers(300000, 310000, n_rows, dtype=np.int32)),
+        fits.Column(name='BRICKNAME', format='8A',
+                    array=np.full(n_rows, '1550p025')),
+        fits.Column(name='OBJID', format='J', array=np.arange(n_rows, dtype=np.int32)),
+        fits.Column(name='TYPE', format='4A', array=rng.choice(TYPES, n_rows, p=TYPE_PROB)),
+        fits.Column(name='RA', format='D', array=rng.uniform(*SWEEP_RA, n_rows)),
+        fits.Column(name='DEC', format='D', array=rng.uniform(*SWEEP_DEC, n_rows)),
+        fits.Column(name='RA_IVAR', format='E', array=rng.uniform(1e9, 1e11, n_rows)),
+        fits.Column(name='DEC_IVAR', format='E', array=rng.uniform(1e9, 1e11, n_rows)),
+        fits.Column(name='DCHISQ', format='5E', array=rng.uniform(0, 1e4, (n_rows, 5))),
+        fits.Column(name='EBV', format='E', array=rng.uniform(0.01, 0.1, n_rows)),
+    ]
+    # Fluxes in nanomaggies, so that ~30% of the objects are brighter than 23 mag.
+    for band in BANDS:
+        columns += [
+            fits.Column(name='FLUX_' + band, format='E',
+                        array=10.0 ** rng.normal(-0.2, 0.8, n_rows)),
+            fits.Column(name='FLUX_IVAR_' + band, format='E',
+                        array=rng.uniform(1.0, 100.0, n_rows)),
+            fits.Column(name='MW_TRANSMISSION_' + band, format='E',
+                        array=rng.uniform(0.8, 1.0, n_rows))]
+    for band in BANDS[:3]:
+        columns += [
+            fits.Column(name='NOBS_' + band, format='I',
+                        array=rng.integers(1, 10, n_rows, dtype=np.int16)),
+            fits.Column(name='FRACFLUX_' + band, format='E', array=rng.uniform(0, 1, n_rows)),
+            fits.Column(name='FRACMASKED_' + band, format='E',
+                        array=rng.uniform(0, 1, n_rows)),
+            fits.Column(name='PSFSIZE_' + band, format='E',
+                        array=rng.uniform(0.8, 2.0, n_rows)),
+            fits.Column(name='PSFDEPTH_' + band, format='E',
+                        array=rng.uniform(10, 1000, n_rows))]
+    for prefix in ['SHAPEEXP', 'SHAPEDEV']:
+        columns += [
+            fits.Column(name=prefix + '_R', format='E', array=rng.exponential(1.0, n_rows)),
+            fits.Column(name=prefix + '_E1', format='E', array=rng.normal(0, 0.2, n_rows)),
+            fits.Column(name=prefix + '_E2', format='E', array=rng.normal(0, 0.2, n_rows))]
+    columns += [
+        fits.Column(name='FRACDEV', format='E', array=rng.uniform(0, 1, n_rows)),
+        fits.Column(name='MASKBITS', format='I',
+                    array=rng.choice(np.array([0, 2, 4096], dtype=np.int16), n_rows)),
+        fits.Column(name='BRIGHTSTARINBLOB', format='L', array=rng.random(n_rows) < 0.01)]
+
+    fits.BinTableHDU.from_columns(columns).writeto(output, overwrite=True)
+
+
+def make_mask(output, nside=1024, seed=42):
+    '''Write a synthetic NESTED Healpix mask with a few rectangular fields in the sweep.'''
+    rng = np.random.default_rng(seed)
+    mask = np.zeros(hp.nside2npix(nside), dtype=np.int16)
+    for _ in range(3):
+        ra_0 = rng.uniform(SWEEP_RA[0], SWEEP_RA[1] - 3.0)
+        dec_0 = rng.uniform(SWEEP_DEC[0], SWEEP_DEC[1] - 2.0)
+        corners = hp.ang2vec(
+            np.array([ra_0, ra_0 + 3.0, ra_0 + 3.0, ra_0]),
+            np.array([dec_0, dec_0, dec_0 + 2.0, dec_0 + 2.0]), lonlat=True)
+        mask[hp.query_polygon(nside, corners, nest=True)] = 1
+    hp.write_map(output, mask, nest=True, dtype=np.int16, overwrite=True)
+
+
+def measure(func, repeat=3):
+    '''Best and median time of `repeat` runs, and the peak memory of one extra run.'''
+    # Warm up the page cache and the lazily decoded FITS columns
+    func()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'time_best': min(times), 'time_median': float(np.median(times)),
+            'repeat': repeat, 'peak_traced_bytes': peak,
+            'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+
+def sweep_benchmarks(sweep_file, mask_file):
+    '''Benchmarks that depend on the size of the sweep catalog.'''
+    fdfc_mask = hsc.FDFCMask.read(mask_file)
+
+    def load():
+        sweep = SweepCatalog(sweep_file, read_in=True)
+        np.asarray(sweep.data['FLUX_G']).sum()
+        sweep.close()
+
+    def load_columns():
+        sweep = SweepCatalog(sweep_file, read_in=True,
+                             columns=['TYPE', 'FLUX_G', 'FLUX_R', 'FLUX_Z'])
+        sweep.close()
+
+    sweep = SweepCatalog(sweep_file, read_in=True)
+
+    def select_chained():
+        sweep.data_use = None
+        sweep.select('TYPE', '!=', 'DUP', update=True)
+        sweep.select('TYPE', '!=', 'PSF', update=True)
+        sweep.select('FLUX_G', '>', 0.63, update=True)
+        sweep.select('FLUX_R', '>', 1.0, update=True)
+        sweep.select('FLUX_Z', '>', 1.0, update=True)
+
+    def select_query():
+        sweep.where(('TYPE', '!=', 'DUP'), ('TYPE', '!=', 'PSF'), ('FLUX_G', '>', 0.63),
+                    ('FLUX_R', '>', 1.0), ('FLUX_Z', '>', 1.0)).fetch()
+
+    def mask_filter():
+        hsc.filter_hsc_fdfc_mask(sweep.data, fdfc_mask, ra='RA', dec='DEC')
+
+    def mask_filter_file():
+        hsc.filter_hsc_fdfc_mask(sweep.data, mask_file, ra='RA', dec='DEC')
+
+    def bright_galaxy_match():
+        sweep_bright_galaxy_match(sweep_file, mask=fdfc_mask, verbose=False)
+
+    def photometry():
+        utils.photometry(sweep.data, bands=['G', 'R', 'Z', 'W1'], asinh=True)
+
+    def demography():
+        sweep.demography(verbose=False)
+
+    def convex_hull():
+        sweep.convex_hull(refresh=True)
+
+    def concave_hull():
+        sweep.concave_hull(alpha=0.1, n_samples=10000, refresh=True)
+
+    benchmarks = [('load', load), ('load_columns', load_columns),
+                  ('select_chained', select_chained), ('select_query', select_query),
+                  ('mask_filter', mask_filter), ('mask_filter_file', mask_filter_file),
+                  ('bright_galaxy_match', bright_galaxy_match), ('photometry', photometry),
+                  ('demography', demography), ('convex_hull', convex_hull), ('concave_hull', concave_hull)]
+    return benchmarks, sweep
+
+
+def mask_benchmarks(mask_file):
+    '''Benchmarks that only depend on the Healpix mask.'''
+    def fdfc_borders():
+        hsc.get_fdfc_borders(mask_file, nest=True, verbose=False)
+
+    def fdfc_polygons():
+        hsc.get_fdfc_polygons(mask_file, nest=True, verbose=False)
+
+    def alpha_shape():
+        rng = np.random.default_rng(42)
+        shape.alpha_shape(rng.uniform(0, 1, (10000, 2)), alpha=0.05)
+
+    return [('fdfc_borders', fdfc_borders), ('fdfc_polygons', fdfc_polygons),
+            ('alpha_shape_10k', alpha_shape)]
+
+
+def _git_commit():
+    '''Current commit of the repository, if available.'''
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, reference_file):
+    '''Print the ratio of the best time to the reference results.'''
+    with open(reference_file, 'r') as reference:
+        reference = json.load(reference)
+    old = {(r['name'], r['n_rows']): r for r in reference['results']}
+    print("# Compared to {} ({})".format(reference_file, reference['meta'].get('commit')))
+    for result in results:
+        key = (result['name'], result['n_rows'])
+        if key in old:
+            print("# {:24s} {:>10} rows: {:8.4f} s -> {:8.4f} s ({:.2f}x)".format(
+                result['name'], str(result['n_rows']), old[key]['time_best'],
+                result['time_best'], old[key]['time_best'] / max(result['time_best'], 1e-12)))
+
+
+def main(argv=None):
+    '''Run the benchmarks.'''
+    parser = argparse.ArgumentParser(description='Benchmarks of damascus.')
+    parser.add_argument('--rows', nargs='+', type=float, default=[1e5, 1e6],
+                        help='Sizes of the synthetic sweeps. Default: 1e5 1e6')
+    parser.add_argument('--nside', type=int, default=1024,
+                        help='NSIDE of the synthetic mask. Default: 1024')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs. Default: 3')
+    parser.add_argument('--only', nargs='+', default=None, help='Only run these benchmarks.')
+    parser.add_argument('--data-dir', default=None,
+                        help='Keep and reuse the synthetic catalogs here.')
+    parser.add_argument('--output', default=None, help='Output JSON file.')
+    parser.add_argument('--compare', default=None, help='JSON results to compare with.')
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='damascus_bench_')
+    os.makedirs(data_dir, exist_ok=True)
+
+    mask_file = os.path.join(data_dir, 'mask_nside{:d}.fits'.format(args.nside))
+    if not os.path.isfile(mask_file):
+        make_mask(mask_file, nside=args.nside)
+
+    results = []
+
+    def run(name, func, n_rows):
+        if args.only is not None and name not in args.only:
+            return
+        result = measure(func, repeat=args.repeat)
+        result.update({'name': name, 'n_rows': n_rows})
+        results.append(result)
+        print("# {:24s} {:>10} rows: {:8.4f} s (median {:8.4f} s), peak {:8.1f} MB".format(
+            name, str(n_rows), result['time_best'], result['time_median'],
+            result['peak_traced_bytes'] / 1024 ** 2))
+
+    try:
+        for n_rows in [int(rows) for rows in args.rows]:
+            sweep_dir = os.path.join(data_dir, 'rows{:d}'.format(n_rows))
+            sweep_file = os.path.join(sweep_dir, SWEEP_NAME)
+            if not os.path.isfile(sweep_file):
+                os.makedirs(sweep_dir, exist_ok=True)
+                make_sweep(sweep_file, n_rows)
+            benchmarks, sweep = sweep_benchmarks(sweep_file, mask_file)
+            for name, func in benchmarks:
+                run(name, func, n_rows)
+            sweep.close()
+
+        for name, func in mask_benchmarks(mask_file):
+            run(name, func, None)
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    output = {
+        'meta': {'commit': _git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'python': platform.python_version(), 'numpy': np.__version__,
+                 'platform': platform.platform(), 'nside': args.nside,
+                 'repeat': args.repeat},
+        'results': results}
+    if args.output is not None:
+        with open(args.output, 'w') as json_file:
+            json.dump(output, json_file, indent=1)
+    if args.compare is not None:
+        compare(results, args.compare)
+
+    return output
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Import-time budget of the light-weight entry points of damascus.
+
+Each entry point is imported in a fresh interpreter. The check fails (exit code 1) if
+its import time, on top of `import numpy`, exceeds the budget, or if it loads any of
+the heavy dependencies.
+
+Examples
+--------
+    $ python benchmarks/bench_import.py
+    $ python benchmarks/bench_import.py --budget 0.03 --output import_abc123.json
+
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['healpy', 'astropy', 'sklearn', 'scipy', 'matplotlib']
+
+# Code run by a process that only routes sweeps or converts photometry.
+ENTRY_POINTS = {
+    'damascus': 'import damascus',
+    'utils.mag_to_flux': 'from damascus.utils import mag_to_flux',
+    'sweep.sweep_to_box': 'from damascus.sweep import sweep_to_box',
+    'index.SweepIndex': 'from damascus.index import SweepIndex',
+    'batch.shard_sweeps': 'from damascus.batch import shard_sweeps',
+    'cli': 'import damascus.cli',
+}
+
+TIMER = """
+import sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def time_import(code, repeat=5):
+    '''Best import time of the code in a fresh interpreter, and the heavy modules loaded.'''
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [PACKAGE_DIR] + [p for p in os.environ.get('PYTHONPATH', '').split(os.pathsep) if p]))
+    best, heavy = None, []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, '-c', TIMER.format(code=code, heavy=HEAVY_MODULES)],
+            env=env).decode().split()
+        elapsed = float(output[0])
+        heavy = output[1].split(',') if len(output) > 1 else []
+        best = elapsed if best is None else min(best, elapsed)
+    return best, heavy
+
+
+def main(argv=None):
+    '''Run the import-time checks.'''
+    parser = argparse.ArgumentParser(description='Import-time budget of damascus.')
+    parser.add_argument('--budget', type=float, default=0.05,
+                        help='Budget in seconds on top of `import numpy`. Default: 0.05')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs. Default: 5')
+    parser.add_argument('--output', default=None, help='Output JSON file.')
+    args = parser.parse_args(argv)
+
+    baseline, _ = time_import('import numpy', repeat=args.repeat)
+    print("# {:24s} {:8.4f} s".format('numpy (baseline)', baseline))
+
+    results, failed = [], False
+    for name, code in ENTRY_POINTS.items():
+        elapsed, heavy = time_import(code, repeat=args.repeat)
+        over = max(elapsed - baseline, 0.0)
+        passed = over <= args.budget and not heavy
+        failed |= not passed
+        results.append({'name': name, 'time': elapsed, 'over_numpy': over,
+                        'heavy_modules': heavy, 'passed': passed})
+        print("# {:24s} {:8.4f} s (+{:.4f} s) {:s}{:s}".format(
+            name, elapsed, over, 'ok' if passed else 'FAILED',
+            '' if not heavy else ', loads ' + ', '.join(heavy)))
+
+    if args.output is not None:
+        with open(args.output, 'w') as json_file:
+            json.dump({'baseline': baseline, 'budget': args.budget, 'results': results},
+                      json_file, indent=1)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,28 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+"""DAMASCUS: DecAls MASsive Clusters Using central galaxieS.
 
-from . import io
-from . import hsc
-from . import utils
-from . import decals
+The sub-modules are imported on first access, e.g. `damascus.hsc`, so that the
+heavy dependencies (healpy, astropy, scipy, scikit-learn) are only loaded by the
+processes that use them.
+"""
+
+import importlib
 
 __all__ = ["hsc", "io", "decals", "utils"]
 
 __version__ = "0.1.0"
+
+_SUBMODULES = [
+    "batch", "cache", "catalog", "cli", "decals", "hsc", "index", "instrument", "io", "moc",
+    "polygon", "query", "shape", "shared", "sparse", "stats", "sweep", "utils", "xmatch"]
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + _SUBMODULES)
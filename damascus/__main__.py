@@ -0,0 +1,9 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Run the `damascus` command line interface with `python -m damascus`."""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,339 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Resumable batch processing of the full sweep footprint.
+
+`run_batch` runs `sweep_bright_galaxy_match` on each sweep, writes one output catalog
+per sweep, and records the status, output path, number of rows, and timing of each
+sweep in a JSON manifest. On restart, the completed sweeps are skipped, unless the mask
+or the selection parameters changed since the previous run. The list of sweeps can be
+split into N independent shards (`shard='i/N'`), each with its own manifest.
+
+"""
+
+import os
+import json
+import time
+import socket
+import itertools
+
+import numpy as np
+
+from . import io
+from . import hsc
+from . import cache
+from . import instrument
+from . import shared
+from .sweep import sweep_bright_galaxy_match, _prefetched
+
+__all__ = ['parse_shard', 'shard_sweeps', 'BatchManifest', 'run_batch', 'collect_outputs']
+
+
+def parse_shard(shard):
+    '''Parse the shard description `"i/N"` into `(i, N)`, with `0 <= i < N`.'''
+    if shard is None:
+        return None
+    if isinstance(shard, str):
+        index, total = [int(value) for value in shard.split('/')]
+    else:
+        index, total = shard
+    if total < 1 or not 0 <= index < total:
+        raise ValueError("Wrong shard: {}; should be i/N with 0 <= i < N".format(shard))
+    return index, total
+
+
+def shard_sweeps(sweeps, shard=None):
+    '''Deterministic subset of the sweeps processed by one shard.'''
+    sweeps = sorted(sweeps)
+    shard = parse_shard(shard)
+    if shard is None:
+        return sweeps
+    index, total = shard
+    return sweeps[index::total]
+
+
+class BatchManifest(object):
+    '''JSON record of the progress of a batch run.
+
+    Parameters
+    ----------
+    manifest_file: `string`
+        Path to the manifest. It is read if it already exists.
+
+    Notes
+    -----
+        Each sweep has a record with `status` ("done", "failed", or "stale"), `output`,
+        `n_rows`, `time` (in seconds), `host`, and `error` if it failed. The file is
+        rewritten atomically after each sweep.
+
+    '''
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+        self.params = {}
+        self.sweeps = {}
+        if os.path.isfile(manifest_file):
+            with open(manifest_file, 'r') as manifest:
+                content = json.load(manifest)
+            self.params = content.get('params', {})
+            self.sweeps = content.get('sweeps', {})
+
+    def __repr__(self):
+        return "Batch Manifest: {:s} ({:d}/{:d} done)".format(
+            self.manifest_file, self.n_done, len(self.sweeps))
+
+    def save(self):
+        '''Write the manifest atomically.'''
+        tmp_file = self.manifest_file + '.tmp'
+        with open(tmp_file, 'w') as manifest:
+            json.dump({'params': self.params, 'sweeps': self.sweeps}, manifest, indent=1)
+        os.replace(tmp_file, self.manifest_file)
+
+    def is_done(self, sweep_cat):
+        '''Whether the sweep is completed and its output (if any) still exists.'''
+        record = self.sweeps.get(os.path.split(sweep_cat)[-1])
+        if record is None or record.get('status') != 'done':
+            return False
+        return record.get('output') is None or os.path.isfile(record['output'])
+
+    def update(self, sweep_cat, **record):
+        '''Update the record of one sweep.'''
+        self.sweeps[os.path.split(sweep_cat)[-1]] = record
+
+    def invalidate(self):
+        '''Mark all the records as stale, so that their sweeps are processed again.
+
+        Returns
+        -------
+        n_stale: `int`
+            Number of records that were done or failed.
+        '''
+        n_stale = 0
+        for record in self.sweeps.values():
+            if record.get('status') != 'stale':
+                record['status'] = 'stale'
+                n_stale += 1
+        return n_stale
+
+    @property
+    def n_done(self):
+        '''Number of completed sweeps.'''
+        return sum(record.get('status') == 'done' for record in self.sweeps.values())
+
+    @property
+    def outputs(self):
+        '''Output catalogs of the completed sweeps.'''
+        return [record['output'] for _, record in sorted(self.sweeps.items())
+                if record.get('status') == 'done' and record.get('output') is not None]
+
+    def summary(self):
+        '''Number of sweeps, rows, and total time per status.'''
+        summary = {}
+        for record in self.sweeps.values():
+            status = summary.setdefault(
+                record.get('status'), {'n_sweeps': 0, 'n_rows': 0, 'time': 0.0})
+            status['n_sweeps'] += 1
+            status['n_rows'] += record.get('n_rows') or 0
+            status['time'] += record.get('time') or 0.0
+        return summary
+
+
+def _json_params(params):
+    '''JSON form of the parameters, to compare them between runs.
+
+    Tuples become lists; the other values that JSON cannot represent are kept as the
+    digest of a mask, or as their `repr`, instead of being dropped.
+    '''
+    def _default(value):
+        if hasattr(value, 'digest'):
+            return value.digest
+        if isinstance(value, np.generic):
+            return value.item()
+        return repr(value)
+
+    return json.loads(json.dumps(params, sort_keys=True, default=_default))
+
+
+_RUN_KWARGS = {}
+
+
+def _init_run_worker(out_dir, kwargs):
+    '''Keep the output directory and the selection parameters in the worker process.'''
+    _RUN_KWARGS.update({'out_dir': shared.attach(out_dir), 'kwargs': shared.attach(kwargs)})
+
+
+def _run_one_sweep(sweep_cat, sweep_obj=None):
+    '''Process one sweep (or its catalog read ahead) and write its output; never raises.'''
+    from astropy.io import fits
+
+    start = time.time()
+    record = {'host': socket.gethostname(), 'started': start}
+    try:
+        gal_match = sweep_bright_galaxy_match(
+            sweep_cat if sweep_obj is None else sweep_obj, **_RUN_KWARGS['kwargs'])
+        n_rows = 0 if gal_match is None else len(gal_match)
+        output = None
+        if n_rows > 0:
+            output = os.path.join(
+                _RUN_KWARGS['out_dir'],
+                os.path.splitext(os.path.split(sweep_cat)[-1])[0] + '_match.fits')
+            fits.BinTableHDU(data=gal_match).writeto(output, overwrite=True)
+        record.update({'status': 'done', 'output': output, 'n_rows': n_rows})
+    except Exception as error:
+        record.update({'status': 'failed', 'output': None, 'n_rows': None,
+                       'error': "{}: {}".format(type(error).__name__, error)})
+    record['time'] = time.time() - start
+    return sweep_cat, record
+
+
+def run_batch(sweeps, out_dir, mask=None, manifest=None, shard=None, pattern='sweep-*.fits',
+              n_workers=1, retry_failed=True, shared_memory=True, read_ahead=0,
+              verbose=True, **kwargs):
+    '''Run `sweep_bright_galaxy_match` on many sweeps with a resumable manifest.
+
+    Parameters
+    ----------
+    sweeps: `list` or `string`
+        List of paths to the Sweep catalogs, or the directory that contains them.
+    out_dir: `string`
+        Directory of the output catalogs and the default manifest.
+    mask: `string` or `damascus.hsc.FDFCMask`, optional
+        Path to the FITS format Healpix mask file, or the mask object. Default: None
+    manifest: `string`, optional
+        Path to the manifest. Default: `out_dir/manifest.json`, or
+        `out_dir/manifest_i_of_N.json` for a shard.
+    shard: `string` or `tuple`, optional
+        Only process the shard `"i/N"` of the (sorted) sweeps. Default: None
+    pattern: `string`, optional
+        Pattern used to find the Sweep catalogs when `sweeps` is a directory.
+        Default: "sweep-*.fits"
+    n_workers: `int`, optional
+        Number of worker processes. Default: 1
+    retry_failed: `bool`, optional
+        Process the sweeps that failed in the previous runs again. Default: True
+    shared_memory: `bool` or `string`, optional
+        Place the mask in shared memory once and attach it in the workers without a
+        copy. A directory uses a memory-mapped file there instead. Default: True
+    read_ahead: `int`, optional
+        With one worker, read this many sweeps ahead in background threads while the
+        current one is processed. Default: 0
+    verbose: `bool`, optional
+        Announce progress. Default: True
+    **kwargs:
+        Other selection parameters passed to `sweep_bright_galaxy_match`.
+
+    Returns
+    -------
+    manifest: `BatchManifest`
+        The updated manifest.
+
+    '''
+    if isinstance(sweeps, str):
+        sweeps = io.find_files(sweeps, pattern, verbose=verbose)
+    shard = parse_shard(shard)
+    sweeps = shard_sweeps(sweeps, shard)
+
+    os.makedirs(out_dir, exist_ok=True)
+    if manifest is None:
+        manifest = os.path.join(out_dir, 'manifest.json' if shard is None else
+                                'manifest_{:d}_of_{:d}.json'.format(*shard))
+    manifest = BatchManifest(manifest)
+
+    params = {
+        'shard': None if shard is None else '{:d}/{:d}'.format(*shard),
+        'mask': mask if isinstance(mask, str) or mask is None else repr(mask),
+        'mask_identity': cache.mask_identity(mask),
+        'kwargs': _json_params(kwargs)}
+    # The records of a previous run with another mask or other parameters are stale
+    changed = [key for key in ('mask_identity', 'kwargs')
+               if manifest.params.get(key) != params[key]]
+    if manifest.sweeps and changed:
+        n_stale = manifest.invalidate()
+        if verbose:
+            print("# The {:s} changed since the previous run: {:d} sweeps are stale".format(
+                ' and '.join(changed), n_stale))
+    manifest.params = params
+
+    todo = []
+    for sweep_cat in sweeps:
+        if manifest.is_done(sweep_cat):
+            continue
+        record = manifest.sweeps.get(os.path.split(sweep_cat)[-1], {})
+        if record.get('status') == 'failed' and not retry_failed:
+            continue
+        todo.append(sweep_cat)
+    if verbose:
+        print("# {:d} sweeps in this run, {:d} already done".format(
+            len(todo), len(sweeps) - len(todo)))
+
+    manifest.save()
+    if not todo:
+        return manifest
+
+    # Read the mask only once instead of once per Sweep catalog
+    if isinstance(mask, str):
+        mask = hsc.FDFCMask.read(mask)
+    kwargs.update({'mask': mask, 'verbose': False})
+
+    n_workers = max(1, min(n_workers or os.cpu_count(), len(todo)))
+    if n_workers == 1:
+        _init_run_worker(out_dir, kwargs)
+        sweep_iter = _prefetched(todo, read_ahead, kwargs)
+        _record_results(itertools.starmap(_run_one_sweep, sweep_iter), manifest, len(todo),
+                        verbose=verbose)
+    else:
+        import multiprocessing
+        with shared.share_initargs((out_dir, kwargs), shared_memory) as initargs, \
+                multiprocessing.Pool(processes=n_workers, initializer=_init_run_worker,
+                                     initargs=initargs) as pool:
+            results = instrument.merged(pool.imap_unordered(
+                instrument.worker(_run_one_sweep), todo, chunksize=1))
+            _record_results(results, manifest, len(todo), verbose=verbose)
+
+    return manifest
+
+
+def _record_results(results, manifest, n_sweeps, verbose=True):
+    '''Save the record of each sweep to the manifest as soon as it is done.'''
+    for ii, (sweep_cat, record) in enumerate(results):
+        manifest.update(sweep_cat, **record)
+        manifest.save()
+        if verbose:
+            print("# {:d}/{:d} {:s}: {:s}, {} rows, {:.1f} s".format(
+                ii + 1, n_sweeps, os.path.split(sweep_cat)[-1], record['status'],
+                record['n_rows'], record['time']))
+
+
+def collect_outputs(manifests, output=None):
+    '''Concatenate the output catalogs listed in one or more manifests.
+
+    Parameters
+    ----------
+    manifests: `string`, `BatchManifest`, or `list`
+        Manifest(s), e.g. of all the shards.
+    output: `string`, optional
+        Path to the combined FITS catalog. Default: None
+
+    Returns
+    -------
+    matched: `astropy.io.fits.FITS_rec`
+        Combined catalog. None if there is no output.
+
+    '''
+    from astropy.io import fits
+
+    if not isinstance(manifests, (list, tuple)):
+        manifests = [manifests]
+
+    results = []
+    for manifest in manifests:
+        if isinstance(manifest, str):
+            manifest = BatchManifest(manifest)
+        for output_file in manifest.outputs:
+            with fits.open(output_file) as hdu_list:
+                results.append(io.decode_table(hdu_list[1].data))
+
+    if not results:
+        return None
+    matched = fits.BinTableHDU(data=np.concatenate(results))
+    if output is not None:
+        matched.writeto(output, overwrite=True)
+    return matched.data
@@ -0,0 +1,156 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Persistent on-disk cache of per-sweep selection results.
+
+Each entry is keyed by the identity of the sweep file (path, size, modification
+time), the selection parameters, and the identity of the mask. The results are
+stored as native `.npy` structured arrays, and the least recently used entries are
+evicted when the cache grows beyond its size limit.
+
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+__all__ = ['ResultCache', 'file_identity', 'mask_identity']
+
+CACHE_VERSION = 1
+
+
+def file_identity(path):
+    '''Identity of a file or a directory: absolute path, size, and modification time.'''
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+def mask_identity(mask):
+    '''Identity of a Healpix mask given as a path, a `FDFCMask`, or a boolean map.'''
+    if mask is None:
+        return None
+    if isinstance(mask, str):
+        return file_identity(mask)
+    if hasattr(mask, 'digest'):
+        return mask.digest
+    return hashlib.sha1(np.packbits(np.asarray(mask, dtype=bool)).tobytes()).hexdigest()
+
+
+class ResultCache(object):
+    '''Size-bounded LRU cache of selection results on disk.
+
+    Parameters
+    ----------
+    cache_dir: `string`
+        Directory of the cache.
+    max_bytes: `int`, optional
+        Maximum total size of the cache in bytes. Default: None, no limit.
+
+    Examples
+    --------
+        >>> cache = ResultCache('/scratch/damascus_cache', max_bytes=20 * 1024 ** 3)
+        >>> gal = sweep_bright_galaxy_match(sweep_cat, mask=mask, z_mag=22.5, cache=cache)
+
+    '''
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __repr__(self):
+        return "Result Cache: {:s}".format(self.cache_dir)
+
+    def key(self, sweep_cat, params, mask=None):
+        '''Key of a sweep selection.
+
+        Parameters
+        ----------
+        sweep_cat: `string`
+            Path to the Sweep catalog.
+        params: `dict`
+            Selection parameters. Must be JSON serializable.
+        mask: optional
+            The Healpix mask, see `mask_identity`.
+
+        Returns
+        -------
+        key: `string`
+            SHA1 hex digest.
+
+        '''
+        content = json.dumps(
+            {'version': CACHE_VERSION, 'sweep': file_identity(sweep_cat),
+             'params': params, 'mask': mask_identity(mask)}, sort_keys=True)
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def _path(self, key, empty=False):
+        return os.path.join(self.cache_dir, key + ('.none' if empty else '.npy'))
+
+    def get(self, key):
+        '''Get a cached result.
+
+        Returns
+        -------
+        found: `bool`
+            Whether the key is in the cache.
+        data: `np.array` or None
+            The cached result.
+
+        '''
+        for empty in (False, True):
+            path = self._path(key, empty=empty)
+            try:
+                data = None if empty else np.load(path)
+                # Mark the entry as recently used
+                os.utime(path)
+                return True, data
+            except (FileNotFoundError, ValueError, OSError):
+                continue
+        return False, None
+
+    def put(self, key, data):
+        '''Store a result. `None` is stored as an empty marker file.'''
+        path = self._path(key, empty=data is None)
+        tmp_path = path + '.{:d}.tmp'.format(os.getpid())
+        if data is None:
+            open(tmp_path, 'wb').close()
+        else:
+            with open(tmp_path, 'wb') as tmp_file:
+                np.save(tmp_file, np.asarray(data))
+        os.replace(tmp_path, path)
+
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+
+    def evict(self, max_bytes):
+        '''Remove the least recently used entries until the cache fits in `max_bytes`.'''
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(('.npy', '.none')):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    @property
+    def size(self):
+        '''Total size of the cached results in bytes.'''
+        return sum(entry.stat().st_size for entry in os.scandir(self.cache_dir)
+                   if entry.name.endswith(('.npy', '.none')))
+
+    def clear(self):
+        '''Remove all the cached results.'''
+        self.evict(0)
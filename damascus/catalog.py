@@ -0,0 +1,614 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Survey independent catalog of objects on the sky.
+
+`Catalog` keeps the machinery shared by the catalogs of different surveys: memmapped
+FITS or columnar cache reading, column projection, the selection engine, chunked
+reading, Healpix mask filtering, and the coverage tests using the hulls of the object
+distribution. The survey adapters, e.g. `damascus.sweep.SweepCatalog` and
+`damascus.hsc.HSCCatalog`, only define their column names and survey specific tools.
+
+"""
+
+import os
+import json
+
+import numpy as np
+
+from . import io
+from . import shape
+from . import query
+from . import polygon
+from . import instrument
+
+__all__ = ['Catalog']
+
+
+class Catalog(object):
+    '''A catalog of objects stored as a FITS binary table or as a columnar cache.
+
+    Parameters
+    ----------
+    catalog: `str`
+        Path to the FITS format catalog, or to its columnar cache made by
+        `damascus.io.fits_to_columnar`.
+    read_in: `bool`, optional
+        Read in the catalog immediately. Default: False
+    columns: `list`, optional
+        Only read these columns into `data`. The RA & Dec columns are always included.
+        The other columns can still be read on demand using `get_column`.
+        Default: None, use all the columns.
+    cache_dir: `str`, optional
+        Directory of the columnar cache. If the current version of the catalog has been
+        converted there, it is read from the cache instead of the FITS file.
+        Default: None
+    ra: `str`, optional
+        Name of the RA column. Default: "RA"
+    dec: `str`, optional
+        Name of the Dec column. Default: "DEC"
+    hdu: `int`, optional
+        Index of the FITS extension of the table. Default: 1
+    hull_dir: `str`, optional
+        Directory where the convex and concave hulls are persisted, so they are only
+        computed once per catalog. Default: None, only keep them in memory.
+
+    Notes
+    -----
+        - Will try to read the catalog using `astropy.fits` in `memap=True` mode, or
+          memory-map the `.npy` files of the columnar cache.
+        - The column names are case insensitive, e.g. `get_column('ra')` works for a
+          catalog with a `RA` column.
+
+    '''
+    def __init__(self, catalog, read_in=False, columns=None, cache_dir=None, ra='RA',
+                 dec='DEC', hdu=1, hull_dir=None):
+        catalog = os.path.normpath(catalog)
+        if cache_dir is not None:
+            table_dir = os.path.join(
+                cache_dir, os.path.splitext(os.path.split(catalog)[-1])[0])
+            # A cache made from an older version of the catalog is not used
+            if io.columnar_is_current(table_dir, catalog):
+                catalog = table_dir
+
+        self._catalog_path = catalog
+        self._catalog_name = os.path.split(catalog)[-1]
+        self._columnar = os.path.isdir(catalog)
+        self._hdu = hdu
+        self.hull_dir = hull_dir
+
+        assert os.path.exists(catalog), FileNotFoundError("Cannot find the catalog!")
+
+        # Open the FITS file or the columnar cache
+        self._hdu_list = self.open()
+        self.header = self._source.header if self._columnar else self._hdu_list[hdu].header
+        self._columns = self._get_columns()
+        self._column_map = {col.upper(): col for col in self._columns}
+        self.ra_col, self.dec_col = self._column_name(ra), self._column_name(dec)
+        self._use_columns = self._get_use_columns(columns)
+
+        # Read the catalog data.
+        self.data = None
+        self.obj_ra_range = None
+        self.obj_dec_range = None
+        if read_in:
+            self.load()
+
+        # Placeholder for selected objects
+        self.data_use = None
+        self.obj_concave = None
+        self.obj_convex = None
+        self._hulls = None
+        self._hull_indexes = {}
+
+    def __repr__(self):
+        return "Catalog: {0._catalog_name:s}".format(self)
+
+    def open(self):
+        ''' Open the FITS file as a HUDList, or the columnar cache as a `ColumnarTable`.
+        '''
+        with instrument.stage('catalog.open'):
+            if self._columnar:
+                return io.ColumnarTable(self._catalog_path)
+            from astropy.io import fits
+            return fits.open(self._catalog_path, memmap=True)
+
+    @property
+    def _source(self):
+        ''' The table on disk: memmapped `FITS_rec` or `ColumnarTable`.
+        '''
+        if self._columnar:
+            return self._hdu_list
+        return self._hdu_list[self._hdu].data
+
+    def load(self, in_memory=False):
+        ''' Read in the FITS catalog as FITS record.
+
+        When a column projection is used, only these columns are decoded and kept
+        in memory as a structured array. With `in_memory=True`, the whole catalog is
+        also read into memory now instead of being paged in from the memmapped file,
+        e.g. to read it ahead in a background thread.
+        '''
+        with instrument.stage('catalog.load') as timer:
+            if self._use_columns is None and not in_memory:
+                self.data = self._source
+            else:
+                self.data = query.project(
+                    self._source, self._use_columns or self._columns)
+                timer.n_bytes = self.data.nbytes
+            timer.rows_out = len(self.data)
+        self.obj_ra_range = [self.data[self.ra_col].min(), self.data[self.ra_col].max()]
+        self.obj_dec_range = [self.data[self.dec_col].min(), self.data[self.dec_col].max()]
+
+    def close(self):
+        ''' Close the HDUList of the FITS file or the columnar cache.
+        '''
+        self._hdu_list.close()
+
+    def _get_columns(self):
+        ''' Get the columns names of the catalog.
+        '''
+        if self._columnar:
+            return list(self._source.names)
+        cards = np.asarray(self.header.cards)[:, 0]
+        return [self.header[key] for key in cards[
+            np.asarray(['TTYPE' in card for card in cards])]]
+
+    def _column_name(self, col):
+        ''' Actual name of a column, the match is case insensitive.
+        '''
+        name = self._column_map.get(col.upper().strip())
+        if name is None:
+            raise KeyError("Wrong column name: {:s}".format(col))
+        return name
+
+    def _get_use_columns(self, columns):
+        ''' Normalize the column projection and make sure RA & Dec are included.
+        '''
+        if columns is None:
+            return None
+        use_columns = [self.ra_col, self.dec_col] + [
+            self._column_name(col) for col in columns]
+        return list(dict.fromkeys(use_columns))
+
+    def get_column(self, col):
+        ''' Get one column of the catalog, reading it from the file if it is not loaded.
+
+        Parameters
+        ----------
+        col: `string`
+            Name of the column.
+
+        Returns
+        -------
+        values: `np.array`
+            Values of the column for all the objects in the catalog.
+
+        '''
+        col = self._column_name(col)
+        if self.data is None:
+            self.load()
+        names = self.data.dtype.names if isinstance(self.data, np.ndarray) else (
+            self.data.names)
+        if col in names:
+            return self.data[col]
+        with instrument.stage('catalog.get_column') as timer:
+            values = self._source[col]
+            timer.n_bytes = values.nbytes
+        return values
+
+    def has_column(self, col):
+        ''' Check whether the catalog has certain column.
+
+        Parameters
+        ----------
+        col: `string`
+            Name of the column to check.
+
+        Returns
+        -------
+        has_column: `bool`
+            Whether the column is in the catalog or not.
+
+        '''
+        return col.upper().strip() in self._column_map
+
+    def select(self, col, oper, value, update=True, verbose=False, only_mask=False,
+               only_number=False):
+        ''' Select a sub-sample of objects according to certain rule.
+
+        Parameters
+        ----------
+        col: `string`
+            Name of the column used for selection.
+        oper: `string`
+            String representation of the operator. Allowed ones include
+            `[">", "<", ">=", "<=", "==", "!=']`
+        value:
+            Selection criteria.
+        verbose: `boolen`, optional
+            Show the number of selected objectss. Default: False
+        only_number: `boolen`, optional
+            Only return the number of selected objects.
+        only_number: `boolen`, optional
+            Only return the object mask.
+        update: `boolen`, optional
+            If `True`, will update the `data_use` attribute in new selection.
+            Otherwise will start again from the original `data`.
+
+        Note
+        ----
+            Will update the `self.data_use` attribute when `only_number=False`.
+
+        '''
+        # Check to make sure the column is available
+        col = self._column_name(col)
+
+        opers_dict = query.OPERATORS
+        with instrument.stage('catalog.select') as timer:
+            if self.data_use is None or not update:
+                mask = opers_dict[oper.strip()](self.get_column(col), value)
+            else:
+                if col not in self.data_use.dtype.names:
+                    raise KeyError("Column {:s} is not in the projected data".format(col))
+                mask = opers_dict[oper.strip()](self.data_use[col], value)
+            timer.rows_in = len(mask)
+
+        if only_mask:
+            return mask
+
+        if verbose:
+            print("{:s} {:s} {:s} selects {:d} objects".format(col, oper, str(value), mask.sum()))
+        if only_number:
+            return mask.sum()
+
+        # Boolean indexing already returns a copy of the selected rows
+        with instrument.stage('catalog.select_copy', rows_in=len(mask)) as timer:
+            if self.data_use is None or not update:
+                self.data_use = self.data[mask]
+            else:
+                self.data_use = self.data_use[mask]
+            timer.rows_out = len(self.data_use)
+
+    def col(self, col):
+        ''' Refer to a column of the catalog in a query, e.g. `cat.col('TYPE') != 'PSF'`.
+        '''
+        return query.col(self._column_name(col))
+
+    def where(self, *predicates):
+        ''' Build a lazy compound selection on the catalog.
+
+        Parameters
+        ----------
+        predicates: `damascus.query.Predicate` or `tuple`
+            Selection rules, either built from `col`, e.g. `cat.col('TYPE') != 'PSF'`,
+            or as `(col, oper, value)` tuples.
+
+        Returns
+        -------
+        query: `damascus.query.Query`
+            The query object. Use `mask()`, `count()`, or `fetch(columns=...)` to
+            evaluate it. Only the referenced columns are read, the masks are combined
+            once, and only the surviving rows are materialized.
+
+        '''
+        if self.data is None:
+            self.load()
+        rules = self._rules(predicates)
+        if self._use_columns is None:
+            return query.Query(self.data, rules)
+        return query.Query(_ProjectedTable(self), rules)
+
+    def _rules(self, predicates):
+        ''' Selection rules with the actual column names.
+        '''
+        rules = []
+        for rule in predicates:
+            rule = query.as_predicate(rule)
+            rules.append(query.Predicate(self._column_name(rule.column), rule.oper, rule.value))
+        return rules
+
+    def cover(self, ra, dec, in_convex=False, in_concave=False):
+        ''' Find out is the object covered or how many objects are covered by the catalog.
+
+        Parameters
+        ----------
+        ra: `float` or `np.array`
+            RA of the object or array of RA of the sample.
+        dec: `float` or `np.array`
+            Dec of the object or array of Dec of the sample.
+        in_convex: `boolen`,  optional
+            Use the convex hull of the actually object distribution.
+            Default: False
+        in_concave: `boolen`, optional
+            Use the concave hull of the actually object distribution.
+            Default: False
+
+        Returns
+        -------
+        result: `bool`
+             Whether the object is covered, or a boolen mask for overlapped objects.
+
+        Notes
+        -----
+            Without a hull, the range of RA & Dec of the objects is used.
+
+        '''
+        if not np.isscalar(ra):
+            assert len(ra) == len(dec), "RA & Dec array should have the same size."
+
+        if in_convex and in_concave:
+            raise Exception("You should only set either in_concave or in_convex = True")
+        if in_convex:
+            if self.obj_convex is None:
+                self.convex_hull()
+            return self._hull_index('convex', self.obj_convex).contains(ra, dec)
+        if in_concave:
+            if self.obj_concave is None:
+                self.concave_hull()
+            return self._hull_index('concave', self.obj_concave).contains(ra, dec)
+
+        if self.data is None:
+            self.load()
+        return ((ra >= self.obj_ra_range[0]) & (ra <= self.obj_ra_range[1]) &
+                (dec >= self.obj_dec_range[0]) & (dec <= self.obj_dec_range[1]))
+
+    def _hull_index(self, kind, hull):
+        '''Polygon index of the hull, only rebuilt when the hull changes.
+        '''
+        cached = self._hull_indexes.get(kind)
+        if cached is None or cached[0] is not hull:
+            cached = (hull, polygon.PolygonIndex(hull))
+            self._hull_indexes[kind] = cached
+        return cached[1]
+
+    def iter_chunks(self, chunk_rows=1000000, columns=None):
+        ''' Iterate over the rows of the catalog in blocks of bounded size.
+
+        Parameters
+        ----------
+        chunk_rows: `int`, optional
+            Number of rows in each block. Default: 1000000
+        columns: `list`, optional
+            Columns to read. Default: None, use the column projection of the catalog
+            or all the columns.
+
+        Yields
+        ------
+        chunk: `np.array`
+            Structured array of the rows in the block.
+
+        Notes
+        -----
+            The blocks are read from the memmapped FITS file (or the columnar cache)
+            without loading the whole catalog.
+
+        '''
+        if columns is None:
+            columns = self._columns if self._use_columns is None else self._use_columns
+        else:
+            columns = [self._column_name(col) for col in columns]
+
+        source = self._source
+        for start in range(0, len(source), chunk_rows):
+            stop = min(start + chunk_rows, len(source))
+            with instrument.stage('catalog.read_chunk', rows_in=stop - start) as timer:
+                if self._columnar:
+                    chunk = query.project(source, columns, mask=slice(start, stop))
+                else:
+                    chunk = query.project(source[start:stop], columns)
+                timer.n_bytes = chunk.nbytes
+            yield chunk
+
+    def iter_select(self, *predicates, mask=None, nest=True, columns=None,
+                    chunk_rows=1000000):
+        ''' Apply the selection (and Healpix mask) to the catalog block by block.
+
+        Parameters
+        ----------
+        predicates: `damascus.query.Predicate` or `tuple`
+            Selection rules, see `where`.
+        mask: `string` or `damascus.hsc.FDFCMask`, optional
+            Path to the FITS format Healpix mask file, or the mask object.
+        nest: bool, optional
+            If True, assume NESTED pixel ordering, otherwise, RING pixel ordering.
+            Default: True
+        columns: `list`, optional
+            Columns to read. Default: None, use the column projection of the catalog
+            or all the columns.
+        chunk_rows: `int`, optional
+            Number of rows in each block. Default: 1000000
+
+        Yields
+        ------
+        selected: `np.array`
+            Structured array of the selected rows in each non-empty block.
+
+        '''
+        from . import hsc
+
+        rules = self._rules(predicates)
+        if isinstance(mask, str):
+            mask = hsc.FDFCMask.read(mask, nest=nest)
+
+        for chunk in self.iter_chunks(chunk_rows=chunk_rows, columns=columns):
+            with instrument.stage('catalog.chunk_select', rows_in=len(chunk)) as timer:
+                selected = query.Query(chunk, rules).fetch()
+                timer.rows_out = len(selected)
+            if mask is not None and len(selected) > 0:
+                selected = hsc.filter_hsc_fdfc_mask(
+                    selected, mask, ra=self.ra_col, dec=self.dec_col, nest=nest)
+            if selected is not None and len(selected) > 0:
+                yield selected
+
+    def healpix_mask(self, mask_file, nest=True, chunk_rows=None, verbose=False):
+        '''Match the catalog to a Healpix mask.
+
+        Parameters
+        ----------
+        mask_file: `string`, `damascus.hsc.FDFCMask`, or `damascus.moc.MOC`
+            Path to the FITS format Healpix mask file, or the mask object.
+
+        Returns
+        -------
+        matched: `np.recarray`
+            Numpy array for the matched objects.
+        nest: bool, optional
+            If True, assume NESTED pixel ordering, otherwise, RING pixel ordering.
+            Default: True
+        chunk_rows: `int`, optional
+            When there is no selection yet, go through the catalog in blocks of this
+            many rows instead of loading it. Default: None
+        verbose: bool, optional
+            Annouce progress. Default: False
+
+        '''
+        from . import hsc
+
+        if self.data_use is None and chunk_rows is not None:
+            chunks = list(self.iter_select(mask=mask_file, nest=nest, chunk_rows=chunk_rows))
+            if verbose:
+                print("# Find {:d} objects inside the FDFC region".format(
+                    sum(len(chunk) for chunk in chunks)))
+            return np.concatenate(chunks) if chunks else None
+        if self.data is None:
+            self.load()
+        return hsc.filter_hsc_fdfc_mask(
+            self.data if self.data_use is None else self.data_use, mask_file,
+            ra=self.ra_col, dec=self.dec_col, nest=nest, verbose=verbose)
+
+    def _points(self, index=None):
+        ''' RA, Dec of all (or some of) the objects as an array of shape (n,2).
+        '''
+        if self.data is None:
+            self.load()
+        ra, dec = self.data[self.ra_col], self.data[self.dec_col]
+        if index is not None:
+            ra, dec = ra[index], dec[index]
+        return np.vstack([ra, dec]).T
+
+    @property
+    def _hull_file(self):
+        ''' Path to the persisted hulls of the catalog.
+        '''
+        if self.hull_dir is None:
+            return None
+        stem = os.path.splitext(self._catalog_name)[0]
+        return os.path.join(self.hull_dir, stem + '_hulls.npz')
+
+    def _source_identity(self):
+        ''' Size and modification time of the catalog file, used to validate the hulls.
+        '''
+        stat = os.stat(self._catalog_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _get_hulls(self):
+        ''' Memoized hulls, read from the hull file when it is still valid.
+        '''
+        if self._hulls is None:
+            self._hulls = {}
+            hull_file = self._hull_file
+            if hull_file is not None and os.path.isfile(hull_file):
+                with np.load(hull_file) as hulls:
+                    identity = json.loads(str(hulls['identity']))
+                    if identity == self._source_identity():
+                        self._hulls = {key: hulls[key] for key in hulls.files
+                                       if key != 'identity'}
+        return self._hulls
+
+    def _save_hull(self, key, hull):
+        ''' Memoize a hull, and persist all the hulls if `hull_dir` is set.
+        '''
+        hulls = self._get_hulls()
+        hulls[key] = hull
+        hull_file = self._hull_file
+        if hull_file is not None:
+            os.makedirs(self.hull_dir, exist_ok=True)
+            tmp_file = hull_file + '.{:d}.tmp.npz'.format(os.getpid())
+            np.savez(tmp_file, identity=json.dumps(self._source_identity()), **hulls)
+            os.replace(tmp_file, hull_file)
+
+    def convex_hull(self, refresh=False):
+        '''Get the convex hull of the object distribution.
+
+        The hull is computed once and memoized; use `refresh=True` to recompute it.
+        '''
+        hull = None if refresh else self._get_hulls().get('convex')
+        if hull is None:
+            hull = shape.convex_hull(self._points())
+            self._save_hull('convex', hull)
+        self.obj_convex = hull
+        return self.obj_convex
+
+    def concave_hull(self, alpha=0.1, n_samples=10000, seed=42, refresh=False):
+        '''Get the concave hull of the object distribution.
+
+        When there are more than `n_samples` objects, the hull is built from a random
+        sub-sample drawn (without replacement) with the given `seed`. The hull of each
+        set of parameters is computed once and memoized; use `refresh=True` to
+        recompute it. With `seed=None` the sub-sample is different at each call, so
+        the hull is neither memoized nor saved.
+
+        Note
+        ----
+            This is not perfect yet. Since we need to use random points, the
+            accuracy is not always great.
+
+        '''
+        key = None if seed is None else 'concave_{}_{:d}_{}'.format(alpha, n_samples, seed)
+        hull = None if refresh or key is None else self._get_hulls().get(key)
+        if hull is None:
+            n_obj = len(self.data) if self.data is not None else self.n_objects
+            if n_obj <= n_samples:
+                points_use = self._points()
+            else:
+                index = np.random.default_rng(seed).choice(n_obj, n_samples, replace=False)
+                points_use = self._points(index=np.sort(index))
+            hull = shape.concave_hull(points_use, alpha=alpha)
+            if key is not None:
+                self._save_hull(key, hull)
+        self.obj_concave = hull
+        return self.obj_concave
+
+    @property
+    def path(self):
+        '''Path to the catalog.
+        '''
+        return self._catalog_path
+
+    @property
+    def name(self):
+        '''Get the file name of the catalog.
+        '''
+        return self._catalog_name
+
+    @property
+    def columns(self):
+        '''Get the list of column names of the catalog.
+        '''
+        return self._columns
+
+    @property
+    def use_columns(self):
+        '''Get the list of projected column names, or None if all columns are used.
+        '''
+        return self._use_columns
+
+    @property
+    def n_objects(self):
+        '''Number of objects in the catalog.
+        '''
+        return len(self._source)
+
+
+class _ProjectedTable(object):
+    '''Projected data of a `Catalog` that reads other columns on demand.'''
+    def __init__(self, catalog):
+        self._catalog = catalog
+
+    def __len__(self):
+        return len(self._catalog.data)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._catalog.get_column(key)
+        return self._catalog.data[key]
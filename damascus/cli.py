@@ -0,0 +1,347 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Command-line interface of `damascus`.
+
+Examples
+--------
+    $ damascus sweep-select --sweeps /global/dr8/sweep --overlap s19a \\
+        --mask s19a_fdfc_hp_contarea.fits --g-mag 24 --workers 16 --out dr8_s19a.fits
+    $ damascus sweep-select --sweeps /global/dr8/sweep --mask s19a.fits \\
+        --out-dir dr8_s19a --shard 3/8
+    $ damascus fdfc-filter --catalog hsc.fits --mask s19a.fits --ra ra --dec dec \\
+        --out hsc_fdfc.fits
+    $ damascus overlap --sweeps /global/dr8/sweep --mask s19a.fits
+    $ damascus stats --sweeps /global/dr8/sweep --mask s19a.fits --workers 16 \\
+        --out dr8_s19a_stats.json
+
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+__all__ = ['main']
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def _optional_float(value):
+    '''Float argument that can be disabled with "none".'''
+    return None if value.lower() == 'none' else float(value)
+
+
+def _overlap_list(overlap):
+    '''Read a list of sweep names; short names refer to the lists shipped with damascus.
+
+    For example, "s19a" is `data/decals/dr8/decals_dr8_sweep_s19a_overlap.pkl`, and
+    "dr9sv/s18a" is `data/decals/dr9sv/decals_dr9sv_sweep_s18a_overlap.pkl`.
+    '''
+    from . import io
+
+    if not os.path.isfile(overlap):
+        release, footprint = overlap.split('/') if '/' in overlap else ('dr8', overlap)
+        overlap = os.path.join(
+            DATA_DIR, 'decals', release,
+            'decals_{:s}_sweep_{:s}_overlap.pkl'.format(release, footprint))
+    if overlap.endswith('.pkl'):
+        return [str(name) for name in io.read_from_pickle(overlap)]
+    with open(overlap, 'r') as list_file:
+        return [line.strip() for line in list_file if line.strip()]
+
+
+def _resolve_sweeps(sweeps, pattern='sweep-*.fits', overlap=None, verbose=True):
+    '''List of sweep catalogs from directories, lists (.list or .pkl), and/or files,
+    optionally filtered by an overlap list.'''
+    from . import io
+
+    sweep_list = []
+    for sweep in sweeps:
+        if os.path.isdir(sweep):
+            sweep_list += io.find_files(sweep, pattern, verbose=verbose)
+        elif sweep.endswith(('.list', '.pkl')):
+            sweep_list += _overlap_list(sweep)
+        else:
+            sweep_list.append(sweep)
+
+    if overlap is not None:
+        names = set(_overlap_list(overlap))
+        sweep_list = [sweep for sweep in sweep_list if os.path.split(sweep)[-1] in names]
+
+    return sorted(set(sweep_list))
+
+
+def _count_rows(sweeps):
+    '''Total number of rows in the sweeps, read from the FITS headers.'''
+    from astropy.io import fits
+
+    n_rows = 0
+    for sweep in sweeps:
+        try:
+            n_rows += fits.getval(sweep, 'NAXIS2', ext=1)
+        except (OSError, KeyError, IndexError):
+            continue
+    return n_rows
+
+
+def _report_throughput(n_sweeps, n_rows_in, n_rows_out, elapsed):
+    '''Print the processing throughput.'''
+    elapsed = max(elapsed, 1e-9)
+    print("# Processed {:d} sweeps ({:d} rows) in {:.1f} s".format(
+        n_sweeps, n_rows_in, elapsed))
+    print("# Throughput: {:.2f} sweeps/s, {:.0f} rows/s; {:d} objects selected".format(
+        n_sweeps / elapsed, n_rows_in / elapsed, n_rows_out))
+
+
+def _sweep_select(args):
+    '''Run the `sweep-select` command.'''
+    from . import batch
+    from . import sweep
+
+    verbose = not args.quiet
+    sweeps = _resolve_sweeps(args.sweeps, pattern=args.pattern, overlap=args.overlap,
+                             verbose=verbose)
+    if not sweeps:
+        print("# No sweep catalog to process!")
+        return 1
+
+    mask = args.mask
+    if mask is not None and args.sparse:
+        from .sparse import SparseHealpixMask
+        mask = SparseHealpixMask.read(mask)
+
+    kwargs = {'no_dup': not args.keep_dup, 'no_rex': args.no_rex,
+              'g_mag': args.g_mag, 'r_mag': args.r_mag, 'z_mag': args.z_mag,
+              'columns': args.columns, 'cache_dir': args.columnar_cache,
+              'chunk_rows': args.chunk_rows, 'read_ahead': args.read_ahead}
+    if args.cache is not None:
+        from .cache import ResultCache
+        max_bytes = None if args.cache_size is None else int(args.cache_size * 1024 ** 3)
+        kwargs['cache'] = ResultCache(args.cache, max_bytes=max_bytes)
+
+    start = time.time()
+    if args.out_dir is not None or args.shard is not None:
+        out_dir = args.out_dir if args.out_dir is not None else '.'
+        manifest = batch.run_batch(
+            sweeps, out_dir, mask=mask, manifest=args.manifest, shard=args.shard,
+            n_workers=args.workers, verbose=verbose, **kwargs)
+        processed = batch.shard_sweeps(sweeps, args.shard)
+        n_rows_out = sum(record.get('n_rows') or 0 for record in manifest.sweeps.values())
+        if args.out is not None:
+            batch.collect_outputs(manifest, output=args.out)
+        n_failed = manifest.summary().get('failed', {}).get('n_sweeps', 0)
+    else:
+        matched = sweep.batch_sweep_bright_galaxy_match(
+            sweeps, mask=mask, n_workers=args.workers, output=args.out,
+            verbose=verbose, **kwargs)
+        processed = sweeps
+        n_rows_out = 0 if matched is None else len(matched)
+        n_failed = 0
+
+    if verbose:
+        _report_throughput(len(processed), _count_rows(processed), n_rows_out,
+                           time.time() - start)
+    return 1 if n_failed else 0
+
+
+def _fdfc_filter(args):
+    '''Run the `fdfc-filter` command.'''
+    from astropy.io import fits
+
+    from . import hsc
+
+    start = time.time()
+    if args.sparse:
+        from .sparse import SparseHealpixMask
+        mask = SparseHealpixMask.read(args.mask, cache=args.mask_cache)
+    else:
+        mask = hsc.FDFCMask.read(args.mask, nest=not args.ring, cache=args.mask_cache)
+    with fits.open(args.catalog, memmap=True) as hdu_list:
+        catalog = hdu_list[1].data
+        matched = hsc.filter_hsc_fdfc_mask(
+            catalog, mask, ra=args.ra, dec=args.dec, verbose=not args.quiet)
+        n_rows_in = len(catalog)
+        if matched is None:
+            matched = catalog[:0]
+        fits.BinTableHDU(data=matched).writeto(args.out, overwrite=True)
+        n_rows_out = len(matched)
+
+    if not args.quiet:
+        _report_throughput(1, n_rows_in, n_rows_out, time.time() - start)
+    return 0
+
+
+def _overlap(args):
+    '''Run the `overlap` command.'''
+    from . import io
+    from .index import SweepIndex
+
+    sweeps = _resolve_sweeps(args.sweeps, pattern=args.pattern, verbose=False)
+    index = SweepIndex(sweeps)
+    if args.mask is not None:
+        overlap = index.overlap_healpix(args.mask, nest=not args.ring)
+    elif args.polygons is not None:
+        polygons = io.read_from_pickle(args.polygons) if args.polygons.endswith('.pkl') else (
+            np.load(args.polygons, allow_pickle=True).item())
+        overlap = index.overlap_polygon(polygons)
+    else:
+        print("# Please provide either --mask or --polygons")
+        return 1
+
+    if args.out is not None:
+        with open(args.out, 'w') as list_file:
+            list_file.write('\n'.join(os.path.split(sweep)[-1] for sweep in overlap) + '\n')
+    else:
+        print('\n'.join(overlap))
+    return 0
+
+
+def _stats(args):
+    '''Run the `stats` command.'''
+    from . import stats
+
+    verbose = not args.quiet
+    sweeps = _resolve_sweeps(args.sweeps, pattern=args.pattern, overlap=args.overlap,
+                             verbose=verbose)
+    if not sweeps:
+        print("# No sweep catalog to process!")
+        return 1
+
+    start = time.time()
+    summary = stats.batch_sweep_stats(
+        sweeps, mask=args.mask, n_workers=args.workers, chunk_rows=args.chunk_rows,
+        by=None if args.by.lower() == 'none' else args.by, columns=args.columns,
+        verbose=verbose)
+    if args.out is not None:
+        summary.save(args.out)
+    if verbose:
+        summary.report()
+        _report_throughput(len(sweeps), _count_rows(sweeps), summary.n_objects,
+                           time.time() - start)
+    return 0
+
+
+def _build_parser():
+    '''Command line argument parser.'''
+    parser = argparse.ArgumentParser(
+        prog='damascus', description='DECaLS sweep selection and HSC footprint tools.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Report the time spent in each stage of the pipeline. The '
+                             'times are summed over the worker processes, so they can be '
+                             'larger than the wall time.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    # sweep-select
+    select = subparsers.add_parser(
+        'sweep-select', help='Select bright extended galaxies from sweep catalogs.')
+    select.add_argument('--sweeps', nargs='+', required=True,
+                        help='Directories and/or paths of the sweep catalogs.')
+    select.add_argument('--pattern', default='sweep-*.fits',
+                        help='Pattern of the sweep catalogs in the directories.')
+    select.add_argument('--overlap', default=None,
+                        help='Only use the sweeps in this list (.list or .pkl), or the '
+                             'name of a shipped overlap list, e.g. "s19a" or "dr9sv/s18a".')
+    select.add_argument('--mask', default=None, help='Healpix mask (FITS or .npz cache).')
+    select.add_argument('--sparse', action='store_true',
+                        help='Keep the mask sparse, for high-NSIDE masks.')
+    select.add_argument('--g-mag', type=_optional_float, default=24.0,
+                        help='g-band magnitude limit, or "none". Default: 24.0')
+    select.add_argument('--r-mag', type=_optional_float, default=23.0,
+                        help='r-band magnitude limit, or "none". Default: 23.0')
+    select.add_argument('--z-mag', type=_optional_float, default=23.0,
+                        help='z-band magnitude limit, or "none". Default: 23.0')
+    select.add_argument('--keep-dup', action='store_true', help='Keep the DUP objects.')
+    select.add_argument('--no-rex', action='store_true', help='Remove the REX objects.')
+    select.add_argument('--columns', nargs='+', default=None,
+                        help='Only read and output these columns.')
+    select.add_argument('--chunk-rows', type=int, default=None,
+                        help='Process each sweep in blocks of this many rows.')
+    select.add_argument('--columnar-cache', default=None,
+                        help='Directory of the columnar cache of the sweeps.')
+    select.add_argument('--cache', default=None, help='Directory of the result cache.')
+    select.add_argument('--cache-size', type=float, default=None,
+                        help='Maximum size of the result cache in GB.')
+    select.add_argument('--workers', type=int, default=1, help='Number of processes.')
+    select.add_argument('--read-ahead', type=int, default=0,
+                        help='With one worker, read this many sweeps ahead in the background.')
+    select.add_argument('--out', default=None, help='Output FITS catalog.')
+    select.add_argument('--out-dir', default=None,
+                        help='Write one catalog per sweep and a resumable manifest here.')
+    select.add_argument('--manifest', default=None, help='Path to the manifest.')
+    select.add_argument('--shard', default=None,
+                        help='Only process the shard i/N of the sweeps (resumable mode).')
+    select.add_argument('--quiet', action='store_true', help='Do not report progress.')
+    select.set_defaults(func=_sweep_select)
+
+    # fdfc-filter
+    fdfc = subparsers.add_parser(
+        'fdfc-filter', help='Filter a FITS catalog through a Healpix mask.')
+    fdfc.add_argument('--catalog', required=True, help='Input FITS catalog.')
+    fdfc.add_argument('--mask', required=True, help='Healpix mask (FITS or .npz cache).')
+    fdfc.add_argument('--mask-cache', default=None, help='.npz cache of the mask.')
+    fdfc.add_argument('--ring', action='store_true', help='Use RING pixel ordering.')
+    fdfc.add_argument('--sparse', action='store_true',
+                      help='Keep the mask sparse, for high-NSIDE masks.')
+    fdfc.add_argument('--ra', default='RA', help='Column name for RA. Default: RA')
+    fdfc.add_argument('--dec', default='DEC', help='Column name for Dec. Default: DEC')
+    fdfc.add_argument('--out', required=True, help='Output FITS catalog.')
+    fdfc.add_argument('--quiet', action='store_true', help='Do not report progress.')
+    fdfc.set_defaults(func=_fdfc_filter)
+
+    # overlap
+    overlap = subparsers.add_parser(
+        'overlap', help='List the sweeps that overlap a Healpix mask or polygons.')
+    overlap.add_argument('--sweeps', nargs='+', required=True,
+                         help='Directories, paths, or names of the sweep catalogs.')
+    overlap.add_argument('--pattern', default='sweep-*.fits',
+                         help='Pattern of the sweep catalogs in the directories.')
+    overlap.add_argument('--mask', default=None, help='Healpix mask (FITS or .npz cache).')
+    overlap.add_argument('--ring', action='store_true', help='Use RING pixel ordering.')
+    overlap.add_argument('--polygons', default=None,
+                         help='Polygons in .pkl or .npy format, e.g. s19a_fdfc_poly.pkl.')
+    overlap.add_argument('--out', default=None, help='Output list of sweeps.')
+    overlap.set_defaults(func=_overlap)
+
+    # stats
+    summary = subparsers.add_parser(
+        'stats', help='Object counts and magnitude statistics of the sweep catalogs.')
+    summary.add_argument('--sweeps', nargs='+', required=True,
+                         help='Directories and/or paths of the sweep catalogs.')
+    summary.add_argument('--pattern', default='sweep-*.fits',
+                         help='Pattern of the sweep catalogs in the directories.')
+    summary.add_argument('--overlap', default=None,
+                         help='Only use the sweeps in this list, or a shipped overlap list.')
+    summary.add_argument('--mask', default=None,
+                         help='Only use the objects inside this Healpix mask.')
+    summary.add_argument('--by', default='TYPE',
+                         help='Group the objects by this column, or "none". Default: TYPE')
+    summary.add_argument('--columns', nargs='+', default=None,
+                         help='Flux columns to summarize. Default: FLUX_G FLUX_R FLUX_Z')
+    summary.add_argument('--chunk-rows', type=int, default=None,
+                         help='Read each sweep in blocks of this many rows.')
+    summary.add_argument('--workers', type=int, default=1, help='Number of processes.')
+    summary.add_argument('--out', default=None, help='Output JSON file of the statistics.')
+    summary.add_argument('--quiet', action='store_true', help='Do not report progress.')
+    summary.set_defaults(func=_stats)
+
+    return parser
+
+
+def main(argv=None):
+    '''Entry point of the `damascus` command.'''
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    if args.profile:
+        from . import instrument
+        with instrument.profile():
+            return args.func(args)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
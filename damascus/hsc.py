@@ -2,22 +2,207 @@
 # -*- coding: utf-8 -*-
 """Functions to deal with specific HSC data."""
 
-import numpy as np
-
-import healpy as hp
+import os
+import hashlib
 
-from astropy.io import fits
-
-from sklearn.cluster import DBSCAN
-from sklearn.neighbors import KDTree
+import numpy as np
 
 from . import io
 from . import shape
+from . import instrument
+from .catalog import Catalog
 
-__all__ = ['filter_hsc_fdfc_mask']
+__all__ = ['filter_hsc_fdfc_mask', 'FDFCMask', 'HSCCatalog', 'get_fdfc_borders',
+           'get_fdfc_polygons']
 
 HSC_ZP = 27.0  # Zeropoint for HSC survey
 
+
+class HSCCatalog(Catalog):
+    '''A class to deal with HSC catalogs, e.g. the tables from the HSC SSP database.
+
+    It shares the memmapped reading, column projection, selection engine, chunked
+    reading, and coverage tests with `damascus.sweep.SweepCatalog`.
+
+    Parameters
+    ----------
+    catalog: `str`
+        Path to the FITS format HSC catalog, or to its columnar cache made by
+        `damascus.io.fits_to_columnar`.
+    read_in: `bool`, optional
+        Read in the catalog immediately. Default: False
+    columns: `list`, optional
+        Only read these columns into `data`. Default: None, use all the columns.
+    cache_dir: `str`, optional
+        Directory of the columnar cache. Default: None
+    ra: `str`, optional
+        Name of the RA column. Default: "ra"
+    dec: `str`, optional
+        Name of the Dec column. Default: "dec"
+    hdu: `int`, optional
+        Index of the FITS extension of the table. Default: 1
+    hull_dir: `str`, optional
+        Directory where the hulls of the object distribution are persisted.
+        Default: None
+
+    Examples
+    --------
+        >>> hsc_cat = HSCCatalog('s19a_wide_gama15.fits', columns=['object_id', 'i_cmodel_mag'])
+        >>> bright = hsc_cat.where(hsc_cat.col('i_cmodel_mag') < 22.0).fetch()
+        >>> fdfc = hsc_cat.filter_fdfc('s19a_fdfc_hp_contarea.fits')
+
+    '''
+    zeropoint = HSC_ZP
+
+    def __init__(self, catalog, read_in=False, columns=None, cache_dir=None, ra='ra',
+                 dec='dec', hdu=1, hull_dir=None):
+        super(HSCCatalog, self).__init__(
+            catalog, read_in=read_in, columns=columns, cache_dir=cache_dir, ra=ra,
+            dec=dec, hdu=hdu, hull_dir=hull_dir)
+
+    def __repr__(self):
+        return "HSC Catalog: {0._catalog_name:s}".format(self)
+
+    def filter_fdfc(self, fdfc_mask, nest=True, chunk_rows=None, verbose=False):
+        '''Objects (or selected objects) inside the HSC FDFC mask.
+
+        Parameters
+        ----------
+        fdfc_mask: `FDFCMask` or string
+            The mask object, or path to the mask file (FITS or `.npz` cache).
+        nest: bool, optional
+            If True, assume NESTED pixel ordering, otherwise, RING pixel ordering.
+            Default: True
+        chunk_rows: `int`, optional
+            Go through the catalog in blocks of this many rows. Default: None
+        verbose: bool, optional
+            Annouce progress. Default: False
+
+        '''
+        return self.healpix_mask(fdfc_mask, nest=nest, chunk_rows=chunk_rows, verbose=verbose)
+
+
+class FDFCMask(object):
+    '''HSC FDFC Healpix mask that answers point membership with a pixel lookup.
+
+    The mask is loaded once and kept as a dense boolean bitmap indexed by the
+    Healpix pixel, so the membership test for each object is a single `ang2pix`
+    followed by an array lookup.
+
+    Parameters
+    ----------
+    bitmap: `np.array` of `bool`
+        Full-sky Healpix map of the mask.
+    nest: bool, optional
+        If True, the map is in NESTED pixel ordering, otherwise, RING pixel ordering.
+        Default: True
+
+    Examples
+    --------
+        >>> mask = FDFCMask.read('s19a_fdfc_hp_contarea.fits', cache='s19a_fdfc.npz')
+        >>> inside = mask.contains(ra, dec)
+
+    '''
+    def __init__(self, bitmap, nest=True):
+        import healpy as hp
+
+        self.bitmap = np.asarray(bitmap, dtype=bool)
+        self.nside = hp.npix2nside(len(self.bitmap))
+        self.nest = nest
+
+    def __repr__(self):
+        return "FDFCMask: NSIDE={0.nside:d}, {0.n_pixels:d} pixels".format(self)
+
+    @classmethod
+    def read(cls, mask_file, nest=True, cache=None):
+        '''Read the mask from a FITS Healpix map or from its cached form.
+
+        Parameters
+        ----------
+        mask_file: string
+            Path to the FITS format Healpix mask, or to the `.npz` cache file.
+        nest: bool, optional
+            If True, use NESTED pixel ordering, otherwise, RING pixel ordering.
+            Default: True
+        cache: string, optional
+            Path to the `.npz` cache file. It is used when it is newer than the FITS
+            file, otherwise it is (re)written after reading the FITS file.
+            Default: None
+
+        '''
+        if mask_file.endswith('.npz'):
+            return cls.load(mask_file)
+
+        if cache is not None and os.path.isfile(cache) and (
+                os.path.getmtime(cache) >= os.path.getmtime(mask_file)):
+            mask = cls.load(cache)
+            if mask.nest == nest:
+                return mask
+
+        with instrument.stage('hsc.mask_read', n_bytes=os.path.getsize(mask_file)) as timer:
+            mask = cls(io.read_healpix_fits(mask_file, nest=nest), nest=nest)
+            timer.rows_out = mask.n_pixels
+        if cache is not None:
+            mask.save(cache)
+        return mask
+
+    @classmethod
+    def load(cls, cache_file):
+        '''Load the mask from the `.npz` cache file.'''
+        import healpy as hp
+
+        with instrument.stage('hsc.mask_load', n_bytes=os.path.getsize(cache_file)), \
+                np.load(cache_file) as cache:
+            npix = hp.nside2npix(int(cache['nside']))
+            bitmap = np.unpackbits(cache['bits'], count=npix).view(bool)
+            return cls(bitmap, nest=bool(cache['nest']))
+
+    def save(self, cache_file):
+        '''Save the mask as a bit-packed `.npz` file that loads in milliseconds.'''
+        np.savez(cache_file, bits=np.packbits(self.bitmap), nside=self.nside, nest=self.nest)
+
+    @property
+    def digest(self):
+        '''SHA1 digest of the mask content, used to identify the mask in caches.'''
+        if getattr(self, '_digest', None) is None:
+            sha1 = hashlib.sha1(np.packbits(self.bitmap).tobytes())
+            sha1.update("{:d} {:d}".format(self.nside, int(self.nest)).encode())
+            self._digest = sha1.hexdigest()
+        return self._digest
+
+    @property
+    def pixels(self):
+        '''Indices of the Healpix pixels inside the mask.'''
+        return np.flatnonzero(self.bitmap)
+
+    @property
+    def n_pixels(self):
+        '''Number of the Healpix pixels inside the mask.'''
+        return int(np.count_nonzero(self.bitmap))
+
+    def contains(self, ra, dec):
+        '''Whether the objects are inside the mask.
+
+        Parameters
+        ----------
+        ra: `float` or `np.array`
+            RA of the objects in degree.
+        dec: `float` or `np.array`
+            Dec of the objects in degree.
+
+        Returns
+        -------
+        inside: `bool` or `np.array`
+            Boolean mask of objects inside the footprint.
+
+        '''
+        import healpy as hp
+
+        with instrument.stage('hsc.ang2pix', rows_in=np.size(ra)):
+            pixels = hp.ang2pix(self.nside, ra, dec, nest=self.nest, lonlat=True)
+        return self.bitmap[pixels]
+
+
 def filter_hsc_fdfc_mask(cat, fdfc_mask, ra='RA', dec='DEC', nest=True, verbose=False):
     '''Filter a catalog through HSC FDFC mask."""
 
@@ -26,8 +211,9 @@ def filter_hsc_fdfc_mask(cat, fdfc_mask, ra='RA', dec='DEC', nest=True, verbose=
     cat: astropy.table or string
          Input catalog of objects to filter. Either the actual catalog or the path to
          the table.
-    fdfc_mask: healpy mask or string
-         Healpix mask. Either the mask itself or path to the mask file.
+    fdfc_mask: `FDFCMask`, `damascus.moc.MOC`, healpy mask or string
+         Healpix mask. Either a mask object with a `contains(ra, dec)` method, the
+         mask itself, or path to the mask file (FITS or `.npz` cache).
     ra: string, optional
          Column name for RA. Default: "RA".
     dec: string, optional
@@ -50,22 +236,24 @@ def filter_hsc_fdfc_mask(cat, fdfc_mask, ra='RA', dec='DEC', nest=True, verbose=
     '''
     # Read the fits catalog if input is path to the file
     if isinstance(cat, str):
-        cat = fits.open(cat, memmap=True)[1].data
+        cat = HSCCatalog(cat, read_in=True, ra=ra, dec=dec).data
 
     # Read the healpix mask if input is path to the file
     if isinstance(fdfc_mask, str):
-        fdfc_mask = io.read_healpix_fits(fdfc_mask, nest=nest)
+        fdfc_mask = FDFCMask.read(fdfc_mask, nest=nest)
+    elif not hasattr(fdfc_mask, 'contains'):
+        fdfc_mask = FDFCMask(fdfc_mask, nest=nest)
 
     # Find the matched objects
-    nside, hp_indices = hp.get_nside(fdfc_mask), np.where(fdfc_mask)[0]
-    phi, theta = np.radians(cat[ra]), np.radians(90. - cat[dec])
-    hp_masked = hp.ang2pix(nside, theta, phi, nest=True)
-    select = np.in1d(hp_masked, hp_indices)
+    with instrument.stage('hsc.filter', rows_in=len(cat)) as timer:
+        select = fdfc_mask.contains(cat[ra], cat[dec])
+        n_select = int(select.sum())
+        timer.rows_out = n_select
 
     if verbose:
-        print("# Find {:d} objects inside the FDFC region".format(select.sum()))
+        print("# Find {:d} objects inside the FDFC region".format(n_select))
 
-    if select.sum() < 1:
+    if n_select < 1:
         return None
     return cat[select]
 
@@ -115,9 +303,15 @@ def get_fdfc_borders(healpix_mask, nest=False, n_samples=10000,
           the points.
 
     '''
+    import healpy as hp
+    from sklearn.cluster import DBSCAN
+    from sklearn.neighbors import KDTree
+
     # Read in the healpix mask and get the NSIDE and pixel indices.
-    mask = hp.read_map(healpix_mask, nest=nest)
-    nside, hp_indices = hp.get_nside(mask), np.where(mask)[0]
+    with instrument.stage('hsc.mask_read', n_bytes=os.path.getsize(healpix_mask)) as timer:
+        mask = hp.read_map(healpix_mask, nest=nest)
+        nside, hp_indices = hp.get_nside(mask), np.where(mask)[0]
+        timer.rows_out = len(hp_indices)
 
     # Get the pixel coordinate information.
     if not use_boundary:
@@ -131,8 +325,9 @@ def get_fdfc_borders(healpix_mask, nest=False, n_samples=10000,
     mask = np.random.random(size=len(ra)) < n_samples / len(ra)
 
     # Find continous regions in (ra, dec) space
-    field = DBSCAN(eps=distance).fit_predict(
-        np.vstack((ra[mask], dec[mask])).T)
+    with instrument.stage('hsc.dbscan', rows_in=int(mask.sum())):
+        field = DBSCAN(eps=distance).fit_predict(
+            np.vstack((ra[mask], dec[mask])).T)
 
     # ID of unique fields
     field_unique = np.unique(field)
@@ -140,10 +335,11 @@ def get_fdfc_borders(healpix_mask, nest=False, n_samples=10000,
         print("# Find {:d} unique continous fields".format(len(field_unique)))
 
     # Transfer the field label to all coordinates
-    tree = KDTree(np.vstack((ra[mask], dec[mask])).T, leaf_size=2)
-    field_all = field[
-        tree.query(np.vstack((ra, dec)).T, k=1,
-                   return_distance=False).flatten()]
+    with instrument.stage('hsc.field_labels', rows_in=len(ra)):
+        tree = KDTree(np.vstack((ra[mask], dec[mask])).T, leaf_size=2)
+        field_all = field[
+            tree.query(np.vstack((ra, dec)).T, k=1,
+                       return_distance=False).flatten()]
 
     # Go through each field and get the borders.
     borders = {}
@@ -156,6 +352,133 @@ def get_fdfc_borders(healpix_mask, nest=False, n_samples=10000,
 
         borders[field_id + 1] = np.vstack(
             [ra[region][np.asarray(edges[0])[:, 0]],
-             dec[region][np.asarray(edges[0])[:, 1]]]).T
+             dec[region][np.asarray(edges[0])[:, 0]]]).T
 
     return borders
+
+def get_fdfc_polygons(healpix_mask, nest=True, min_pixels=1, verbose=True):
+    '''Get the exact outer border of each field in the FDFC region.
+
+    Different from `get_fdfc_borders`, this works directly on the Healpix pixels: the
+    fields are the connected components of the masked pixels, and the border of each
+    field is traced along the pixel edges that are not shared with another masked
+    pixel. The result is deterministic and there is no sub-sampling.
+
+    Parameters
+    ----------
+    healpix_mask: `FDFCMask`, healpy mask or string
+         Healpix mask. Either a `FDFCMask` object, the mask itself, or path to the
+         mask file.
+    nest: bool, optional
+         If True, assume NESTED pixel ordering, otherwise, RING pixel ordering.
+         Default: True
+    min_pixels: int, optional
+         Ignore fields with fewer pixels. Default: 1
+    verbose: bool, optional
+         Annouce progress. Default: True
+
+    Returns
+    -------
+    borders: dict
+        Dictionary that keeps the border coordinates of each sub-field. The fields
+        are numbered from 1 in descending order of their number of pixels.
+
+    Notes
+    -----
+        - The vertices of the border are the corners of the Healpix pixels.
+        - For a field that crosses RA=0, the RA of the border is unwrapped so the
+          polygon is continuous. Some of the RA values will be < 0 or > 360.
+        - Only the outer border of each field is returned; holes are ignored.
+
+    '''
+    import healpy as hp
+    from scipy import sparse
+    from scipy.sparse.csgraph import connected_components
+
+    if isinstance(healpix_mask, str):
+        healpix_mask = FDFCMask.read(healpix_mask, nest=nest)
+    elif not isinstance(healpix_mask, FDFCMask):
+        healpix_mask = FDFCMask(healpix_mask, nest=nest)
+    nside, nest, bitmap = healpix_mask.nside, healpix_mask.nest, healpix_mask.bitmap
+    pixels = healpix_mask.pixels
+    n_pix = len(pixels)
+
+    # The neighbours that share an edge with the pixel: SW, NW, NE, SE
+    neighbours = hp.get_all_neighbours(nside, pixels, nest=nest)[[0, 2, 4, 6]]
+    inside = (neighbours >= 0) & bitmap[np.where(neighbours >= 0, neighbours, 0)]
+
+    # Connected components of the pixel graph
+    with instrument.stage('hsc.connected_pixels', rows_in=n_pix) as timer:
+        rows = np.broadcast_to(np.arange(n_pix), neighbours.shape)[inside]
+        cols = np.searchsorted(pixels, neighbours[inside])
+        graph = sparse.coo_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, cols)), shape=(n_pix, n_pix)).tocsr()
+        timer.rows_out, labels = connected_components(graph, directed=False)
+
+    # Boundary pixels have fewer than 4 masked neighbours
+    boundary = inside.sum(axis=0) < 4
+    pix_bound, label_bound, inside_bound = (
+        pixels[boundary], labels[boundary], inside[:, boundary])
+
+    # Corners are ordered N, W, S, E. The edges N-W, W-S, S-E, E-N are shared with
+    # the NW, SW, SE, NE neighbours, and are counter-clockwise in (RA, Dec).
+    corners = np.transpose(
+        hp.boundaries(nside, pix_bound, step=1, nest=nest).reshape(-1, 3, 4),
+        (0, 2, 1)).reshape(-1, 3)
+    corner_id = _merge_vertices(corners).reshape(-1, 4)
+    edge_corners = [(0, 1, 1), (1, 2, 0), (2, 3, 3), (3, 0, 2)]
+
+    starts, ends, edge_labels = [], [], []
+    for start, end, side in edge_corners:
+        outer = ~inside_bound[side]
+        starts.append(corner_id[outer, start])
+        ends.append(corner_id[outer, end])
+        edge_labels.append(label_bound[outer])
+    edges = np.vstack([np.concatenate(starts), np.concatenate(ends)]).T
+    edge_labels = np.concatenate(edge_labels)
+
+    # Vertices of the borders
+    ra, dec = hp.vec2ang(corners, lonlat=True)
+    vertex_ra, vertex_dec = np.zeros(corner_id.max() + 1), np.zeros(corner_id.max() + 1)
+    vertex_ra[corner_id.ravel()], vertex_dec[corner_id.ravel()] = ra, dec
+
+    # Fields sorted by the number of pixels
+    field_label, field_size = np.unique(labels, return_counts=True)
+    field_label = field_label[np.argsort(-field_size, kind='stable')]
+    field_size = np.sort(field_size)[::-1]
+    if verbose:
+        print("# Find {:d} unique continous fields".format(
+            int((field_size >= min_pixels).sum())))
+
+    borders = {}
+    for field_id, (label, size) in enumerate(zip(field_label, field_size)):
+        if size < min_pixels:
+            continue
+        # The outer border encloses the holes, so it has the largest area
+        loops = [np.asarray(loop)[:, 0] for loop in
+                 shape._stitch_boundaries(edges[edge_labels == label])]
+        outer = max(loops, key=lambda loop: _loop_area(vertex_ra[loop], vertex_dec[loop]))
+        border_ra = np.degrees(np.unwrap(np.radians(vertex_ra[outer])))
+        if border_ra.min() >= 360.0:
+            border_ra -= 360.0
+        borders[field_id + 1] = np.vstack([border_ra, vertex_dec[outer]]).T
+
+    return borders
+
+def _loop_area(ra, dec):
+    '''Area enclosed by a loop in the equal-area (RA, sin Dec) projection, in steradian.'''
+    x, y = np.unwrap(np.radians(ra)), np.sin(np.radians(dec))
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+def _merge_vertices(vectors, tolerance=1e-10):
+    '''Give the same ID to the (nearly) identical unit vectors.'''
+    from scipy import sparse
+    from scipy.sparse.csgraph import connected_components
+    from scipy.spatial import cKDTree
+
+    pairs = cKDTree(vectors).query_pairs(tolerance, output_type='ndarray')
+    graph = sparse.coo_matrix(
+        (np.ones(len(pairs), dtype=bool), (pairs[:, 0], pairs[:, 1])),
+        shape=(len(vectors), len(vectors)))
+    _, vertex_id = connected_components(graph, directed=False)
+    return vertex_id
@@ -0,0 +1,253 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Spatial index of the DECaLS sweep footprints.
+
+The sweep catalogs tile the sky in rectangles of RA, Dec that are encoded in their
+file names, e.g. `sweep-150p000-160p005.fits`. `SweepIndex` is built from the file
+names alone and answers which sweeps contain a set of coordinates, or overlap a
+polygon or a Healpix mask, without opening any FITS file.
+
+"""
+
+import os
+
+import numpy as np
+
+from . import io
+from . import shape
+from .sweep import sweep_to_box
+
+__all__ = ['SweepIndex']
+
+
+class SweepIndex(object):
+    '''Index of the RA, Dec boxes covered by a list of sweep catalogs.
+
+    Parameters
+    ----------
+    sweeps: `list`
+        File names or paths of the sweep catalogs.
+
+    Examples
+    --------
+        >>> index = SweepIndex.from_list('decals_dr8_sweeps.list')
+        >>> sweep_id = index.query_points(ra, dec)
+        >>> groups = index.group_points(ra, dec)
+        >>> overlap = index.overlap_polygon(s19a_poly)
+
+    Notes
+    -----
+        The RA, Dec edges of all the boxes define a grid in which every cell belongs
+        to at most one sweep, so a point is located with two `np.searchsorted` calls.
+        As in `SweepCatalog.cover`, the boxes include their lower edges and exclude the
+        upper ones.
+
+    '''
+    def __init__(self, sweeps):
+        self.sweeps = [str(sweep) for sweep in sweeps]
+        self.boxes = np.asarray([_box_range(sweep) for sweep in self.sweeps],
+                                dtype=float).reshape(-1, 4)
+
+        # Grid made of all the box edges
+        self.ra_edges = np.unique(self.boxes[:, 0:2])
+        self.dec_edges = np.unique(self.boxes[:, 2:4])
+        self._grid = np.full(
+            (max(len(self.ra_edges) - 1, 0), max(len(self.dec_edges) - 1, 0)), -1,
+            dtype=np.int64)
+        for ii, (ra_min, ra_max, dec_min, dec_max) in enumerate(self.boxes):
+            i0, i1 = np.searchsorted(self.ra_edges, [ra_min, ra_max])
+            j0, j1 = np.searchsorted(self.dec_edges, [dec_min, dec_max])
+            self._grid[i0:i1, j0:j1] = ii
+
+    def __repr__(self):
+        return "Sweep Index: {:d} sweeps".format(len(self))
+
+    def __len__(self):
+        return len(self.sweeps)
+
+    @classmethod
+    def from_directory(cls, loc, pattern='sweep-*.fits', verbose=False):
+        '''Build the index from the sweep catalogs in a directory.'''
+        return cls(sorted(io.find_files(loc, pattern, verbose=verbose)))
+
+    @classmethod
+    def from_list(cls, list_file):
+        '''Build the index from a text (one file per line) or pickle list of sweeps.
+
+        Notes
+        -----
+            Works with the lists under `damascus/data/decals/`, e.g.
+            `decals_dr8_sweeps.list` or `decals_dr8_sweep_s19a_overlap.pkl`.
+
+        '''
+        if list_file.endswith('.pkl'):
+            return cls(io.read_from_pickle(list_file))
+        with open(list_file, 'r') as list_obj:
+            return cls([line.strip() for line in list_obj if line.strip()])
+
+    def query_points(self, ra, dec):
+        '''Find the sweep that contains each point.
+
+        Parameters
+        ----------
+        ra: `float` or `np.array`
+            RA of the objects in degree.
+        dec: `float` or `np.array`
+            Dec of the objects in degree.
+
+        Returns
+        -------
+        sweep_id: `np.array`
+            Index of the sweep in `self.sweeps` for each point. -1 if not covered.
+
+        '''
+        ra = np.mod(np.atleast_1d(np.asarray(ra, dtype=float)), 360.0)
+        dec = np.atleast_1d(np.asarray(dec, dtype=float))
+        assert len(ra) == len(dec), "RA & Dec array should have the same size."
+
+        sweep_id = np.full(len(ra), -1, dtype=np.int64)
+        if self._grid.size == 0:
+            return sweep_id
+
+        i = np.searchsorted(self.ra_edges, ra, side='right') - 1
+        j = np.searchsorted(self.dec_edges, dec, side='right') - 1
+        valid = ((i >= 0) & (i < self._grid.shape[0]) &
+                 (j >= 0) & (j < self._grid.shape[1]))
+        sweep_id[valid] = self._grid[i[valid], j[valid]]
+
+        return sweep_id
+
+    def group_points(self, ra, dec):
+        '''Group the points by the sweep that contains them.
+
+        Returns
+        -------
+        groups: `dict`
+            Dictionary of `{sweep: indices of the points}`. Points that are not
+            covered by any sweep are left out.
+
+        '''
+        sweep_id = self.query_points(ra, dec)
+        order = np.argsort(sweep_id, kind='stable')
+        uniq, start = np.unique(sweep_id[order], return_index=True)
+        chunks = np.split(order, start[1:])
+        return {self.sweeps[ii]: chunk for ii, chunk in zip(uniq, chunks) if ii >= 0}
+
+    def contains(self, ra, dec):
+        '''Whether each point is covered by any of the sweeps.'''
+        return self.query_points(ra, dec) >= 0
+
+    def overlap_polygon(self, polygon):
+        '''Find the sweeps whose box overlaps a polygon.
+
+        Parameters
+        ----------
+        polygon: `np.array` of shape (n,2) points or `dict`
+            RA, Dec coordinates of the polygon vertices, or a dictionary of them like
+            the `damascus/data/hsc/*_fdfc_poly.pkl` files.
+
+        Returns
+        -------
+        sweeps: `list`
+            Sweeps that overlap the polygon(s).
+
+        '''
+        if isinstance(polygon, dict):
+            overlap = np.zeros(len(self), dtype=bool)
+            for poly in polygon.values():
+                overlap |= self._overlap_polygon(np.asarray(poly, dtype=float))
+        else:
+            overlap = self._overlap_polygon(np.asarray(polygon, dtype=float))
+        return [self.sweeps[ii] for ii in np.flatnonzero(overlap)]
+
+    def _overlap_polygon(self, polygon):
+        '''Boolean mask of the boxes that overlap a single polygon.'''
+        # Any edge of the polygon crosses or lies inside the box
+        start, end = polygon, np.roll(polygon, -1, axis=0)
+        overlap = _segments_hit_boxes(start, end, self.boxes).any(axis=1)
+
+        # The box is completely inside the polygon
+        corners = np.vstack([self.boxes[:, 0], self.boxes[:, 2]]).T
+        overlap |= shape.points_in_polygon(corners, polygon)
+
+        return overlap
+
+    def overlap_healpix(self, mask, nest=True):
+        '''Find the sweeps that overlap a Healpix mask.
+
+        Parameters
+        ----------
+        mask: `damascus.hsc.FDFCMask`, healpy mask or string
+            Healpix mask. Either a `FDFCMask` object, the mask itself, or path to the
+            mask file.
+        nest: bool, optional
+            If True, assume NESTED pixel ordering, otherwise, RING pixel ordering.
+            Default: True
+
+        Returns
+        -------
+        sweeps: `list`
+            Sweeps that contain the center or any corner of a masked pixel.
+
+        '''
+        import healpy as hp
+        from .hsc import FDFCMask
+
+        if isinstance(mask, str):
+            mask = FDFCMask.read(mask, nest=nest)
+        elif not isinstance(mask, FDFCMask):
+            mask = FDFCMask(mask, nest=nest)
+
+        pixels = mask.pixels
+        ra, dec = hp.pix2ang(mask.nside, pixels, nest=mask.nest, lonlat=True)
+        sweep_id = [self.query_points(ra, dec)]
+        corners = hp.boundaries(mask.nside, pixels, step=1, nest=mask.nest)
+        if len(pixels) == 1:
+            corners = corners[np.newaxis]
+        ra, dec = hp.vec2ang(np.hstack(corners).T, lonlat=True)
+        sweep_id.append(self.query_points(ra, dec))
+
+        uniq = np.unique(np.concatenate(sweep_id))
+        return [self.sweeps[ii] for ii in uniq if ii >= 0]
+
+
+def _box_range(sweep):
+    '''Decode the sweep name into `[ra_min, ra_max, dec_min, dec_max]`.'''
+    box = sweep_to_box(os.path.split(sweep)[-1])
+    return [box[:, 0].min(), box[:, 0].max(), box[:, 1].min(), box[:, 1].max()]
+
+
+def _segments_hit_boxes(start, end, boxes):
+    '''Whether each segment intersects each box, using the Liang-Barsky clipping.
+
+    Parameters
+    ----------
+    start, end: `np.array` of shape (n,2) points
+        Start and end points of the segments.
+    boxes: `np.array` of shape (m,4)
+        `[ra_min, ra_max, dec_min, dec_max]` of the boxes.
+
+    Returns
+    -------
+    hit: `np.array` of shape (m,n)
+        Whether the n-th segment intersects the m-th box.
+
+    '''
+    x0, y0 = start[:, 0], start[:, 1]
+    dx, dy = end[:, 0] - x0, end[:, 1] - y0
+    x_min, x_max = boxes[:, 0:1], boxes[:, 1:2]
+    y_min, y_max = boxes[:, 2:3], boxes[:, 3:4]
+
+    t_in = np.zeros((len(boxes), len(start)))
+    t_out = np.ones((len(boxes), len(start)))
+    hit = np.ones((len(boxes), len(start)), dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for p, q in ((-dx, x0 - x_min), (dx, x_max - x0),
+                     (-dy, y0 - y_min), (dy, y_max - y0)):
+            p = np.broadcast_to(p, q.shape)
+            t = q / p
+            hit &= ~((p == 0) & (q < 0))
+            t_in = np.where(p < 0, np.maximum(t_in, t), t_in)
+            t_out = np.where(p > 0, np.minimum(t_out, t), t_out)
+
+    return hit & (t_in <= t_out)
@@ -0,0 +1,278 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Lightweight timing and counting of the pipeline stages.
+
+The stages of the sweep selection, the Healpix mask, and the shape functions are
+wrapped in `stage` context managers that record the number of calls, the wall time,
+the rows in & out, and the bytes read. The instrumentation is disabled by default, in
+which case `stage` returns a shared no-op object.
+
+Examples
+--------
+    >>> from damascus import instrument
+    >>> with instrument.profile():
+    ...     sweep_bright_galaxy_match(sweep_cat, mask=mask)
+    # stage                          calls     time [s]     rows in    rows out  read [MB]
+    # sweep.load                         1        0.012     1000000     1000000        0.0
+    ...
+
+Notes
+-----
+    - Stages can be nested, e.g. `hsc.filter` includes `hsc.ang2pix`, so the times of
+      different stages should not be added up.
+    - Setting the environment variable `DAMASCUS_PROFILE=1` enables the instrumentation
+      at import time.
+    - The batch functions run their tasks through `worker`: the instrumentation is
+      turned on in the worker processes when it is on in the parent, and the
+      statistics of each task come back with its result and are merged into the ones
+      of the parent. The times are then summed over the processes, so they can be
+      larger than the wall time.
+
+"""
+
+import os
+import time
+import logging
+import threading
+import contextlib
+
+__all__ = ['stage', 'count', 'enable', 'disable', 'is_enabled', 'reset', 'summary',
+           'report', 'profile', 'take', 'merge', 'worker', 'merged']
+
+LOGGER = logging.getLogger('damascus')
+
+_STATE = {'enabled': False, 'log_level': None}
+_STATS = {}
+_LOCK = threading.Lock()
+
+
+def _record(name, elapsed=0.0, rows_in=None, rows_out=None, n_bytes=None):
+    '''Add one call of a stage to the statistics.'''
+    with _LOCK:
+        stats = _STATS.get(name)
+        if stats is None:
+            stats = _STATS[name] = {
+                'calls': 0, 'time': 0.0, 'rows_in': 0, 'rows_out': 0, 'bytes': 0}
+        stats['calls'] += 1
+        stats['time'] += elapsed
+        stats['rows_in'] += rows_in or 0
+        stats['rows_out'] += rows_out or 0
+        stats['bytes'] += n_bytes or 0
+
+    if _STATE['log_level'] is not None:
+        LOGGER.log(_STATE['log_level'], "%s: %.4f s, rows in %s, rows out %s, bytes %s",
+                   name, elapsed, rows_in, rows_out, n_bytes)
+
+
+class Stage(object):
+    '''Timer of one call of a stage. Set `rows_out` and `n_bytes` inside the block.'''
+    __slots__ = ('name', 'rows_in', 'rows_out', 'n_bytes', '_start')
+
+    def __init__(self, name, rows_in=None, n_bytes=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.n_bytes = n_bytes
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, time.perf_counter() - self._start, rows_in=self.rows_in,
+                rows_out=self.rows_out, n_bytes=self.n_bytes)
+        return False
+
+
+class _NullStage(object):
+    '''Shared no-op stage used when the instrumentation is disabled.'''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, rows_in=None, n_bytes=None):
+    '''Context manager that times a stage of the pipeline.
+
+    Parameters
+    ----------
+    name: `string`
+        Name of the stage, e.g. "hsc.filter".
+    rows_in: `int`, optional
+        Number of input rows. Default: None
+    n_bytes: `int`, optional
+        Number of bytes read. Default: None
+
+    Examples
+    --------
+        >>> with instrument.stage('hsc.filter', rows_in=len(cat)) as timer:
+        ...     matched = cat[select]
+        ...     timer.rows_out = len(matched)
+
+    '''
+    if not _STATE['enabled']:
+        return _NULL_STAGE
+    return Stage(name, rows_in=rows_in, n_bytes=n_bytes)
+
+
+def count(name, rows_in=None, rows_out=None, n_bytes=None):
+    '''Record rows and bytes of a stage without timing it.'''
+    if _STATE['enabled']:
+        _record(name, rows_in=rows_in, rows_out=rows_out, n_bytes=n_bytes)
+
+
+def enable(log_level=None):
+    '''Turn on the instrumentation.
+
+    Parameters
+    ----------
+    log_level: `int`, optional
+        If provided, every stage is also emitted to the "damascus" logger at this
+        level, e.g. `logging.DEBUG`. Default: None
+    '''
+    _STATE.update({'enabled': True, 'log_level': log_level})
+
+
+def disable():
+    '''Turn off the instrumentation. The statistics are kept.'''
+    _STATE.update({'enabled': False, 'log_level': None})
+
+
+def is_enabled():
+    '''Whether the instrumentation is on.'''
+    return _STATE['enabled']
+
+
+def reset():
+    '''Clear the statistics.'''
+    with _LOCK:
+        _STATS.clear()
+
+
+def take():
+    '''Statistics recorded since the last call, which are then cleared.'''
+    with _LOCK:
+        stats = {name: dict(stats) for name, stats in _STATS.items()}
+        _STATS.clear()
+    return stats
+
+
+def merge(stats):
+    '''Add the statistics of another process, e.g. from `take`, to this one.'''
+    with _LOCK:
+        for name, other in stats.items():
+            current = _STATS.get(name)
+            if current is None:
+                current = _STATS[name] = {
+                    'calls': 0, 'time': 0.0, 'rows_in': 0, 'rows_out': 0, 'bytes': 0}
+            for key, value in other.items():
+                current[key] += value
+
+
+class _Worker(object):
+    '''Picklable wrapper of a worker function that also returns its statistics.'''
+    __slots__ = ('func', 'enabled')
+
+    def __init__(self, func, enabled):
+        self.func = func
+        self.enabled = enabled
+
+    def __call__(self, *args):
+        if not self.enabled:
+            return self.func(*args), None
+        if not _STATE['enabled']:
+            enable()
+        result = self.func(*args)
+        return result, take()
+
+
+def worker(func):
+    '''Wrap a worker function of a process pool so that it returns its statistics.
+
+    Parameters
+    ----------
+    func: callable
+        Module level function run by the worker processes.
+
+    Examples
+    --------
+        >>> results = instrument.merged(
+        ...     pool.imap(instrument.worker(_sweep_worker), sweeps, chunksize=1))
+
+    '''
+    return _Worker(func, _STATE['enabled'])
+
+
+def merged(results):
+    '''Results of the `worker` functions, with their statistics merged into this process.'''
+    for result, stats in results:
+        if stats:
+            merge(stats)
+        yield result
+
+
+def summary():
+    '''Statistics of each stage, sorted by the total time.
+
+    Returns
+    -------
+    stats: `dict`
+        `calls`, `time` (in seconds), `rows_in`, `rows_out`, and `bytes` of each stage.
+    '''
+    with _LOCK:
+        return {name: dict(stats) for name, stats in sorted(
+            _STATS.items(), key=lambda item: -item[1]['time'])}
+
+
+def report(logger=None):
+    '''Print the statistics as a table, or send them to a logger.'''
+    lines = ["# {:28s} {:>6s} {:>12s} {:>11s} {:>11s} {:>10s}".format(
+        'stage', 'calls', 'time [s]', 'rows in', 'rows out', 'read [MB]')]
+    for name, stats in summary().items():
+        lines.append("# {:28s} {:6d} {:12.4f} {:11d} {:11d} {:10.1f}".format(
+            name, stats['calls'], stats['time'], stats['rows_in'], stats['rows_out'],
+            stats['bytes'] / 1024 ** 2))
+    if logger is None:
+        print('\n'.join(lines))
+    else:
+        for line in lines:
+            logger.info(line)
+
+
+@contextlib.contextmanager
+def profile(log_level=None, show=True):
+    '''Collect fresh statistics inside the block and report them at the end.'''
+    was_enabled, old_level = _STATE['enabled'], _STATE['log_level']
+    reset()
+    enable(log_level=log_level)
+    try:
+        yield _STATS
+    finally:
+        _STATE.update({'enabled': was_enabled, 'log_level': old_level})
+        if show:
+            report()
+
+
+def _after_fork():
+    '''A forked process starts with empty statistics instead of a copy of the parent's.'''
+    global _LOCK
+    _LOCK = threading.Lock()
+    _STATS.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+if os.environ.get('DAMASCUS_PROFILE', '').lower() in ('1', 'true', 'yes'):
+    enable()
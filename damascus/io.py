@@ -4,17 +4,124 @@
 
 import os
 import glob
+import json
 import pickle
 
 import numpy as np
 
-import healpy
+from . import query
+from . import instrument
 
-__all__ = ['read_healpix_fits', 'find_files', 'save_to_pickle', 'read_from_pickle']
+__all__ = ['read_healpix_fits', 'iter_healpix_pixels', 'read_healpix_pixels', 'decode_table',
+           'find_files', 'save_to_pickle', 'read_from_pickle', 'columnar_is_current',
+           'fits_to_columnar', 'sweeps_to_columnar', 'ColumnarTable']
+
+COLUMNAR_META = 'columns.json'
 
 def read_healpix_fits(fits_file, nest=True):
     """Read the FITS format healpix file."""
-    return healpy.read_map(fits_file, nest=nest, dtype=np.bool)
+    import healpy
+
+    return healpy.read_map(fits_file, nest=nest, dtype=bool)
+
+def iter_healpix_pixels(fits_file, hdu=1, block_rows=1024):
+    '''Iterate over the NESTED indices of the non-zero pixels of a FITS Healpix map.
+
+    The map is read block by block, so neither the full-sky map nor the full list of
+    pixels is built in memory. Both the full-sky (IMPLICIT) and the partial-sky
+    (EXPLICIT) maps are supported.
+
+    Parameters
+    ----------
+    fits_file: string
+        Path to the FITS format Healpix map.
+    hdu: `int`, optional
+        HDU of the map. Default: 1
+    block_rows: `int`, optional
+        Number of table rows read at once. Default: 1024
+
+    Yields
+    ------
+    pixels: `np.array`
+        NESTED indices of the pixels of one block that are neither 0, NaN, nor UNSEEN.
+        They are not sorted when the map is in RING ordering.
+    nside: `int`
+        NSIDE of the map.
+
+    '''
+    import healpy
+    from astropy.io import fits
+
+    def _inside(signal):
+        signal = np.asarray(signal).ravel()
+        if signal.dtype.kind == 'f':
+            return np.isfinite(signal) & (signal != 0) & (signal != healpy.UNSEEN)
+        return signal != 0
+
+    with fits.open(fits_file, memmap=True) as hdu_list:
+        header, data = hdu_list[hdu].header, hdu_list[hdu].data
+        nside = int(header['NSIDE'])
+        nest = header.get('ORDERING', 'RING').strip().upper().startswith('NEST')
+        explicit = header.get('INDXSCHM', 'IMPLICIT').strip().upper() == 'EXPLICIT'
+
+        first_pixel = int(header.get('FIRSTPIX', 0))
+        for start in range(0, len(data), block_rows):
+            block = data[start:start + block_rows]
+            if explicit:
+                index = np.asarray(block.field(0), dtype=np.int64).ravel()
+                pixels = index[_inside(block.field(1))]
+            else:
+                # Each row of an IMPLICIT map holds the same number of pixels
+                n_per_row = np.size(block.field(0)) // len(block)
+                pixels = (np.flatnonzero(_inside(block.field(0))).astype(np.int64) +
+                          first_pixel + start * n_per_row)
+            if not nest:
+                pixels = healpy.ring2nest(nside, pixels)
+            yield pixels, nside
+
+
+def read_healpix_pixels(fits_file, hdu=1, block_rows=1024):
+    '''Read the NESTED indices of the non-zero pixels of a FITS Healpix map.
+
+    The map is read block by block with `iter_healpix_pixels`, so the full-sky map is
+    never built in memory.
+
+    Parameters
+    ----------
+    fits_file: string
+        Path to the FITS format Healpix map.
+    hdu: `int`, optional
+        HDU of the map. Default: 1
+    block_rows: `int`, optional
+        Number of table rows read at once. Default: 1024
+
+    Returns
+    -------
+    pixels: `np.array`
+        Sorted NESTED indices of the pixels that are neither 0, NaN, nor UNSEEN.
+    nside: `int`
+        NSIDE of the map.
+
+    '''
+    pixels, nside = [np.zeros(0, dtype=np.int64)], None
+    for block, nside in iter_healpix_pixels(fits_file, hdu=hdu, block_rows=block_rows):
+        pixels.append(block)
+    if nside is None:
+        from astropy.io import fits
+        nside = int(fits.getheader(fits_file, hdu)['NSIDE'])
+    return np.unique(np.concatenate(pixels)), nside
+
+
+def decode_table(table):
+    '''Plain structured array of a table, with the columns of a FITS_rec decoded.
+
+    `np.asarray` on a `FITS_rec` returns its raw storage: the logical columns are the
+    "T"/"F" bytes and the TZERO/TSCAL scaling is not applied. The columns are read
+    through the FITS column machinery instead.
+    '''
+    if hasattr(table, 'columns') and hasattr(table, 'field'):
+        return query.project(table, list(table.dtype.names))
+    return np.asarray(table)
 
 def find_files(loc, pattern, verbose=True):
     """Gather a list of pathes to all SWEEP catalogs."""
@@ -68,3 +175,183 @@ def read_from_pickle(name, py2=False):
     if py2:
         return pickle.load(open(name, "rb"), encoding='latin1')
     return pickle.load(open(name, "rb"))
+
+
+def _source_identity(fits_file):
+    '''Size and modification time of the FITS file, used to validate its columnar cache.'''
+    stat = os.stat(fits_file)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def columnar_is_current(table_dir, fits_file=None):
+    '''Whether the columnar cache exists and was made from the current FITS file.
+
+    Parameters
+    ----------
+    table_dir: string
+        Path to the columnar version of the catalog.
+    fits_file: string, optional
+        Path to the FITS catalog. Default: None, use the source recorded in the cache.
+
+    '''
+    meta_file = os.path.join(table_dir, COLUMNAR_META)
+    if not os.path.isfile(meta_file):
+        return False
+    with open(meta_file, 'r') as meta:
+        meta = json.load(meta)
+    fits_file = meta['source'] if fits_file is None else fits_file
+    if not os.path.isfile(fits_file):
+        return False
+    return meta.get('identity') == _source_identity(fits_file)
+
+def fits_to_columnar(fits_file, cache_dir, columns=None, overwrite=False):
+    '''Convert a FITS binary table into a columnar cache.
+
+    Each column is saved as a native-endian `.npy` file that can be memory-mapped,
+    so later reads skip the FITS decoding and byte-swapping.
+
+    Parameters
+    ----------
+    fits_file: string
+        Path to the FITS catalog.
+    cache_dir: string
+        Directory of the columnar cache. The catalog is saved in a sub-directory
+        named after the FITS file.
+    columns: list, optional
+        Only convert these columns. Default: None, convert all columns.
+    overwrite: bool, optional
+        Overwrite the existing cache. Otherwise, it is only rebuilt when the FITS file
+        changed since the conversion. Default: False
+
+    Returns
+    -------
+    table_dir: string
+        Path to the columnar version of the catalog.
+
+    '''
+    from astropy.io import fits
+
+    table_dir = os.path.join(
+        cache_dir, os.path.splitext(os.path.split(fits_file)[-1])[0])
+    if not overwrite and columnar_is_current(table_dir, fits_file):
+        return table_dir
+    os.makedirs(table_dir, exist_ok=True)
+    if os.path.isfile(os.path.join(table_dir, COLUMNAR_META)):
+        os.remove(os.path.join(table_dir, COLUMNAR_META))
+
+    with fits.open(fits_file, memmap=True) as hdu_list:
+        header, data = hdu_list[1].header, hdu_list[1].data
+        if columns is None:
+            columns = list(data.names)
+        for col in columns:
+            values = np.asarray(data[col])
+            if values.dtype.kind in ('U', 'S'):
+                # Same as the comparison rule of the FITS character columns
+                values = np.char.rstrip(values)
+            np.save(os.path.join(table_dir, col + '.npy'),
+                    np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('=')))
+
+        meta = {'source': os.path.abspath(fits_file), 'identity': _source_identity(fits_file),
+                'n_rows': len(data), 'columns': list(columns), 'header': header.tostring()}
+
+    # Write the meta data last so that an interrupted conversion is not used
+    with open(os.path.join(table_dir, COLUMNAR_META), 'w') as meta_file:
+        json.dump(meta, meta_file)
+
+    return table_dir
+
+def _fits_to_columnar_worker(args):
+    '''Convert one FITS catalog inside a worker process.'''
+    return fits_to_columnar(*args)
+
+def sweeps_to_columnar(sweeps, cache_dir, pattern='sweep-*.fits', columns=None,
+                       overwrite=False, n_workers=1, verbose=True):
+    '''Convert a list or a directory of Sweep catalogs into a columnar cache.
+
+    Parameters
+    ----------
+    sweeps: list or string
+        List of paths to the FITS catalogs, or the directory that contains them.
+    cache_dir: string
+        Directory of the columnar cache.
+    pattern: string, optional
+        Pattern used to find the catalogs when `sweeps` is a directory.
+        Default: "sweep-*.fits"
+    columns: list, optional
+        Only convert these columns. Default: None, convert all columns.
+    overwrite: bool, optional
+        Overwrite the existing cache. Default: False
+    n_workers: int, optional
+        Number of worker processes. Default: 1
+    verbose: bool, optional
+        Announce progress. Default: True
+
+    Returns
+    -------
+    table_dirs: list
+        Paths to the columnar version of the catalogs.
+
+    '''
+    if isinstance(sweeps, str):
+        sweeps = sorted(find_files(sweeps, pattern, verbose=verbose))
+    os.makedirs(cache_dir, exist_ok=True)
+
+    tasks = [(sweep, cache_dir, columns, overwrite) for sweep in sweeps]
+    if n_workers is None or n_workers > 1:
+        import multiprocessing
+        with multiprocessing.Pool(processes=n_workers) as pool:
+            table_dirs = list(instrument.merged(pool.imap(
+                instrument.worker(_fits_to_columnar_worker), tasks, chunksize=1)))
+    else:
+        table_dirs = [_fits_to_columnar_worker(task) for task in tasks]
+
+    if verbose:
+        print("# Convert {:d} catalogs into {:s}".format(len(table_dirs), cache_dir))
+    return table_dirs
+
+class ColumnarTable(object):
+    '''Read-only table backed by a columnar cache made by `fits_to_columnar`.
+
+    Columns are memory-mapped from the `.npy` files on first access. The object
+    supports `table[column]`, `table[mask]`, `len(table)`, and `table.names` like a
+    `FITS_rec`.
+
+    Parameters
+    ----------
+    table_dir: string
+        Path to the columnar version of the catalog.
+
+    '''
+    def __init__(self, table_dir):
+        self.table_dir = table_dir
+        with open(os.path.join(table_dir, COLUMNAR_META), 'r') as meta_file:
+            self.meta = json.load(meta_file)
+        self.names = self.meta['columns']
+        self._arrays = {}
+
+    def __repr__(self):
+        return "Columnar Table: {:s}".format(self.table_dir)
+
+    def __len__(self):
+        return self.meta['n_rows']
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self._arrays:
+                if key not in self.names:
+                    raise KeyError("Wrong column name: {:s}".format(key))
+                self._arrays[key] = np.load(
+                    os.path.join(self.table_dir, key + '.npy'), mmap_mode='r')
+            return self._arrays[key]
+
+        # Row selection: materialize all the columns as a structured array
+        return query.project(self, self.names, mask=key)
+
+    @property
+    def header(self):
+        '''FITS header of the original catalog.'''
+        from astropy.io import fits
+        return fits.Header.fromstring(self.meta['header'])
+
+    def close(self):
+        '''Release the memory-mapped columns.'''
+        self._arrays = {}
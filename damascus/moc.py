@@ -0,0 +1,320 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Multi-order coverage (MOC) maps of the survey footprints.
+
+A `MOC` keeps a footprint as sorted, disjoint, half-open ranges of NESTED Healpix
+pixel indices at its finest order. A range that is aligned on the pixels of a coarser
+order stands for these coarse pixels, so large areas of a footprint only cost a
+couple of integers instead of a full-sky map. The set operations, the resolution
+changes, and the point membership are all vectorized.
+
+Examples
+--------
+    >>> s19a = MOC.from_mask('s19a_fdfc_hp_contarea.fits')
+    >>> s18a = MOC.from_mask('s18a_fdfc_hp_contarea.fits')
+    >>> new = s19a - s18a
+    >>> print(new.area)
+    >>> inside = new.contains(ra, dec)
+
+"""
+
+import hashlib
+
+import numpy as np
+
+__all__ = ['MOC', 'MAX_ORDER']
+
+MAX_ORDER = 29
+
+FULL_SKY_DEG2 = 4.0 * np.pi * (180.0 / np.pi) ** 2
+
+
+def _normalize(ranges):
+    '''Sort and merge the overlapping or adjacent ranges.'''
+    ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    ranges = ranges[ranges[:, 1] > ranges[:, 0]]
+    if len(ranges) == 0:
+        return ranges
+    ranges = ranges[np.argsort(ranges[:, 0], kind='stable')]
+
+    # A new range starts when its start is beyond all the previous ends
+    end_max = np.maximum.accumulate(ranges[:, 1])
+    new = np.ones(len(ranges), dtype=bool)
+    new[1:] = ranges[1:, 0] > end_max[:-1]
+    starts = ranges[new, 0]
+    ends = end_max[np.append(np.flatnonzero(new)[1:] - 1, len(ranges) - 1)]
+    return np.vstack([starts, ends]).T
+
+
+def _inside(ranges, values):
+    '''Whether the values are inside the normalized ranges.'''
+    return np.searchsorted(ranges.ravel(), values, side='right') % 2 == 1
+
+
+def _combine(ranges_a, ranges_b, operation):
+    '''Boolean operation on two sets of normalized ranges.'''
+    edges = np.unique(np.concatenate([ranges_a.ravel(), ranges_b.ravel()]))
+    if len(edges) < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+    # Each elementary interval between two edges is either fully in or out of a set
+    starts, ends = edges[:-1], edges[1:]
+    keep = operation(_inside(ranges_a, starts), _inside(ranges_b, starts))
+    return _normalize(np.vstack([starts[keep], ends[keep]]).T)
+
+
+def _expand(starts, ends):
+    '''All the integers in the half-open ranges `[starts, ends)`.'''
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum(), dtype=np.int64)
+
+
+def _pixels_to_ranges(pixels):
+    '''Ranges of the consecutive runs of pixel indices.'''
+    pixels = np.unique(np.asarray(pixels, dtype=np.int64))
+    if len(pixels) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    breaks = np.flatnonzero(np.diff(pixels) != 1)
+    starts = pixels[np.append(0, breaks + 1)]
+    ends = pixels[np.append(breaks, len(pixels) - 1)] + 1
+    return np.vstack([starts, ends]).T
+
+
+class MOC(object):
+    '''Multi-order coverage map.
+
+    Parameters
+    ----------
+    ranges: `np.array` of shape (n,2)
+        Half-open ranges `[start, end)` of NESTED pixel indices at `order`.
+    order: `int`
+        Finest Healpix order of the coverage, NSIDE = 2 ** order.
+
+    '''
+    def __init__(self, ranges, order):
+        if not 0 <= order <= MAX_ORDER:
+            raise ValueError("Healpix order should be between 0 and {:d}".format(MAX_ORDER))
+        self.order = int(order)
+        self.ranges = _normalize(ranges)
+
+    def __repr__(self):
+        return "MOC: order={0.order:d}, {1:d} ranges, {0.area:.3f} deg^2".format(
+            self, len(self.ranges))
+
+    @classmethod
+    def from_pixels(cls, pixels, order):
+        '''MOC of a list of NESTED pixel indices at `order`.'''
+        return cls(_pixels_to_ranges(pixels), order)
+
+    @classmethod
+    def from_orders(cls, orders):
+        '''MOC from a dictionary of `{order: NESTED pixel indices}`.'''
+        order_max = max(orders) if orders else 0
+        ranges = [np.zeros((0, 2), dtype=np.int64)]
+        for order, pixels in orders.items():
+            shift = 2 * (order_max - order)
+            pixels = np.asarray(pixels, dtype=np.int64)
+            ranges.append(np.vstack([pixels << shift, (pixels + 1) << shift]).T)
+        return cls(np.concatenate(ranges), order_max)
+
+    @classmethod
+    def from_map(cls, healpix_map, nest=True):
+        '''MOC of a full-sky Healpix map; the non-zero pixels are inside.'''
+        import healpy as hp
+
+        healpix_map = np.asarray(healpix_map)
+        nside = hp.npix2nside(len(healpix_map))
+        pixels = np.flatnonzero(healpix_map)
+        if not nest:
+            pixels = hp.ring2nest(nside, pixels)
+        return cls.from_pixels(pixels, hp.nside2order(nside))
+
+    @classmethod
+    def from_mask(cls, mask, nest=True):
+        '''MOC of a `FDFCMask`, a `SparseHealpixMask`, a full-sky Healpix map, or a mask
+        file (FITS or `.npz`).'''
+        from .hsc import FDFCMask
+
+        if hasattr(mask, 'to_moc'):
+            return mask.to_moc()
+        if isinstance(mask, str):
+            if mask.endswith('.moc.npz'):
+                return cls.load(mask)
+            mask = FDFCMask.read(mask, nest=nest)
+        if isinstance(mask, FDFCMask):
+            return cls.from_map(mask.bitmap, nest=mask.nest)
+        return cls.from_map(mask, nest=nest)
+
+    @classmethod
+    def load(cls, moc_file):
+        '''Load the MOC from a `.npz` file.'''
+        with np.load(moc_file) as moc:
+            return cls(moc['ranges'], int(moc['order']))
+
+    def save(self, moc_file):
+        '''Save the MOC as a `.npz` file, e.g. `s19a_fdfc.moc.npz`.'''
+        np.savez(moc_file, ranges=self.ranges, order=self.order)
+
+    @property
+    def nside(self):
+        '''NSIDE of the finest order.'''
+        return 2 ** self.order
+
+    @property
+    def nest(self):
+        '''The pixels are always in NESTED ordering.'''
+        return True
+
+    @property
+    def n_pixels(self):
+        '''Number of pixels at the finest order.'''
+        return int((self.ranges[:, 1] - self.ranges[:, 0]).sum())
+
+    @property
+    def pixels(self):
+        '''NESTED indices of the pixels at the finest order.'''
+        return _expand(self.ranges[:, 0], self.ranges[:, 1])
+
+    @property
+    def sky_fraction(self):
+        '''Fraction of the sky that is covered.'''
+        return self.n_pixels / (12.0 * 4.0 ** self.order)
+
+    @property
+    def area(self):
+        '''Covered area in square degrees.'''
+        return self.sky_fraction * FULL_SKY_DEG2
+
+    @property
+    def digest(self):
+        '''SHA1 digest of the MOC, used to identify the mask in caches.'''
+        sha1 = hashlib.sha1(self.ranges.tobytes())
+        sha1.update("moc {:d}".format(self.order).encode())
+        return sha1.hexdigest()
+
+    def to_orders(self):
+        '''Decompose the coverage into the fewest pixels at mixed orders.
+
+        Returns
+        -------
+        orders: `dict`
+            `{order: NESTED pixel indices}` of the pixels at each order.
+        '''
+        orders = {}
+        starts, ends = self.ranges[:, 0], self.ranges[:, 1]
+        for order in range(self.order + 1):
+            shift = 2 * (self.order - order)
+            first = ((starts + (1 << shift) - 1) >> shift)
+            last = ends >> shift
+            full = first < last
+            if full.any():
+                orders[order] = _expand(first[full], last[full])
+            # The left-over parts go to the finer orders
+            first_edge = np.where(full, first << shift, ends)
+            last_edge = np.where(full, last << shift, ends)
+            starts, ends = (np.concatenate([starts, last_edge]),
+                            np.concatenate([first_edge, ends]))
+            keep = ends > starts
+            starts, ends = starts[keep], ends[keep]
+        return orders
+
+    def _at_order(self, order):
+        '''Ranges of the MOC at a finer (or the same) order.'''
+        return self.ranges << (2 * (order - self.order))
+
+    def _operate(self, other, operation):
+        order = max(self.order, other.order)
+        return MOC(_combine(self._at_order(order), other._at_order(order), operation), order)
+
+    def union(self, other):
+        '''Pixels in either of the MOCs.'''
+        return self._operate(other, np.logical_or)
+
+    def intersection(self, other):
+        '''Pixels in both MOCs.'''
+        return self._operate(other, np.logical_and)
+
+    def difference(self, other):
+        '''Pixels in this MOC but not in the other one.'''
+        return self._operate(other, lambda a, b: a & ~b)
+
+    def complement(self):
+        '''Pixels that are not in the MOC.'''
+        full = MOC([[0, 12 * 4 ** self.order]], self.order)
+        return full.difference(self)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    __invert__ = complement
+
+    def __eq__(self, other):
+        if not isinstance(other, MOC):
+            return NotImplemented
+        order = max(self.order, other.order)
+        return np.array_equal(self._at_order(order), other._at_order(order))
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def degrade(self, order):
+        '''Coarser MOC; a coarse pixel is kept if any of its sub-pixels is covered.'''
+        if order > self.order:
+            raise ValueError("Use upgrade() to go to a finer order")
+        shift = 2 * (self.order - order)
+        starts = self.ranges[:, 0] >> shift
+        ends = (self.ranges[:, 1] + (1 << shift) - 1) >> shift
+        return MOC(np.vstack([starts, ends]).T, order)
+
+    def upgrade(self, order):
+        '''Same coverage expressed at a finer order.'''
+        if order < self.order:
+            raise ValueError("Use degrade() to go to a coarser order")
+        return MOC(self._at_order(order), order)
+
+    def contains_pixels(self, pixels, order=None):
+        '''Whether the NESTED pixels at `order` (default: the MOC order) are covered.'''
+        order = self.order if order is None else order
+        pixels = np.asarray(pixels, dtype=np.int64)
+        if order >= self.order:
+            return _inside(self.ranges, pixels >> (2 * (order - self.order)))
+        # A coarse pixel is only covered if all its sub-pixels are
+        if len(self.ranges) == 0:
+            return np.zeros(pixels.shape, dtype=bool)
+        shift = 2 * (self.order - order)
+        start, end = pixels << shift, (pixels + 1) << shift
+        index = np.searchsorted(self.ranges[:, 1], start, side='right')
+        index = np.minimum(index, len(self.ranges) - 1)
+        return (self.ranges[index, 0] <= start) & (self.ranges[index, 1] >= end)
+
+    def contains(self, ra, dec):
+        '''Whether the objects are inside the coverage.
+
+        Parameters
+        ----------
+        ra: `float` or `np.array`
+            RA of the objects in degree.
+        dec: `float` or `np.array`
+            Dec of the objects in degree.
+
+        Returns
+        -------
+        inside: `bool` or `np.array`
+            Boolean mask of objects inside the footprint.
+
+        '''
+        import healpy as hp
+
+        pixels = hp.ang2pix(self.nside, ra, dec, nest=True, lonlat=True)
+        return _inside(self.ranges, pixels)
+
+    def to_map(self, order=None):
+        '''Full-sky NESTED boolean Healpix map at `order` (default: the MOC order).'''
+        moc = self if order is None else (
+            self.degrade(order) if order < self.order else self.upgrade(order))
+        bitmap = np.zeros(12 * 4 ** moc.order, dtype=bool)
+        bitmap[moc.pixels] = True
+        return bitmap
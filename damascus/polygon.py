@@ -0,0 +1,220 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Point-in-polygon engine for many points and many polygons.
+
+`PolygonIndex` preprocesses a set of polygons once, e.g. the HSC FDFC fields in
+`damascus/data/hsc/*_fdfc_poly.pkl` or the hulls of a sweep catalog, and then
+classifies large arrays of (RA, Dec) with vectorized crossing-number tests. Only
+depends on `numpy`.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+__all__ = ['PolygonIndex']
+
+
+class PolygonIndex(object):
+    '''Index of a set of polygons for fast point membership.
+
+    Parameters
+    ----------
+    polygons: `dict`, `list`, or `np.array` of shape (n,2)
+        Dictionary of `{field_id: vertices}`, a list of vertices (the IDs are then
+        the positions in the list), or the vertices of a single polygon (ID 0).
+    n_strips: int, optional
+        Number of Dec strips used to bucket the polygon edges.
+        Default: None, scale with the number of edges.
+
+    Examples
+    --------
+        >>> fdfc = PolygonIndex(io.read_from_pickle('s19a_fdfc_poly.pkl'))
+        >>> field_id = fdfc.query(ra, dec, n_threads=8)
+
+    Notes
+    -----
+        - The bounding boxes of the polygons are used to reject points early.
+        - The edges are bucketed in Dec strips, so each point only tests the edges
+          that span its Dec. The crossing parity is reduced per polygon.
+        - Polygons that extend below RA=0 or beyond RA=360 (see
+          `damascus.hsc.get_fdfc_polygons`) are also indexed with a 360 degree shift.
+
+    '''
+    def __init__(self, polygons, n_strips=None):
+        if isinstance(polygons, dict):
+            ids, vertices = list(polygons.keys()), list(polygons.values())
+        elif isinstance(polygons, np.ndarray) and polygons.ndim == 2:
+            ids, vertices = [0], [polygons]
+        else:
+            ids, vertices = list(range(len(polygons))), list(polygons)
+        self.ids = np.asarray(ids)
+        self.polygons = [np.asarray(poly, dtype=float) for poly in vertices]
+        self.bboxes = np.asarray(
+            [[poly[:, 0].min(), poly[:, 0].max(), poly[:, 1].min(), poly[:, 1].max()]
+             for poly in self.polygons]).reshape(-1, 4)
+
+        # Edges of all the polygons (and their shifted copies across RA=0)
+        edges, owner, boxes = [], [], []
+        for ii, poly in enumerate(self.polygons):
+            for shift in _ra_shifts(self.bboxes[ii]):
+                start = poly + [shift, 0.0]
+                edges.append(np.hstack([start, np.roll(start, -1, axis=0)]))
+                owner.append(np.full(len(start), ii))
+                boxes.append(self.bboxes[ii] + [shift, shift, 0.0, 0.0])
+        edges = np.vstack(edges) if edges else np.zeros((0, 4))
+        owner = np.concatenate(owner) if owner else np.zeros(0, dtype=int)
+        self._boxes = np.asarray(boxes).reshape(-1, 4)
+
+        # Horizontal edges never cross the ray
+        keep = edges[:, 1] != edges[:, 3]
+        edges, owner = edges[keep], owner[keep]
+        y_low = np.minimum(edges[:, 1], edges[:, 3])
+        y_high = np.maximum(edges[:, 1], edges[:, 3])
+
+        # Dec strips
+        if n_strips is None:
+            n_strips = int(np.clip(len(edges) // 4, 1, 4096))
+        self.n_strips = n_strips
+        self.dec_min = y_low.min() if len(edges) else 0.0
+        self.dec_max = y_high.max() if len(edges) else 0.0
+        self._strip_height = max((self.dec_max - self.dec_min) / n_strips, 1e-12)
+
+        # Each edge goes into all the strips its Dec range overlaps
+        s_low = self._strip_of(y_low)
+        s_high = self._strip_of(y_high)
+        n_copy = s_high - s_low + 1
+        edge_idx = np.repeat(np.arange(len(edges)), n_copy)
+        strip = s_low[edge_idx] + (
+            np.arange(len(edge_idx)) - np.repeat(np.cumsum(n_copy) - n_copy, n_copy))
+
+        # Sorted by strip, then by polygon
+        order = np.lexsort((owner[edge_idx], strip))
+        edge_idx, strip = edge_idx[order], strip[order]
+        self._strip_ptr = np.searchsorted(strip, np.arange(n_strips + 1))
+        self._x1, self._y1 = edges[edge_idx, 0], edges[edge_idx, 1]
+        self._y2 = edges[edge_idx, 3]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._dxdy = (edges[edge_idx, 2] - self._x1) / (self._y2 - self._y1)
+        self._owner = owner[edge_idx]
+
+    def __repr__(self):
+        return "Polygon Index: {:d} polygons".format(len(self.polygons))
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def _strip_of(self, dec):
+        '''Index of the Dec strip.'''
+        return np.clip(((dec - self.dec_min) / self._strip_height).astype(np.int64),
+                       0, self.n_strips - 1)
+
+    def query(self, ra, dec, n_threads=1, chunk_size=1000000, default=-1):
+        '''Find the polygon that contains each point.
+
+        Parameters
+        ----------
+        ra: `float` or `np.array`
+            RA of the objects in degree.
+        dec: `float` or `np.array`
+            Dec of the objects in degree.
+        n_threads: int, optional
+            Number of threads. Default: 1
+        chunk_size: int, optional
+            Number of points processed in each step. Default: 1000000
+        default: optional
+            Value for the points outside of all the polygons. Default: -1
+
+        Returns
+        -------
+        field_id: `np.array`
+            ID of the (first) polygon that contains each point.
+
+        '''
+        position = self._query_position(ra, dec, n_threads=n_threads, chunk_size=chunk_size)
+        field_id = np.full(len(position), default,
+                           dtype=np.result_type(self.ids, np.asarray(default)))
+        field_id[position >= 0] = self.ids[position[position >= 0]]
+        return field_id
+
+    def contains(self, ra, dec, n_threads=1, chunk_size=1000000):
+        '''Whether each point is inside any of the polygons.'''
+        inside = self._query_position(
+            ra, dec, n_threads=n_threads, chunk_size=chunk_size) >= 0
+        return inside[0] if np.isscalar(ra) else inside
+
+    def _query_position(self, ra, dec, n_threads=1, chunk_size=1000000):
+        '''Position of the polygon in `self.polygons` that contains each point.'''
+        ra = np.atleast_1d(np.asarray(ra, dtype=float))
+        dec = np.atleast_1d(np.asarray(dec, dtype=float))
+        assert len(ra) == len(dec), "RA & Dec array should have the same size."
+
+        chunks = [slice(start, min(start + chunk_size, len(ra)))
+                  for start in range(0, len(ra), chunk_size)]
+        if n_threads > 1 and len(chunks) < n_threads:
+            size = max(1, -(-len(ra) // n_threads))
+            chunks = [slice(start, min(start + size, len(ra)))
+                      for start in range(0, len(ra), size)]
+
+        def _run(chunk):
+            return self._query_chunk(ra[chunk], dec[chunk])
+
+        if n_threads > 1:
+            with ThreadPoolExecutor(max_workers=n_threads) as pool:
+                results = list(pool.map(_run, chunks))
+        else:
+            results = [_run(chunk) for chunk in chunks]
+
+        return np.concatenate(results) if results else np.zeros(0, dtype=np.int64)
+
+    def _query_chunk(self, ra, dec, max_cells=4000000):
+        '''Classify one chunk of points.'''
+        position = np.full(len(ra), -1, dtype=np.int64)
+
+        # Bounding box prefilter
+        candidate = np.zeros(len(ra), dtype=bool)
+        for ra_min, ra_max, dec_min, dec_max in self._boxes:
+            candidate |= (ra >= ra_min) & (ra <= ra_max) & (dec >= dec_min) & (dec <= dec_max)
+        index = np.flatnonzero(candidate)
+        if len(index) == 0:
+            return position
+
+        # Group the points by Dec strip
+        strip = self._strip_of(dec[index])
+        order = np.argsort(strip, kind='stable')
+        index, strip = index[order], strip[order]
+        uniq, start = np.unique(strip, return_index=True)
+        stop = np.append(start[1:], len(strip))
+
+        for s, p0, p1 in zip(uniq, start, stop):
+            e0, e1 = self._strip_ptr[s], self._strip_ptr[s + 1]
+            if e0 == e1:
+                continue
+            owner = self._owner[e0:e1]
+            poly_start = np.flatnonzero(np.append(True, owner[1:] != owner[:-1]))
+            x1, y1, y2 = self._x1[e0:e1], self._y1[e0:e1], self._y2[e0:e1]
+            dxdy = self._dxdy[e0:e1]
+
+            step = max(1, max_cells // (e1 - e0))
+            for q0 in range(p0, p1, step):
+                pts = index[q0:min(q0 + step, p1)]
+                x, y = ra[pts][:, np.newaxis], dec[pts][:, np.newaxis]
+                cross = ((y1 > y) != (y2 > y)) & (x < x1 + (y - y1) * dxdy)
+                # Parity of the crossings of each polygon
+                inside = np.logical_xor.reduceat(cross, poly_start, axis=1)
+                hit = inside.any(axis=1)
+                first = owner[poly_start][np.argmax(inside, axis=1)]
+                position[pts[hit]] = first[hit]
+
+        return position
+
+
+def _ra_shifts(bbox):
+    '''RA shifts to apply to a polygon so that it covers points in [0, 360).'''
+    shifts = [0.0]
+    if bbox[0] < 0.0:
+        shifts.append(360.0)
+    if bbox[1] >= 360.0:
+        shifts.append(-360.0)
+    return shifts
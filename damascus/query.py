@@ -0,0 +1,235 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Lazy compound selections on columnar catalogs.
+
+A `Query` accumulates `(column, operator, value)` predicates without touching the
+data. When it is evaluated, each referenced column is read once, the boolean masks
+are combined in place, and only the surviving rows of the requested output columns
+are materialized.
+
+Examples
+--------
+    >>> from damascus.query import col
+    >>> query = sweep_obj.where(col('TYPE') != 'PSF', ('FLUX_R', '>=', 0.5))
+    >>> query.count()
+    >>> gal = query.fetch(columns=['RA', 'DEC', 'FLUX_R'])
+
+"""
+
+import operator
+
+import numpy as np
+
+__all__ = ['OPERATORS', 'Predicate', 'Column', 'Query', 'col', 'as_predicate', 'project']
+
+OPERATORS = {
+    '>': operator.gt, '<': operator.lt,
+    '>=': operator.ge, '<=': operator.le,
+    '==': operator.eq, '!=': operator.ne}
+
+
+class Predicate(object):
+    '''A single `(column, operator, value)` selection rule.
+
+    Parameters
+    ----------
+    column: `string`
+        Name of the column used for selection.
+    oper: `string`
+        String representation of the operator. Allowed ones include
+        `[">", "<", ">=", "<=", "==", "!="]`
+    value:
+        Selection criteria.
+
+    '''
+    def __init__(self, column, oper, value):
+        oper = oper.strip()
+        if oper not in OPERATORS:
+            raise ValueError("Wrong operator: {:s}".format(oper))
+        self.column = column
+        self.oper = oper
+        self.value = value
+
+    def __repr__(self):
+        return "{0.column:s} {0.oper:s} {1:s}".format(self, repr(self.value))
+
+    def __iter__(self):
+        return iter((self.column, self.oper, self.value))
+
+    def evaluate(self, values):
+        '''Apply the rule to the column values and return the boolean mask.
+
+        Note
+        ----
+            String columns are compared after stripping the trailing white spaces,
+            which is the behaviour of the `FITS_rec` character columns.
+
+        '''
+        return self._compare(_comparable(values))
+
+    def _compare(self, values):
+        '''Apply the rule to values that have already gone through `_comparable`.'''
+        if values.dtype.kind == 'S' and isinstance(self.value, str):
+            return OPERATORS[self.oper](values, self.value.encode())
+        return OPERATORS[self.oper](values, self.value)
+
+
+class Column(object):
+    '''Placeholder of a column name that turns comparisons into `Predicate`.'''
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "Column: {:s}".format(self.name)
+
+    def __gt__(self, value):
+        return Predicate(self.name, '>', value)
+
+    def __lt__(self, value):
+        return Predicate(self.name, '<', value)
+
+    def __ge__(self, value):
+        return Predicate(self.name, '>=', value)
+
+    def __le__(self, value):
+        return Predicate(self.name, '<=', value)
+
+    def __eq__(self, value):
+        return Predicate(self.name, '==', value)
+
+    def __ne__(self, value):
+        return Predicate(self.name, '!=', value)
+
+    __hash__ = None
+
+
+def _comparable(values):
+    '''Strip the trailing white spaces of string columns before comparison.'''
+    values = np.asarray(values)
+    if values.dtype.kind in ('U', 'S'):
+        return np.char.rstrip(values)
+    return values
+
+
+def col(name):
+    '''Refer to a column by name in a query, e.g. `col('TYPE') != 'PSF'`.'''
+    return Column(name)
+
+
+def as_predicate(rule):
+    '''Turn a `Predicate` or a `(column, operator, value)` tuple into a `Predicate`.'''
+    if isinstance(rule, Predicate):
+        return rule
+    column, oper, value = rule
+    return Predicate(column, oper, value)
+
+
+def project(table, columns, mask=None):
+    '''Materialize a subset of columns (and rows) of a table as a structured array.
+
+    Parameters
+    ----------
+    table: `astropy.io.fits.FITS_rec`, `np.ndarray`, or mapping of arrays
+        The input table. Only needs to support `table[column]`.
+    columns: `list`
+        Names of the output columns.
+    mask: `np.ndarray`, optional
+        Boolean mask or index array of the rows to keep. Default: None
+
+    Returns
+    -------
+    data: `np.ndarray`
+        Structured array of the requested columns in native byte order.
+
+    '''
+    arrays = []
+    for name in columns:
+        values = np.asarray(table[name])
+        if mask is not None:
+            values = values[mask]
+        arrays.append(values)
+
+    n_rows = len(arrays[0]) if arrays else 0
+    dtype = [(name, values.dtype.newbyteorder('='), values.shape[1:])
+             for name, values in zip(columns, arrays)]
+    data = np.empty(n_rows, dtype=dtype)
+    for name, values in zip(columns, arrays):
+        data[name] = values
+
+    return data
+
+
+class Query(object):
+    '''A lazy compound selection on a columnar table.
+
+    Parameters
+    ----------
+    table: `astropy.io.fits.FITS_rec`, `np.ndarray`, or mapping of arrays
+        The table to select from. Only needs to support `table[column]`, and
+        `table[mask]` when all the columns are fetched.
+    predicates: `list`, optional
+        List of `Predicate` or `(column, operator, value)` tuples.
+
+    Notes
+    -----
+        A `Query` is immutable: `where` returns a new `Query` with more predicates.
+
+    '''
+    def __init__(self, table, predicates=None):
+        self.table = table
+        self.predicates = [] if predicates is None else [
+            as_predicate(rule) for rule in predicates]
+
+    def __repr__(self):
+        return "Query: {:s}".format(
+            ' & '.join(repr(rule) for rule in self.predicates) or 'all')
+
+    def where(self, *predicates):
+        '''Return a new `Query` with additional predicates.'''
+        return Query(self.table, self.predicates + [
+            as_predicate(rule) for rule in predicates])
+
+    @property
+    def columns(self):
+        '''Names of the columns referenced by the predicates.'''
+        return list(dict.fromkeys(rule.column for rule in self.predicates))
+
+    def mask(self):
+        '''Evaluate all the predicates and return the combined boolean mask.'''
+        mask = None
+        cache = {}
+        for rule in self.predicates:
+            if rule.column not in cache:
+                cache[rule.column] = _comparable(self.table[rule.column])
+            rule_mask = rule._compare(cache[rule.column])
+            if mask is None:
+                mask = np.array(rule_mask, dtype=bool)
+            else:
+                np.logical_and(mask, rule_mask, out=mask)
+
+        if mask is None:
+            return np.ones(len(self.table), dtype=bool)
+        return mask
+
+    def count(self):
+        '''Number of rows that pass all the predicates.'''
+        return int(np.count_nonzero(self.mask()))
+
+    def fetch(self, columns=None):
+        '''Materialize the selected rows.
+
+        Parameters
+        ----------
+        columns: `list`, optional
+            Names of the output columns. Default: None, keep all the columns.
+
+        Returns
+        -------
+        data: `np.ndarray` or `astropy.io.fits.FITS_rec`
+            The selected rows.
+
+        '''
+        mask = self.mask()
+        if columns is None:
+            return self.table[mask]
+        return project(self.table, columns, mask=mask)
@@ -4,10 +4,9 @@
 
 import numpy as np
 
-from scipy.spatial import Delaunay
-from scipy.spatial import ConvexHull
+from . import instrument
 
-__all__ = ['alpha_shape', 'convex_hull', 'concave_hull']
+__all__ = ['alpha_shape', 'convex_hull', 'concave_hull', 'points_in_polygon']
 
 
 def convex_hull(points):
@@ -24,7 +23,11 @@ def convex_hull(points):
         List of indices for boundary points.
 
     '''
-    hull = ConvexHull(points)
+    from scipy.spatial import ConvexHull
+
+    with instrument.stage('shape.convex_hull', rows_in=len(points)) as timer:
+        hull = ConvexHull(points)
+        timer.rows_out = len(hull.vertices)
     return np.vstack([points[hull.vertices, 0], points[hull.vertices, 1]]).T
 
 
@@ -43,7 +46,40 @@ def concave_hull(points, **kwargs):
 
     '''
     edges = np.asarray(alpha_shape(points, **kwargs)[0])
-    return np.vstack([points[edges[:, 0], 0], points[edges[:, 1], 1]]).T
+    return points[edges[:, 0]]
+
+
+def points_in_polygon(points, polygon):
+    ''' Check whether points are inside a polygon using the even-odd rule.
+
+    Parameters
+    ----------
+    points: `np.array` of shape (n,2) points
+         Coordinates of the points.
+    polygon: `np.array` of shape (m,2) points
+         Coordinates of the vertices of the polygon. It does not need to be closed.
+
+    Returns
+    -------
+    inside: `np.array` of `bool`
+        Whether each point is inside the polygon.
+
+    '''
+    points = np.atleast_2d(points)
+    x, y = points[:, 0], points[:, 1]
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+
+    inside = np.zeros(len(points), dtype=bool)
+    # Loop over the edges, each step is vectorized over all the points
+    for xa, ya, xb, yb in zip(x1, y1, x2, y2):
+        if ya == yb:
+            continue
+        cross = (ya > y) != (yb > y)
+        cross &= x < xa + (y - ya) * (xb - xa) / (yb - ya)
+        inside ^= cross
+
+    return inside
 
 
 def alpha_shape(points, alpha, only_outer=True):
@@ -66,95 +102,126 @@ def alpha_shape(points, alpha, only_outer=True):
 
     Notes
     -----
-        From a StackOverflow answer by Iddo Hanniel:
+        Based on a StackOverflow answer by Iddo Hanniel:
         https://stackoverflow.com/questions/23073170/calculate-bounding-polygon-of-alpha-shape-from-the-delaunay-triangulation
 
+        The circumradii of all the triangles are computed in one pass. Triangles are
+        re-oriented counter-clockwise, so that an edge shared by two kept triangles
+        appears once in each direction, and the boundary edges are the ones whose
+        undirected version only appears once.
+
     '''
+    from scipy.spatial import Delaunay
+
     assert points.shape[0] > 3, "Need at least four points"
 
-    def add_edge(edges, i, j):
-        """
-        Add a line between the i-th and j-th points,
-        if not in the list already
-        """
-        if (i, j) in edges or (j, i) in edges:
-            # Already added
-            assert (j, i) in edges, "Can't go twice over same directed edge right?"
-            if only_outer:
-                # If both neighboring triangles are in shape, it's not a boundary edge
-                edges.remove((j, i))
-            return
-        edges.add((i, j))
-
-    tri = Delaunay(points)
-    edges = set()
-    # Loop over triangles:
-    # ia, ib, ic = indices of corner points of the triangle
-    for ia, ib, ic in tri.vertices:
-        pa = points[ia]
-        pb = points[ib]
-        pc = points[ic]
-        # Computing radius of triangle circumcircle
-        a = np.sqrt((pa[0] - pb[0]) ** 2 + (pa[1] - pb[1]) ** 2)
-        b = np.sqrt((pb[0] - pc[0]) ** 2 + (pb[1] - pc[1]) ** 2)
-        c = np.sqrt((pc[0] - pa[0]) ** 2 + (pc[1] - pa[1]) ** 2)
-        s = (a + b + c) / 2.0
+    with instrument.stage('shape.delaunay', rows_in=len(points)) as timer:
+        tri = Delaunay(points)
+        timer.rows_out = len(tri.simplices)
+    simplices = tri.simplices
+    pa, pb, pc = points[simplices[:, 0]], points[simplices[:, 1]], points[simplices[:, 2]]
+
+    # Computing radius of triangle circumcircle
+    a = np.hypot(pa[:, 0] - pb[:, 0], pa[:, 1] - pb[:, 1])
+    b = np.hypot(pb[:, 0] - pc[:, 0], pb[:, 1] - pc[:, 1])
+    c = np.hypot(pc[:, 0] - pa[:, 0], pc[:, 1] - pa[:, 1])
+    s = (a + b + c) / 2.0
+    with np.errstate(divide='ignore', invalid='ignore'):
         area = np.sqrt(s * (s - a) * (s - b) * (s - c))
         circum_r = a * b * c / (4.0 * area)
-        if circum_r < alpha:
-            add_edge(edges, ia, ib)
-            add_edge(edges, ib, ic)
-            add_edge(edges, ic, ia)
-
-    return _stitch_boundaries(edges)
-
-def _find_edges_with(i, edge_set):
-    i_first = [j for (x, j) in edge_set if x==i]
-    i_second = [j for (j, x) in edge_set if x==i]
-    return i_first, i_second
+    keep = circum_r < alpha
+    simplices = simplices[keep]
+
+    # Make all the triangles counter-clockwise
+    pa, pb, pc = pa[keep], pb[keep], pc[keep]
+    clockwise = ((pb[:, 0] - pa[:, 0]) * (pc[:, 1] - pa[:, 1]) -
+                 (pb[:, 1] - pa[:, 1]) * (pc[:, 0] - pa[:, 0])) < 0
+    simplices[clockwise] = simplices[clockwise][:, [0, 2, 1]]
+
+    # Directed edges of all the triangles
+    edges = np.vstack(
+        [simplices[:, [0, 1]], simplices[:, [1, 2]], simplices[:, [2, 0]]])
+
+    # Count the undirected edges
+    key = np.sort(edges, axis=1).astype(np.int64)
+    key = key[:, 0] * len(points) + key[:, 1]
+    _, first, inverse, counts = np.unique(
+        key, return_index=True, return_inverse=True, return_counts=True)
+
+    if only_outer:
+        # If both neighboring triangles are in shape, it's not a boundary edge
+        edges = edges[counts[inverse.ravel()] == 1]
+    else:
+        edges = edges[np.sort(first)]
+
+    with instrument.stage('shape.stitch_boundaries', rows_in=len(edges)) as timer:
+        boundaries = _stitch_boundaries(edges)
+        timer.rows_out = len(boundaries)
+    return boundaries
 
 def _stitch_boundaries(edges):
     """Stitches the output edge set into sequences of consecutive edges.
 
     Parameters
     ----------
-    edges: set
+    edges: set or np.array of shape (n,2)
          Set of (i,j) pairs representing edges of the alpha-shape. (i,j) are
          the indices in the points array.
 
     Returns
     -------
     boundary_lst: list
-        List of indices for boundary points.
+        List of indices for boundary points, sorted by the length of the boundary.
 
     Notes
     -----
-        From a StackOverflow answer by Iddo Hanniel:
+        Based on a StackOverflow answer by Iddo Hanniel:
         https://stackoverflow.com/questions/50549128/boundary-enclosing-a-given-set-of-points
 
+        Edges are looked up through adjacency maps of their start and end points, so
+        each edge is only visited once.
+
     """
-    edge_set = edges.copy()
+    edges = [tuple(edge) for edge in (
+        edges.tolist() if isinstance(edges, np.ndarray) else edges)]
+
+    # Adjacency maps: point -> indices of the edges that start / end there
+    edge_start, edge_end = {}, {}
+    for ii, (i, j) in enumerate(edges):
+        edge_start.setdefault(i, []).append(ii)
+        edge_end.setdefault(j, []).append(ii)
+
+    used = [False] * len(edges)
+
+    def _next_edge(adjacency, point):
+        candidates = adjacency.get(point, [])
+        while candidates:
+            ii = candidates.pop()
+            if not used[ii]:
+                return ii
+        return None
+
     boundary_lst = []
-    while edge_set:
-        boundary = []
-        edge0 = edge_set.pop()
-        boundary.append(edge0)
+    for ii0, edge0 in enumerate(edges):
+        if used[ii0]:
+            continue
+        used[ii0] = True
+        boundary = [edge0]
         last_edge = edge0
-        while edge_set:
+        while last_edge[1] != edge0[0]:
             _, j = last_edge
-            j_first, j_second = _find_edges_with(j, edge_set)
-            if j_first:
-                edge_set.remove((j, j_first[0]))
-                edge_with_j = (j, j_first[0])
-                boundary.append(edge_with_j)
-                last_edge = edge_with_j
-            elif j_second:
-                edge_set.remove((j_second[0], j))
-                edge_with_j = (j, j_second[0])  # flip edge rep
-                boundary.append(edge_with_j)
-                last_edge = edge_with_j
-            if edge0[0] == last_edge[1]:
-                break
+            ii = _next_edge(edge_start, j)
+            if ii is not None:
+                last_edge = edges[ii]
+            else:
+                ii = _next_edge(edge_end, j)
+                if ii is None:
+                    break
+                last_edge = (j, edges[ii][0])  # flip edge rep
+            used[ii] = True
+            boundary.append(last_edge)
         boundary_lst.append(boundary)
 
+    # Longest boundary first, which is usually the outer one
+    boundary_lst.sort(key=len, reverse=True)
     return boundary_lst
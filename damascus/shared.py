@@ -0,0 +1,233 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Zero-copy sharing of the masks and the reference data with the worker processes.
+
+`SharedArrays.share` pickles an object with protocol 5 and moves its array buffers
+(the Healpix bitmap, the MOC ranges, the polygon vertices, the reference coordinates,
+...) out-of-band into one `multiprocessing.shared_memory` block, or into a memory-mapped
+file. Only the small pickle stream and the name of the block travel to the workers,
+where `attach` rebuilds the object with read-only arrays backed by the shared block,
+so the data is held once per node instead of once per worker.
+
+Examples
+--------
+    >>> with SharedArrays() as store, multiprocessing.Pool(
+    ...         64, initializer=_init_worker, initargs=(store.share(mask),)) as pool:
+    ...     results = pool.map(_worker, sweeps)
+
+    and, in the worker process:
+
+    >>> mask = shared.attach(handle)
+
+Notes
+-----
+    - Requires Python >= 3.8 (`AVAILABLE` is False otherwise).
+    - With the "fork" start method the worker processes already share the pages of
+      the parent until they are written to. The gain is for the "spawn" and
+      "forkserver" start methods, and for the masks that are too large to be copied
+      into every worker at all.
+
+"""
+
+import os
+import sys
+import pickle
+import tempfile
+import contextlib
+
+from . import instrument
+
+__all__ = ['AVAILABLE', 'SharedArrays', 'SharedHandle', 'attach', 'share_initargs']
+
+AVAILABLE = sys.version_info >= (3, 8)
+
+# Alignment of the buffers inside the shared block, in bytes
+ALIGNMENT = 64
+
+# Blocks attached by this process, kept open while their arrays are in use
+_ATTACHED = {}
+
+
+def _open_shared_memory(name):
+    '''Attach to an existing shared memory block without taking ownership of it.'''
+    from multiprocessing import shared_memory, resource_tracker
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13, attaching also registers the block with the resource
+        # tracker, which would then unlink it under the feet of the parent process.
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedHandle(object):
+    '''Picklable reference to an object whose arrays live in a shared block.
+
+    Parameters
+    ----------
+    payload: `bytes`
+        Protocol 5 pickle stream of the object, without the array buffers.
+    offsets: `list`
+        Offset of each buffer inside the block, in bytes.
+    sizes: `list`
+        Size of each buffer, in bytes.
+    name: `string`, optional
+        Name of the `multiprocessing.shared_memory` block. Default: None
+    path: `string`, optional
+        Path to the memory-mapped file. Default: None
+
+    '''
+    def __init__(self, payload, offsets, sizes, name=None, path=None):
+        self.payload = payload
+        self.offsets = offsets
+        self.sizes = sizes
+        self.name = name
+        self.path = path
+
+    def __repr__(self):
+        return "SharedHandle: {:d} buffers, {:.1f} MB in {:s}".format(
+            len(self.sizes), sum(self.sizes) / 1024 ** 2, self.name or self.path)
+
+    def _buffer(self):
+        '''Read-only view of the whole shared block.'''
+        key = self.name or self.path
+        if key not in _ATTACHED:
+            if self.name is not None:
+                _ATTACHED[key] = _open_shared_memory(self.name)
+            else:
+                import mmap
+                with open(self.path, 'rb') as block_file:
+                    _ATTACHED[key] = mmap.mmap(
+                        block_file.fileno(), 0, access=mmap.ACCESS_READ)
+        block = _ATTACHED[key]
+        return memoryview(block.buf if self.name is not None else block).toreadonly()
+
+    def attach(self):
+        '''Rebuild the object on top of the shared block, without copying the arrays.'''
+        with instrument.stage('shared.attach', n_bytes=sum(self.sizes)):
+            if not self.sizes:
+                return pickle.loads(self.payload)
+            view = self._buffer()
+            buffers = [view[offset:offset + size]
+                       for offset, size in zip(self.offsets, self.sizes)]
+            return pickle.loads(self.payload, buffers=buffers)
+
+
+def attach(obj):
+    '''Rebuild a shared object, or return the object itself if it is not shared.'''
+    return obj.attach() if isinstance(obj, SharedHandle) else obj
+
+
+class SharedArrays(object):
+    '''Owner of the shared blocks created in the parent process.
+
+    The blocks are released when the store is closed, so the worker processes that
+    use them should be done by then.
+
+    Parameters
+    ----------
+    directory: `string`, optional
+        If provided, the buffers are written to a memory-mapped file in this directory
+        (e.g. on a local disk, when `/dev/shm` is small) instead of a shared memory
+        block. Default: None
+
+    '''
+    def __init__(self, directory=None):
+        if not AVAILABLE:
+            raise RuntimeError("Shared arrays need Python >= 3.8")
+        self.directory = directory
+        self._blocks = []
+
+    def __repr__(self):
+        return "SharedArrays: {:d} blocks".format(len(self._blocks))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def share(self, obj):
+        '''Move the array buffers of an object into a shared block.
+
+        Parameters
+        ----------
+        obj: Python object
+            Any picklable object, e.g. a `FDFCMask`, a `MOC`, a dictionary of polygon
+            vertices, or the tuple of arguments of a pool initializer.
+
+        Returns
+        -------
+        handle: `SharedHandle`
+            Small picklable handle; `attach(handle)` returns a copy of the object whose
+            contiguous arrays are read-only views of the shared block.
+
+        '''
+        buffers = []
+        payload = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+        raws = [buffer.raw() for buffer in buffers]
+
+        offsets, total = [], 0
+        for raw in raws:
+            offsets.append(total)
+            total += (raw.nbytes + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+        sizes = [raw.nbytes for raw in raws]
+        if not raws:
+            return SharedHandle(payload, offsets, sizes)
+
+        with instrument.stage('shared.share', n_bytes=total):
+            if self.directory is not None:
+                block_file = tempfile.NamedTemporaryFile(
+                    prefix='damascus_', suffix='.shm', dir=self.directory, delete=False)
+                with block_file:
+                    block_file.truncate(total)
+                    for offset, raw in zip(offsets, raws):
+                        block_file.seek(offset)
+                        block_file.write(raw)
+                self._blocks.append(block_file.name)
+                return SharedHandle(payload, offsets, sizes, path=block_file.name)
+
+            from multiprocessing import shared_memory
+            block = shared_memory.SharedMemory(create=True, size=total)
+            for offset, raw in zip(offsets, raws):
+                block.buf[offset:offset + raw.nbytes] = raw
+            self._blocks.append(block)
+            return SharedHandle(payload, offsets, sizes, name=block.name)
+
+    def close(self):
+        '''Release all the shared blocks.'''
+        for block in self._blocks:
+            if isinstance(block, str):
+                if os.path.isfile(block):
+                    os.remove(block)
+            else:
+                block.close()
+                block.unlink()
+        self._blocks = []
+
+
+@contextlib.contextmanager
+def share_initargs(initargs, shared=True):
+    '''Arguments of a pool initializer with their arrays moved to shared blocks.
+
+    Parameters
+    ----------
+    initargs: `tuple`
+        Arguments of the initializer. The initializer should `attach` each of them.
+    shared: `bool` or `string`, optional
+        True to use shared memory, a directory to use a memory-mapped file there, or
+        False to pass the arguments unchanged. Default: True
+
+    '''
+    if not shared or not AVAILABLE:
+        yield initargs
+        return
+    directory = shared if isinstance(shared, str) else None
+    with SharedArrays(directory=directory) as store:
+        yield tuple(store.share(arg) for arg in initargs)
@@ -0,0 +1,339 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Sparse Healpix masks for the high-NSIDE footprint, bright-star, and edge masks.
+
+A full-sky boolean map at NSIDE 32768 has 12 * 4^15 pixels, i.e. about 13 GB. The
+`SparseHealpixMask` only keeps the coarse "coverage" pixels that overlap the mask:
+the coarse pixels that are entirely inside are flagged, and the ones on the edges
+keep a bit-packed chunk of their NESTED sub-pixels. The membership test stays a
+vectorized `ang2pix` followed by array lookups, and the object can be used wherever
+a `damascus.hsc.FDFCMask` is accepted.
+
+Examples
+--------
+    >>> mask = SparseHealpixMask.read('s19a_bright_star_nside32768.fits',
+    ...                               cache='s19a_bright_star.npz')
+    >>> inside = mask.contains(ra, dec)
+    >>> matched = filter_hsc_fdfc_mask(catalog, mask)
+
+"""
+
+import os
+import hashlib
+import itertools
+
+import numpy as np
+
+from . import io
+from . import instrument
+
+__all__ = ['SparseHealpixMask']
+
+# NSIDE 32 coverage pixels, about 1.8 degree on a side
+DEFAULT_COVERAGE_ORDER = 5
+
+# Number of pixels handled at once when building a mask
+BLOCK_PIXELS = 1 << 22
+
+# State of the coverage pixels that do not point to a chunk
+EMPTY = -1
+FULL = -2
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+
+class SparseHealpixMask(object):
+    '''Healpix mask stored as bit-packed chunks over the coarse coverage pixels.
+
+    Parameters
+    ----------
+    pixels: `np.array`
+        NESTED indices of the pixels inside the mask.
+    nside: `int`
+        NSIDE of the mask.
+    coverage_order: `int`, optional
+        Healpix order of the coverage pixels. Default: 5 (NSIDE=32)
+
+    '''
+    def __init__(self, pixels, nside, coverage_order=DEFAULT_COVERAGE_ORDER):
+        self._setup(nside, coverage_order)
+        self._add_pixels(np.asarray(pixels, dtype=np.int64))
+        self._finish()
+
+    def _setup(self, nside, coverage_order):
+        '''Empty mask, to be filled block by block with `_add_pixels` or `_add_ranges`.'''
+        self.nside = int(nside)
+        self.order = int(np.log2(self.nside))
+        if 2 ** self.order != self.nside:
+            raise ValueError("NSIDE should be a power of 2: {:d}".format(self.nside))
+        self.coverage_order = min(int(coverage_order), self.order)
+        self._shift = 2 * (self.order - self.coverage_order)
+        self._chunk_size = 1 << self._shift
+        self._chunk_bytes = (self._chunk_size + 7) // 8
+        self.coverage = np.full(12 * 4 ** self.coverage_order, EMPTY, dtype=np.int32)
+        self.chunks = np.zeros((0, self._chunk_bytes), dtype=np.uint8)
+        self._n_chunks = 0
+
+    def _add_pixels(self, pixels):
+        '''Set the bits of a block of NESTED pixels.'''
+        coarse = pixels >> self._shift
+        keep = self.coverage[coarse] != FULL
+        pixels, coarse = pixels[keep], coarse[keep]
+        if len(pixels) == 0:
+            return
+
+        # A chunk for each coarse pixel seen for the first time, growing the buffer
+        new = np.unique(coarse[self.coverage[coarse] == EMPTY])
+        n_chunks = self._n_chunks + len(new)
+        if n_chunks > len(self.chunks):
+            chunks = np.zeros((max(n_chunks, 2 * len(self.chunks)), self._chunk_bytes),
+                              dtype=np.uint8)
+            chunks[:self._n_chunks] = self.chunks[:self._n_chunks]
+            self.chunks = chunks
+        self.coverage[new] = np.arange(self._n_chunks, n_chunks, dtype=np.int32)
+        self._n_chunks = n_chunks
+
+        bit = (self.coverage[coarse].astype(np.int64) * self._chunk_bytes * 8 +
+               (pixels & (self._chunk_size - 1)))
+        np.bitwise_or.at(self.chunks.reshape(-1), bit >> 3,
+                         (128 >> (bit & 7)).astype(np.uint8))
+
+    def _add_ranges(self, ranges, block_pixels=BLOCK_PIXELS):
+        '''Add half-open ranges of NESTED pixels; the covered coarse pixels are flagged
+        without expanding them.'''
+        from .moc import _expand
+
+        ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+        starts, ends = ranges[:, 0], ranges[:, 1]
+        first = (starts + self._chunk_size - 1) >> self._shift
+        last = ends >> self._shift
+        full = first < last
+        for first_cell, last_cell in zip(first[full], last[full]):
+            self.coverage[first_cell:last_cell] = FULL
+
+        # The left-over parts are shorter than a coverage pixel, expand a few at a time
+        starts = np.concatenate([starts, np.where(full, last << self._shift, ends)])
+        ends = np.concatenate([np.where(full, first << self._shift, ends), ends])
+        keep = ends > starts
+        starts, ends = starts[keep], ends[keep]
+        groups = np.cumsum(ends - starts) // block_pixels
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(groups)) + 1, [len(starts)]])
+        for lower, upper in zip(bounds[:-1], bounds[1:]):
+            self._add_pixels(_expand(starts[lower:upper], ends[lower:upper]))
+
+    def _finish(self):
+        '''Flag the coarse pixels whose chunk is full, and compact the other chunks.'''
+        cells = np.full(self._n_chunks, -1, dtype=np.int64)
+        partial = np.flatnonzero(self.coverage >= 0)
+        cells[self.coverage[partial]] = partial
+
+        full_chunk = np.packbits(np.ones(self._chunk_size, dtype=bool))
+        n_kept = 0
+        for index, cell in enumerate(cells):
+            if cell < 0:
+                # The coarse pixel was flagged as full after its chunk was started
+                continue
+            if np.array_equal(self.chunks[index], full_chunk):
+                self.coverage[cell] = FULL
+                continue
+            if n_kept != index:
+                self.chunks[n_kept] = self.chunks[index]
+            self.coverage[cell] = n_kept
+            n_kept += 1
+        self.chunks = self.chunks[:n_kept].copy()
+        del self._n_chunks
+
+    @classmethod
+    def _from_blocks(cls, blocks, nside, coverage_order=DEFAULT_COVERAGE_ORDER):
+        '''Mask built from an iterable of blocks of NESTED pixel indices.'''
+        mask = cls.__new__(cls)
+        mask._setup(nside, coverage_order)
+        for pixels in blocks:
+            mask._add_pixels(np.asarray(pixels, dtype=np.int64))
+        mask._finish()
+        return mask
+
+    def __repr__(self):
+        return ("SparseHealpixMask: NSIDE={0.nside:d}, {0.n_pixels:d} pixels, "
+                "{1:d} full and {2:d} partial coverage pixels").format(
+                    self, int((self.coverage == FULL).sum()), len(self.chunks))
+
+    @classmethod
+    def from_map(cls, healpix_map, nest=True, coverage_order=DEFAULT_COVERAGE_ORDER):
+        '''Sparse mask of a full-sky Healpix map; the non-zero pixels are inside.'''
+        import healpy as hp
+
+        healpix_map = np.asarray(healpix_map)
+        nside = hp.npix2nside(len(healpix_map))
+
+        def _blocks():
+            for start in range(0, len(healpix_map), BLOCK_PIXELS):
+                pixels = np.flatnonzero(healpix_map[start:start + BLOCK_PIXELS]) + start
+                yield pixels if nest else hp.ring2nest(nside, pixels)
+
+        return cls._from_blocks(_blocks(), nside, coverage_order=coverage_order)
+
+    @classmethod
+    def from_mask(cls, mask, coverage_order=DEFAULT_COVERAGE_ORDER):
+        '''Sparse mask of a `damascus.hsc.FDFCMask` or a `damascus.moc.MOC`.'''
+        from .moc import MOC
+
+        if isinstance(mask, MOC):
+            sparse = cls.__new__(cls)
+            sparse._setup(mask.nside, coverage_order)
+            sparse._add_ranges(mask.ranges)
+            sparse._finish()
+            return sparse
+        return cls.from_map(mask.bitmap, nest=mask.nest, coverage_order=coverage_order)
+
+    @classmethod
+    def read(cls, mask_file, coverage_order=DEFAULT_COVERAGE_ORDER, cache=None):
+        '''Read the mask from a FITS Healpix map without building the full-sky map.
+
+        Parameters
+        ----------
+        mask_file: string
+            Path to the FITS format Healpix mask (full-sky or partial-sky), or to the
+            `.npz` cache file.
+        coverage_order: `int`, optional
+            Healpix order of the coverage pixels. Default: 5 (NSIDE=32)
+        cache: string, optional
+            Path to the `.npz` cache file. It is used when it is newer than the FITS
+            file, otherwise it is (re)written after reading the FITS file.
+            Default: None
+
+        '''
+        if mask_file.endswith('.npz'):
+            return cls.load(mask_file)
+
+        if cache is not None and os.path.isfile(cache) and (
+                os.path.getmtime(cache) >= os.path.getmtime(mask_file)):
+            return cls.load(cache)
+
+        with instrument.stage('sparse.mask_read', n_bytes=os.path.getsize(mask_file)) as timer:
+            # The chunks are filled block by block, the pixels are never all in memory
+            blocks = io.iter_healpix_pixels(mask_file)
+            pixels, nside = next(blocks)
+            mask = cls._from_blocks(itertools.chain([pixels], (
+                pixels for pixels, _ in blocks)), nside, coverage_order=coverage_order)
+            timer.rows_out = mask.n_pixels
+        if cache is not None:
+            mask.save(cache)
+        return mask
+
+    @classmethod
+    def load(cls, cache_file):
+        '''Load the mask from the `.npz` cache file.'''
+        with instrument.stage('sparse.mask_load', n_bytes=os.path.getsize(cache_file)), \
+                np.load(cache_file) as cache:
+            mask = cls.__new__(cls)
+            mask._setup(int(cache['nside']), int(cache['coverage_order']))
+            del mask._n_chunks
+            mask.coverage[cache['full']] = FULL
+            mask.coverage[cache['partial']] = np.arange(len(cache['partial']), dtype=np.int32)
+            mask.chunks = cache['chunks'].reshape(-1, mask._chunk_bytes)
+        return mask
+
+    def save(self, cache_file):
+        '''Save the mask as a `.npz` file.'''
+        partial = np.flatnonzero(self.coverage >= 0)
+        np.savez(cache_file, nside=self.nside, coverage_order=self.coverage_order,
+                 full=np.flatnonzero(self.coverage == FULL),
+                 partial=partial[np.argsort(self.coverage[partial])], chunks=self.chunks)
+
+    @property
+    def nest(self):
+        '''The pixels are always in NESTED ordering.'''
+        return True
+
+    @property
+    def nbytes(self):
+        '''Memory used by the mask in bytes.'''
+        return self.coverage.nbytes + self.chunks.nbytes
+
+    @property
+    def n_pixels(self):
+        '''Number of the Healpix pixels inside the mask.'''
+        n_full = int((self.coverage == FULL).sum()) * self._chunk_size
+        return n_full + sum(int(_POPCOUNT[chunk].sum()) for chunk in self.chunks)
+
+    @property
+    def pixels(self):
+        '''Sorted NESTED indices of the Healpix pixels inside the mask.
+
+        This expands the whole mask into single pixels; `to_moc` and `contains_pixels`
+        do not.
+        '''
+        full = np.flatnonzero(self.coverage == FULL).astype(np.int64)
+        pixels = [(full[:, None] << self._shift) + np.arange(self._chunk_size)]
+        partial = np.flatnonzero(self.coverage >= 0).astype(np.int64)
+        for cell in partial:
+            bits = np.unpackbits(self.chunks[self.coverage[cell]], count=self._chunk_size)
+            pixels.append((cell << self._shift) + np.flatnonzero(bits))
+        return np.sort(np.concatenate([p.ravel() for p in pixels]))
+
+    @property
+    def area(self):
+        '''Area of the mask in square degrees.'''
+        return self.n_pixels * 4.0 * np.pi * (180.0 / np.pi) ** 2 / (12 * self.nside ** 2)
+
+    @property
+    def digest(self):
+        '''SHA1 digest of the mask content, used to identify the mask in caches.'''
+        if getattr(self, '_digest', None) is None:
+            # Independent of the order in which the chunks were filled
+            sha1 = hashlib.sha1(np.minimum(self.coverage, 0).tobytes())
+            for cell in np.flatnonzero(self.coverage >= 0):
+                sha1.update(self.chunks[self.coverage[cell]].tobytes())
+            sha1.update("sparse {:d} {:d}".format(self.nside, self.coverage_order).encode())
+            self._digest = sha1.hexdigest()
+        return self._digest
+
+    def to_moc(self):
+        '''Multi-order coverage map of the mask.'''
+        from .moc import MOC
+
+        # Whole coverage pixels for the full ones, and the runs of set bits of the chunks
+        full = np.flatnonzero(self.coverage == FULL).astype(np.int64)
+        ranges = [np.vstack([full << self._shift, (full + 1) << self._shift]).T]
+        for cell in np.flatnonzero(self.coverage >= 0):
+            bits = np.unpackbits(self.chunks[self.coverage[cell]], count=self._chunk_size)
+            edges = np.flatnonzero(np.diff(bits, prepend=0, append=0))
+            ranges.append(edges.reshape(-1, 2) + (int(cell) << self._shift))
+        return MOC(np.concatenate(ranges), self.order)
+
+    def contains_pixels(self, pixels):
+        '''Whether the NESTED pixels at the NSIDE of the mask are inside.'''
+        pixels = np.asarray(pixels, dtype=np.int64)
+        scalar = pixels.ndim == 0
+        pixels = np.atleast_1d(pixels)
+        state = self.coverage[pixels >> self._shift]
+        inside = state == FULL
+        partial = state >= 0
+        if partial.any():
+            sub = pixels[partial] & (self._chunk_size - 1)
+            bits = self.chunks[state[partial], sub >> 3]
+            inside[partial] = (bits >> (7 - (sub & 7)).astype(np.uint8)) & 1 == 1
+        return bool(inside[0]) if scalar else inside
+
+    def contains(self, ra, dec):
+        '''Whether the objects are inside the mask.
+
+        Parameters
+        ----------
+        ra: `float` or `np.array`
+            RA of the objects in degree.
+        dec: `float` or `np.array`
+            Dec of the objects in degree.
+
+        Returns
+        -------
+        inside: `bool` or `np.array`
+            Boolean mask of objects inside the footprint.
+
+        '''
+        import healpy as hp
+
+        with instrument.stage('sparse.ang2pix', rows_in=np.size(ra)):
+            pixels = hp.ang2pix(self.nside, ra, dec, nest=True, lonlat=True)
+        return self.contains_pixels(pixels)
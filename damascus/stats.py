@@ -0,0 +1,478 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Single-pass, mergeable summary statistics of the catalogs.
+
+`CatalogStats` groups the objects by a column (e.g. the Tractor `TYPE`) and keeps, for
+each group and each column (e.g. the fluxes, converted into magnitudes), the number of
+objects, the min/max, the mean & standard deviation, and a fixed-bin histogram that
+gives the percentiles and the number of objects brighter than a magnitude cut. The
+catalog is read once, and the statistics of different catalogs (or blocks of rows)
+are merged exactly, so the whole footprint can be summarized in parallel.
+
+Examples
+--------
+    >>> stats = batch_sweep_stats('/global/dr8/sweep', mask='s19a.fits', n_workers=32)
+    >>> stats.report()
+    >>> stats.total('FLUX_G').percentile([50, 90])
+    >>> stats.count_below('FLUX_G', 24.0, group='EXP')
+    >>> stats.save('dr8_s19a_stats.json')
+
+"""
+
+import os
+import json
+
+import numpy as np
+
+from . import io
+from . import utils
+from . import shared
+from . import instrument
+
+__all__ = ['MAG_EDGES', 'ColumnStats', 'CatalogStats', 'summarize', 'batch_sweep_stats']
+
+# Magnitude bins of the histograms: 0.02 mag from 10 to 35 mag
+MAG_EDGES = np.round(np.arange(10.0, 35.0 + 1e-9, 0.02), 2)
+
+FLUX_COLUMNS = ['FLUX_G', 'FLUX_R', 'FLUX_Z']
+
+
+class ColumnStats(object):
+    '''Mergeable statistics of the values of one column.
+
+    Parameters
+    ----------
+    edges: `np.array`
+        Edges of the histogram bins. The values below (above) the first (last) edge
+        are counted in the first (last) of the `len(edges) + 1` bins.
+
+    '''
+    def __init__(self, edges=MAG_EDGES):
+        self.edges = np.asarray(edges, dtype=float)
+        self.n = 0
+        self.n_invalid = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.mean = np.nan
+        self.m2 = 0.0
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+
+    def __repr__(self):
+        return "ColumnStats: {0.n:d} values, min={0.min:.3f}, max={0.max:.3f}".format(self)
+
+    def add(self, n, n_invalid, vmin, vmax, mean, m2, counts):
+        '''Add the statistics of a block of values.
+
+        `mean` and `m2` are the mean of the block and the sum of the squared deviations
+        from it; they are combined with the parallel algorithm of Chan et al. (1979).
+        '''
+        n, n_total = int(n), self.n + int(n)
+        if n > 0:
+            if self.n == 0:
+                self.mean, self.m2 = float(mean), float(m2)
+            else:
+                delta = float(mean) - self.mean
+                self.mean += delta * n / n_total
+                self.m2 += float(m2) + delta ** 2 * self.n * n / n_total
+        self.n = n_total
+        self.n_invalid += int(n_invalid)
+        self.min = min(self.min, float(vmin))
+        self.max = max(self.max, float(vmax))
+        self.counts += counts
+        return self
+
+    def update(self, values):
+        '''Add an array of values; the NaN and infinite values are only counted.'''
+        values = np.asarray(values, dtype=float).ravel()
+        valid = values[np.isfinite(values)]
+        if len(valid) == 0:
+            return self.add(0, len(values), np.inf, -np.inf, np.nan, 0.0, 0)
+        mean = valid.mean()
+        return self.add(
+            len(valid), len(values) - len(valid), valid.min(), valid.max(), mean,
+            ((valid - mean) ** 2).sum(),
+            np.bincount(np.searchsorted(self.edges, valid, side='right'),
+                        minlength=len(self.counts)))
+
+    def merge(self, other):
+        '''Add the statistics of another `ColumnStats` with the same bins.'''
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Can not merge statistics with different bins")
+        return self.add(other.n, other.n_invalid, other.min, other.max, other.mean,
+                        other.m2, other.counts)
+
+    def copy(self):
+        '''Independent copy of the statistics.'''
+        return ColumnStats(self.edges).merge(self)
+
+    @property
+    def std(self):
+        '''Standard deviation of the valid values.'''
+        return np.sqrt(self.m2 / self.n) if self.n else np.nan
+
+    def _bin_edges(self):
+        '''Lower and upper limits of all the bins, using min & max for the outer ones.'''
+        lower = np.concatenate([[min(self.min, self.edges[0])], self.edges])
+        upper = np.concatenate([self.edges, [max(self.max, self.edges[-1])]])
+        return lower, upper
+
+    def percentile(self, q):
+        '''Percentile(s) of the valid values, linearly interpolated inside the bins.
+
+        The precision is the width of the bins.
+        '''
+        q = np.asarray(q, dtype=float)
+        if not self.n:
+            return np.full(q.shape, np.nan) if q.ndim else np.nan
+        cumulative = np.cumsum(self.counts)
+        target = np.clip(q / 100.0, 0.0, 1.0) * self.n
+        index = np.minimum(np.searchsorted(cumulative, target, side='left'),
+                           len(self.counts) - 1)
+        lower, upper = self._bin_edges()
+        below = np.where(index > 0, cumulative[np.maximum(index - 1, 0)], 0)
+        fraction = (target - below) / np.maximum(self.counts[index], 1)
+        result = lower[index] + fraction * (upper[index] - lower[index])
+        return np.clip(result, self.min, self.max)
+
+    def count_below(self, value):
+        '''Approximate number of valid values smaller than `value`.'''
+        lower, upper = self._bin_edges()
+        fraction = np.clip((value - lower) / np.maximum(upper - lower, 1e-300), 0.0, 1.0)
+        return float((self.counts * fraction).sum())
+
+    def to_dict(self):
+        '''JSON-serializable form of the statistics.'''
+        return {'edges': self.edges.tolist(), 'n': self.n, 'n_invalid': self.n_invalid,
+                'min': self.min if self.n else None, 'max': self.max if self.n else None,
+                'mean': self.mean if self.n else None, 'm2': self.m2,
+                'counts': self.counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, stats):
+        '''Statistics from the output of `to_dict`.'''
+        return cls(stats['edges']).add(
+            stats['n'], stats['n_invalid'],
+            np.inf if stats['min'] is None else stats['min'],
+            -np.inf if stats['max'] is None else stats['max'],
+            np.nan if stats['mean'] is None else stats['mean'], stats['m2'],
+            np.asarray(stats['counts'], dtype=np.int64))
+
+
+class CatalogStats(object):
+    '''Mergeable statistics of the columns of a catalog, grouped by another column.
+
+    Parameters
+    ----------
+    columns: `list`, optional
+        Columns to summarize. Default: the g, r, z band fluxes.
+    by: `string`, optional
+        Column used to group the objects, e.g. "TYPE". None for no grouping.
+        Default: "TYPE"
+    zeropoint: `float` or `string`, optional
+        If provided, the values are fluxes and are converted into magnitudes with this
+        zeropoint ("decals", "hsc", or a number) before being summarized; non-positive
+        fluxes are counted as invalid. Default: "decals"
+    edges: `np.array`, optional
+        Edges of the histogram bins. Default: `MAG_EDGES`
+
+    '''
+    def __init__(self, columns=None, by='TYPE', zeropoint='decals', edges=MAG_EDGES):
+        self.columns = list(FLUX_COLUMNS if columns is None else columns)
+        self.by = by
+        self.zeropoint = zeropoint
+        self.edges = np.asarray(edges, dtype=float)
+        self.n_objects = 0
+        self.counts = {}
+        self.stats = {col: {} for col in self.columns}
+
+    def __repr__(self):
+        return "CatalogStats: {:d} objects in {:d} groups, columns: {:s}".format(
+            self.n_objects, len(self.counts), ', '.join(self.columns))
+
+    def _settings(self):
+        return (self.columns, self.by, self.zeropoint, self.edges.tolist())
+
+    def update(self, table):
+        '''Add the objects of a table (or of a block of rows) in one pass.
+
+        Parameters
+        ----------
+        table: `np.ndarray`, `astropy.io.fits.FITS_rec`, or mapping of arrays
+            The objects. Only needs to support `table[column]`.
+
+        '''
+        n_rows = len(table[self.columns[0] if self.by is None else self.by])
+        with instrument.stage('stats.update', rows_in=n_rows):
+            if self.by is None:
+                groups, inverse = np.array(['all']), np.zeros(n_rows, dtype=np.int64)
+            else:
+                groups, inverse = np.unique(np.asarray(table[self.by]), return_inverse=True)
+                inverse = inverse.ravel()
+            names = [group.decode().strip() if isinstance(group, bytes) else str(group).strip()
+                     for group in groups]
+            n_groups, n_bins = len(names), len(self.edges) + 1
+
+            self.n_objects += n_rows
+            for name, count in zip(names, np.bincount(inverse, minlength=n_groups)):
+                self.counts[name] = self.counts.get(name, 0) + int(count)
+
+            for col in self.columns:
+                values = np.asarray(table[col], dtype=float)
+                if self.zeropoint is not None:
+                    values = utils.flux_to_mag(values, zeropoint=self.zeropoint)
+                valid = np.isfinite(values)
+                group, values = inverse[valid], values[valid]
+
+                n_valid = np.bincount(group, minlength=n_groups)
+                mean = np.bincount(group, weights=values, minlength=n_groups) / np.maximum(
+                    n_valid, 1)
+                m2 = np.bincount(group, weights=(values - mean[group]) ** 2,
+                                 minlength=n_groups)
+                vmin = np.full(n_groups, np.inf)
+                vmax = np.full(n_groups, -np.inf)
+                np.minimum.at(vmin, group, values)
+                np.maximum.at(vmax, group, values)
+                bins = np.searchsorted(self.edges, values, side='right')
+                counts = np.bincount(group * n_bins + bins,
+                                     minlength=n_groups * n_bins).reshape(n_groups, n_bins)
+                n_all = np.bincount(inverse, minlength=n_groups)
+
+                for ii, name in enumerate(names):
+                    stats = self.stats[col].get(name)
+                    if stats is None:
+                        stats = self.stats[col][name] = ColumnStats(self.edges)
+                    stats.add(n_valid[ii], n_all[ii] - n_valid[ii], vmin[ii], vmax[ii],
+                              mean[ii], m2[ii], counts[ii])
+        return self
+
+    def merge(self, other):
+        '''Add the statistics of another catalog, computed with the same settings.'''
+        if self._settings() != other._settings():
+            raise ValueError("Can not merge statistics with different settings")
+        self.n_objects += other.n_objects
+        for name, count in other.counts.items():
+            self.counts[name] = self.counts.get(name, 0) + count
+        for col in self.columns:
+            for name, stats in other.stats[col].items():
+                if name in self.stats[col]:
+                    self.stats[col][name].merge(stats)
+                else:
+                    self.stats[col][name] = stats.copy()
+        return self
+
+    def __add__(self, other):
+        return self.copy().merge(other)
+
+    def copy(self):
+        '''Independent copy of the statistics.'''
+        return CatalogStats(self.columns, by=self.by, zeropoint=self.zeropoint,
+                            edges=self.edges).merge(self)
+
+    @property
+    def groups(self):
+        '''Names of the groups, e.g. the object types.'''
+        return sorted(self.counts)
+
+    def total(self, col):
+        '''Statistics of a column for all the groups together.'''
+        total = ColumnStats(self.edges)
+        for stats in self.stats[col].values():
+            total.merge(stats)
+        return total
+
+    def count_below(self, col, value, group=None):
+        '''Approximate number of objects with a value (magnitude) below `value`.'''
+        stats = self.total(col) if group is None else self.stats[col].get(group)
+        return 0.0 if stats is None else stats.count_below(value)
+
+    def report(self):
+        '''Print the number of objects and the median of each column per group.'''
+        print("# There are {:d} objects in the catalog".format(self.n_objects))
+        header = ''.join(" {:>9s}".format(col) for col in self.columns)
+        print("# {:8s} {:>10s}{:s}".format(self.by or '', 'number', header))
+        for name in self.groups:
+            medians = ''.join(
+                " {:9.3f}".format(float(self.stats[col][name].percentile(50)))
+                for col in self.columns)
+            print("# {:8s} {:10d}{:s}".format(name, self.counts[name], medians))
+
+    def to_dict(self):
+        '''JSON-serializable form of the statistics.'''
+        return {'columns': self.columns, 'by': self.by, 'zeropoint': self.zeropoint,
+                'edges': self.edges.tolist(), 'n_objects': self.n_objects,
+                'counts': self.counts,
+                'stats': {col: {name: {key: value for key, value in stats.to_dict().items()
+                                       if key != 'edges'}
+                                for name, stats in groups.items()}
+                          for col, groups in self.stats.items()}}
+
+    @classmethod
+    def from_dict(cls, summary):
+        '''Statistics from the output of `to_dict`.'''
+        result = cls(summary['columns'], by=summary['by'], zeropoint=summary['zeropoint'],
+                     edges=summary['edges'])
+        result.n_objects = summary['n_objects']
+        result.counts = dict(summary['counts'])
+        for col, groups in summary['stats'].items():
+            result.stats[col] = {
+                name: ColumnStats.from_dict(dict(stats, edges=summary['edges']))
+                for name, stats in groups.items()}
+        return result
+
+    def save(self, json_file):
+        '''Save the statistics to a JSON file.'''
+        with open(json_file, 'w') as output:
+            json.dump(self.to_dict(), output)
+
+    @classmethod
+    def load(cls, json_file):
+        '''Load the statistics from a JSON file.'''
+        with open(json_file, 'r') as summary:
+            return cls.from_dict(json.load(summary))
+
+
+def summarize(catalog, columns=None, by='TYPE', zeropoint='decals', edges=MAG_EDGES,
+              mask=None, ra='RA', dec='DEC', chunk_rows=None):
+    '''Statistics of a catalog in a single pass over the columns that are needed.
+
+    Parameters
+    ----------
+    catalog: `damascus.catalog.Catalog`, `np.ndarray`, or string
+        The catalog object, a table, or the path to a FITS catalog.
+    columns: `list`, optional
+        Columns to summarize. Default: the g, r, z band fluxes.
+    by: `string`, optional
+        Column used to group the objects. Default: "TYPE"
+    zeropoint: `float` or `string`, optional
+        Zeropoint to convert the fluxes into magnitudes, None to use the values as they
+        are. Default: "decals"
+    edges: `np.array`, optional
+        Edges of the histogram bins. Default: `MAG_EDGES`
+    mask: `damascus.hsc.FDFCMask` or string, optional
+        Only summarize the objects inside this Healpix mask. Default: None
+    ra: `string`, optional
+        Column name for RA when the catalog is a table. Default: "RA"
+    dec: `string`, optional
+        Column name for Dec when the catalog is a table. Default: "DEC"
+    chunk_rows: `int`, optional
+        Read the catalog in blocks of this many rows. Default: None
+
+    Returns
+    -------
+    stats: `CatalogStats`
+        Mergeable statistics.
+
+    '''
+    from .catalog import Catalog
+    from . import hsc
+
+    stats = CatalogStats(columns, by=by, zeropoint=zeropoint, edges=edges)
+    if isinstance(catalog, str):
+        catalog = Catalog(catalog, ra=ra, dec=dec)
+    if isinstance(mask, str):
+        mask = hsc.FDFCMask.read(mask)
+
+    if not isinstance(catalog, Catalog):
+        tables = [catalog]
+        ra_col, dec_col = ra, dec
+    else:
+        ra_col, dec_col = catalog.ra_col, catalog.dec_col
+        use = stats.columns + ([] if by is None else [by]) + (
+            [] if mask is None else [ra_col, dec_col])
+        use = list(dict.fromkeys(use))
+        if chunk_rows is not None:
+            tables = catalog.iter_chunks(chunk_rows=chunk_rows, columns=use)
+        else:
+            tables = [{col: catalog.get_column(col) for col in use}]
+
+    for table in tables:
+        if mask is not None:
+            inside = mask.contains(np.asarray(table[ra_col]), np.asarray(table[dec_col]))
+            table = {col: np.asarray(table[col])[inside] for col in (
+                stats.columns + ([] if by is None else [by]))}
+        stats.update(table)
+    return stats
+
+
+_STATS_KWARGS = {}
+
+
+def _init_stats_worker(kwargs):
+    '''Keep the parameters (and mask) of `summarize` in the worker process.'''
+    _STATS_KWARGS.clear()
+    _STATS_KWARGS.update(shared.attach(kwargs))
+
+
+def _sweep_stats_worker(sweep_cat):
+    '''Statistics of one sweep inside a worker process.'''
+    from .sweep import SweepCatalog
+    return sweep_cat, summarize(SweepCatalog(sweep_cat), **_STATS_KWARGS)
+
+
+def batch_sweep_stats(sweeps, pattern='sweep-*.fits', n_workers=None, mask=None,
+                      shared_memory=True, verbose=True, **kwargs):
+    '''Statistics of many Sweep catalogs, computed in parallel and merged.
+
+    Parameters
+    ----------
+    sweeps: `list` or `string`
+        List of paths to the Sweep catalogs, or the directory that contains them.
+    pattern: `string`, optional
+        Pattern used to find the Sweep catalogs when `sweeps` is a directory.
+        Default: "sweep-*.fits"
+    n_workers: `int`, optional
+        Number of worker processes. Default: number of CPUs.
+    mask: `damascus.hsc.FDFCMask` or string, optional
+        Only summarize the objects inside this Healpix mask. Default: None
+    shared_memory: `bool` or `string`, optional
+        Place the mask in shared memory once and attach it in the workers without a
+        copy. A directory uses a memory-mapped file there instead. Default: True
+    verbose: `bool`, optional
+        Announce progress. Default: True
+    **kwargs:
+        Other parameters passed to `summarize`.
+
+    Returns
+    -------
+    stats: `CatalogStats`
+        Statistics of all the Sweep catalogs.
+
+    '''
+    from . import hsc
+
+    if isinstance(sweeps, str):
+        sweeps = sorted(io.find_files(sweeps, pattern, verbose=verbose))
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    n_workers = max(1, min(n_workers, len(sweeps)))
+
+    # Read the mask only once instead of once per Sweep catalog
+    if isinstance(mask, str):
+        mask = hsc.FDFCMask.read(mask)
+    kwargs['mask'] = mask
+    result = CatalogStats(kwargs.get('columns'), by=kwargs.get('by', 'TYPE'),
+                          zeropoint=kwargs.get('zeropoint', 'decals'),
+                          edges=kwargs.get('edges', MAG_EDGES))
+
+    if n_workers == 1:
+        _init_stats_worker(kwargs)
+        return _reduce_stats(map(_sweep_stats_worker, sweeps), result, len(sweeps),
+                             verbose=verbose)
+
+    import multiprocessing
+    with shared.share_initargs((kwargs,), shared_memory) as initargs, \
+            multiprocessing.Pool(processes=n_workers, initializer=_init_stats_worker,
+                                 initargs=initargs) as pool:
+        stats_iter = instrument.merged(pool.imap_unordered(
+            instrument.worker(_sweep_stats_worker), sweeps, chunksize=1))
+        return _reduce_stats(stats_iter, result, len(sweeps), verbose=verbose)
+
+
+def _reduce_stats(stats_iter, result, n_sweeps, verbose=True):
+    '''Merge the statistics of each sweep as soon as they are ready.'''
+    for ii, (sweep_cat, stats) in enumerate(stats_iter):
+        if verbose:
+            print("# {:d}/{:d} {:s}: {:d} objects".format(
+                ii + 1, n_sweeps, os.path.split(sweep_cat)[-1], stats.n_objects))
+        result.merge(stats)
+    return result
@@ -12,21 +12,22 @@ Please see:
 """
 
 import os
-import copy
-import random
-import operator
+import itertools
+import collections
 
 import numpy as np
 
-from matplotlib import path
-
-from astropy.io import fits
-
+from . import io
 from . import hsc
 from . import utils
-from . import shape
+from . import query
+from . import shared
+from . import instrument
+from .cache import ResultCache
+from .catalog import Catalog
 
-__all__ = ['sweep_to_box', 'sweep_bright_galaxy_match', 'SweepCatalog']
+__all__ = ['sweep_to_box', 'sweep_bright_galaxy_match', 'batch_sweep_bright_galaxy_match',
+           'iter_prefetch', 'SweepCatalog']
 
 
 def sweep_to_box(sweep_name):
@@ -60,35 +61,62 @@ def sweep_to_box(sweep_name):
 
 
 def sweep_bright_galaxy_match(sweep_cat, mask=None, no_dup=True, no_rex=False,
-                              g_mag=24.0, r_mag=23.0, z_mag=23.0, verbose=True):
+                              g_mag=24.0, r_mag=23.0, z_mag=23.0, columns=None,
+                              cache_dir=None, chunk_rows=None, cache=None, verbose=True):
     ''' Select bright extended sources in the Sweep catalog to match with HSC.
+
+    When a list of `columns` is provided, only these columns (plus the ones used by the
+    selection) are read from the Sweep catalog and kept in the output. When `cache_dir`
+    is provided, the columnar cache of the Sweep catalog is used if available. When
+    `chunk_rows` is provided, the catalog is processed in blocks of this many rows, so
+    the memory usage does not depend on the size of the catalog; in this mode None is
+    returned if no object is selected. When a `damascus.cache.ResultCache` (or its
+    directory) is provided as `cache`, the type selection and the mask are only applied
+    once per sweep, and the magnitude cuts are applied to the cached result.
     '''
-    # Read the Sweep catalog
-    assert os.path.isfile(sweep_cat), FileNotFoundError(
-        "Can not find catalog: {:s}".format(sweep_cat))
-    sweep_obj = SweepCatalog(sweep_cat, read_in=True)
+    if isinstance(sweep_cat, SweepCatalog):
+        # Already opened and loaded, e.g. read ahead by `iter_prefetch`
+        sweep_obj, sweep_cat = sweep_cat, sweep_cat.path
+    else:
+        # Read the Sweep catalog
+        assert os.path.exists(sweep_cat), FileNotFoundError(
+            "Can not find catalog: {:s}".format(sweep_cat))
+        if cache is not None:
+            return _cached_bright_galaxy_match(
+                sweep_cat, cache, mask=mask, no_dup=no_dup, no_rex=no_rex, g_mag=g_mag,
+                r_mag=r_mag, z_mag=z_mag, columns=columns, cache_dir=cache_dir,
+                chunk_rows=chunk_rows, verbose=verbose)
+        sweep_obj = SweepCatalog(
+            sweep_cat, read_in=(chunk_rows is None), cache_dir=cache_dir,
+            columns=_match_columns(columns, g_mag=g_mag, r_mag=r_mag, z_mag=z_mag))
     if verbose:
         print("\n# Dealing with Sweep catalog: {:s}".format(sweep_cat))
 
     # Remove point sources
-    sweep_obj.select('TYPE', '!=', 'PSF', verbose=False)
+    rules = [('TYPE', '!=', 'PSF')]
     # Remove SUP type object
     if no_dup:
-        sweep_obj.select('TYPE', '!=', 'DUP', verbose=False)
+        rules.append(('TYPE', '!=', 'DUP'))
     # Remove barely resolved objects
     if no_rex:
-        sweep_obj.select('TYPE', '!=', 'REX', verbose=False)
+        rules.append(('TYPE', '!=', 'REX'))
 
     # Make flux cut in different bands
-    if g_mag is not None:
-        flux_g_lim = utils.mag_to_flux(g_mag, zeropoint=22.5)
-        sweep_obj.select('FLUX_G', '>=', flux_g_lim, verbose=False)
-    if r_mag is not None:
-        flux_r_lim = utils.mag_to_flux(r_mag, zeropoint=22.5)
-        sweep_obj.select('FLUX_R', '>=', flux_r_lim, verbose=False)
-    if z_mag is not None:
-        flux_z_lim = utils.mag_to_flux(z_mag, zeropoint=22.5)
-        sweep_obj.select('FLUX_Z', '>=', flux_z_lim, verbose=False)
+    rules += _flux_rules(g_mag=g_mag, r_mag=r_mag, z_mag=z_mag)
+
+    if chunk_rows is not None:
+        # Streaming pipeline: selection and mask are applied to each block
+        chunks = list(sweep_obj.iter_select(*rules, mask=mask, chunk_rows=chunk_rows))
+        gal_match = np.concatenate(chunks) if chunks else None
+        if verbose:
+            print("There are {:d} objects selected".format(
+                0 if gal_match is None else len(gal_match)))
+        return gal_match
+
+    # Evaluate all the cuts in one pass
+    with instrument.stage('sweep.match_select', rows_in=len(sweep_obj.data)) as timer:
+        sweep_obj.data_use = sweep_obj.where(*rules).fetch()
+        timer.rows_out = len(sweep_obj.data_use)
 
     if verbose:
         print("There are {:d} objects left after the selection".format(len(sweep_obj.data_use)))
@@ -106,171 +134,342 @@ def sweep_bright_galaxy_match(sweep_cat, mask=None, no_dup=True, no_rex=False,
         return sweep_obj.data_use
 
 
-class SweepCatalog(object):
-    '''A class to deal with DECaLS sweep catalog
+def _match_columns(columns, g_mag=24.0, r_mag=23.0, z_mag=23.0):
+    ''' Column projection of `sweep_bright_galaxy_match`: the output columns plus the
+    ones used by the selection.
+    '''
+    if columns is None:
+        return None
+    return list(columns) + ['TYPE'] + [
+        'FLUX_' + band for band, mag in zip('GRZ', [g_mag, r_mag, z_mag])
+        if mag is not None]
+
+
+def iter_prefetch(sweeps, read_ahead=2, columns=None, cache_dir=None):
+    ''' Iterate over the Sweep catalogs while the next ones are read in the background.
 
-    Attributes
+    A pool of `read_ahead` threads opens and loads the next `read_ahead` catalogs into
+    memory while the current one is processed, so the selection does not wait for the
+    file system. At most `read_ahead + 1` catalogs are kept in memory.
+
+    Parameters
     ----------
-    attrib1
-        description
+    sweeps: `list`
+        List of paths to the Sweep catalogs.
+    read_ahead: `int`, optional
+        Number of catalogs read ahead. Default: 2
+    columns: `list`, optional
+        Only read these columns. Default: None
+    cache_dir: `string`, optional
+        Directory of the columnar cache. Default: None
+
+    Yields
+    ------
+    sweep_cat: `string`
+        Path to the Sweep catalog.
+    sweep_obj: `SweepCatalog`
+        The loaded catalog, or None if it could not be read; read it again in the
+        main thread to get the error.
 
-    Examples
-    --------
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+
+    def _read(sweep_cat):
+        try:
+            sweep_obj = SweepCatalog(sweep_cat, columns=columns, cache_dir=cache_dir)
+            sweep_obj.load(in_memory=True)
+            return sweep_obj
+        except Exception:
+            return None
+
+    sweeps = iter(sweeps)
+    with ThreadPoolExecutor(max_workers=max(1, read_ahead)) as pool:
+        pending = collections.deque(
+            (sweep_cat, pool.submit(_read, sweep_cat))
+            for sweep_cat in itertools.islice(sweeps, max(1, read_ahead)))
+        while pending:
+            sweep_cat, future = pending.popleft()
+            for next_cat in itertools.islice(sweeps, 1):
+                pending.append((next_cat, pool.submit(_read, next_cat)))
+            yield sweep_cat, future.result()
+
+
+def _prefetched(sweeps, read_ahead, kwargs):
+    ''' (sweep, catalog read ahead or None) pairs for the serial batch functions.
+
+    The sweeps are not read ahead in the cached and the block-by-block modes, which
+    do not load the whole catalog.
+    '''
+    if not read_ahead or kwargs.get('cache') is not None or (
+            kwargs.get('chunk_rows') is not None):
+        return ((sweep_cat, None) for sweep_cat in sweeps)
+    columns = _match_columns(kwargs.get('columns'), **{
+        key: kwargs[key] for key in ('g_mag', 'r_mag', 'z_mag') if key in kwargs})
+    return iter_prefetch(sweeps, read_ahead=read_ahead, columns=columns,
+                         cache_dir=kwargs.get('cache_dir'))
+
+
+def _flux_rules(g_mag=None, r_mag=None, z_mag=None):
+    ''' Selection rules of the magnitude limits in g, r, z bands.
+
+    The limits are converted into fluxes once, so the cuts are applied to the flux
+    columns directly without computing the magnitude of each object.
+    '''
+    limits = [(band, mag) for band, mag in zip('GRZ', [g_mag, r_mag, z_mag])
+              if mag is not None]
+    if not limits:
+        return []
+    flux_lims = utils.mag_to_flux(
+        np.array([mag for _, mag in limits], dtype=float), zeropoint='decals')
+    rules = [('FLUX_' + band, '>=', float(flux_lim))
+             for (band, _), flux_lim in zip(limits, flux_lims)]
+    return rules
+
+
+def _cached_bright_galaxy_match(sweep_cat, cache, mask=None, no_dup=True, no_rex=False,
+                                g_mag=24.0, r_mag=23.0, z_mag=23.0, columns=None,
+                                verbose=True, **kwargs):
+    ''' `sweep_bright_galaxy_match` with the magnitude-independent part cached on disk.
+
+    The objects that pass the type selection and the mask are cached with the key of
+    (sweep file, `no_dup`, `no_rex`, `columns`, mask), so changing the magnitude limits
+    does not read the Sweep catalog again.
+    '''
+    if isinstance(cache, str):
+        cache = ResultCache(cache)
+    if columns is not None:
+        columns = list(columns) + ['FLUX_G', 'FLUX_R', 'FLUX_Z']
+
+    key = cache.key(
+        sweep_cat, {'no_dup': no_dup, 'no_rex': no_rex, 'columns': columns}, mask=mask)
+    found, gal_base = cache.get(key)
+    if not found:
+        gal_base = sweep_bright_galaxy_match(
+            sweep_cat, mask=mask, no_dup=no_dup, no_rex=no_rex, g_mag=None, r_mag=None,
+            z_mag=None, columns=columns, verbose=False, **kwargs)
+        if gal_base is not None:
+            gal_base = query.project(gal_base, list(gal_base.dtype.names))
+        cache.put(key, gal_base)
+
+    if verbose:
+        print("\n# Dealing with Sweep catalog: {:s} ({:s})".format(
+            sweep_cat, 'cached' if found else 'new'))
+    if gal_base is None:
+        return None
+
+    rules = _flux_rules(g_mag=g_mag, r_mag=r_mag, z_mag=z_mag)
+    gal_match = query.Query(gal_base, rules).fetch()
+    if verbose:
+        print("There are {:d} objects selected".format(len(gal_match)))
+    if mask is not None and len(gal_match) == 0:
+        return None
+    return gal_match
+
+
+_BATCH_KWARGS = {}
+
+
+def _init_batch_worker(kwargs):
+    '''Keep the shared selection parameters (and mask) in the worker process.'''
+    _BATCH_KWARGS.clear()
+    _BATCH_KWARGS.update(shared.attach(kwargs))
+
+
+def _sweep_bright_galaxy_match_worker(sweep_cat, sweep_obj=None):
+    '''Run `sweep_bright_galaxy_match` on one sweep inside a worker process.'''
+    return sweep_cat, sweep_bright_galaxy_match(
+        sweep_cat if sweep_obj is None else sweep_obj, **_BATCH_KWARGS)
+
+
+def batch_sweep_bright_galaxy_match(sweeps, mask=None, pattern='sweep-*.fits', n_workers=None,
+                                    output=None, shared_memory=True, read_ahead=0,
+                                    verbose=True, **kwargs):
+    '''Select bright extended sources in a list of Sweep catalogs in parallel.
+
+    Parameters
+    ----------
+    sweeps: `list` or `string`
+        List of paths to the Sweep catalogs, or the directory that contains them.
+    mask: `string` or `damascus.hsc.FDFCMask`, optional
+        Path to the FITS format Healpix mask file, or the mask object. The mask is
+        only read once and shared by all the workers. Default: None
+    pattern: `string`, optional
+        Pattern used to find the Sweep catalogs when `sweeps` is a directory.
+        Default: "sweep-*.fits"
+    n_workers: `int`, optional
+        Number of worker processes. Default: number of CPUs.
+    output: `string`, optional
+        Path to the output FITS catalog. Default: None
+    shared_memory: `bool` or `string`, optional
+        Place the mask in shared memory once and attach it in the workers without a
+        copy. A directory uses a memory-mapped file there instead. Default: True
+    read_ahead: `int`, optional
+        With one worker, read this many Sweep catalogs ahead in background threads
+        while the current one is processed. See `iter_prefetch`. Default: 0
+    verbose: `bool`, optional
+        Announce progress. Default: True
+    **kwargs:
+        Other selection parameters passed to `sweep_bright_galaxy_match`.
+
+    Returns
+    -------
+    matched: `astropy.io.fits.FITS_rec`
+        Concatenated catalog of the selected objects from all the Sweep catalogs.
+        Will return None if no object is selected.
 
     Notes
     -----
+        The results from each Sweep catalog are collected in the same order as the
+        input list as soon as the worker is done with it.
 
     '''
-    def __init__(self, catalog, read_in=False, suffix=None):
+    if isinstance(sweeps, str):
+        sweeps = sorted(io.find_files(sweeps, pattern, verbose=verbose))
+
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    n_workers = max(1, min(n_workers, len(sweeps)))
+
+    # Read the mask only once instead of once per Sweep catalog
+    if isinstance(mask, str):
+        mask = hsc.FDFCMask.read(mask)
+    kwargs.update({'mask': mask, 'verbose': False})
+
+    if n_workers == 1:
+        _init_batch_worker(kwargs)
+        matched_iter = itertools.starmap(
+            _sweep_bright_galaxy_match_worker, _prefetched(sweeps, read_ahead, kwargs))
+        results = _collect_matched(matched_iter, len(sweeps), verbose=verbose)
+    else:
+        import multiprocessing
+        with shared.share_initargs((kwargs,), shared_memory) as initargs, \
+                multiprocessing.Pool(processes=n_workers, initializer=_init_batch_worker,
+                                     initargs=initargs) as pool:
+            matched_iter = instrument.merged(pool.imap(
+                instrument.worker(_sweep_bright_galaxy_match_worker), sweeps, chunksize=1))
+            results = _collect_matched(matched_iter, len(sweeps), verbose=verbose)
+
+    if not results:
+        if verbose:
+            print("# No matched object found!")
+        return None
+
+    from astropy.io import fits
+    matched = fits.BinTableHDU(data=np.concatenate(results))
+    if verbose:
+        print("# There are {:d} objects selected from {:d} Sweep catalogs".format(
+            len(matched.data), len(sweeps)))
+
+    if output is not None:
+        matched.writeto(output, overwrite=True)
+
+    return matched.data
+
+
+def _collect_matched(matched_iter, n_sweeps, verbose=True):
+    '''Gather the non-empty results of each Sweep catalog as plain record arrays.'''
+    results = []
+    for ii, (sweep_cat, gal_match) in enumerate(matched_iter):
+        n_match = 0 if gal_match is None else len(gal_match)
+        if verbose:
+            print("# {:d}/{:d} {:s}: {:d} objects".format(
+                ii + 1, n_sweeps, os.path.split(sweep_cat)[-1], n_match))
+        if n_match > 0:
+            results.append(io.decode_table(gal_match))
+    return results
+
+
+class SweepCatalog(Catalog):
+    '''A class to deal with DECaLS sweep catalog
+
+    The reading, selection, and coverage machinery is shared with the other surveys
+    through `damascus.catalog.Catalog`; this adapter adds the RA, Dec box of the sweep
+    and the Tractor object types.
+
+    Examples
+    --------
+        >>> sweep = SweepCatalog('sweep-150p000-160p005.fits', columns=['TYPE', 'FLUX_R'])
+        >>> gal = sweep.where(sweep.col('TYPE') != 'PSF', ('FLUX_R', '>', 1.0)).fetch()
+
+    '''
+    def __init__(self, catalog, read_in=False, suffix=None, columns=None, cache_dir=None,
+                 hull_dir=None):
         '''Initialize a SweepCatalog object.
 
         Parameters
         ----------
         catalog: `str`
-            Path to the FITS format sweep catalog.
+            Path to the FITS format sweep catalog, or to its columnar cache made by
+            `damascus.io.fits_to_columnar`.
         read_in: `bool`
             Read in the catalog immediately.
+        suffix: `str`, optional
+            Suffix to remove from the file name to get the name of the sweep.
+        columns: `list`, optional
+            Only read these columns into `data`. `RA` and `DEC` are always included.
+            The other columns can still be read on demand using `get_column`.
+            Default: None, use all the columns.
+        cache_dir: `str`, optional
+            Directory of the columnar cache. If the sweep catalog has been converted
+            there, it is read from the cache instead of the FITS file. Default: None
+        hull_dir: `str`, optional
+            Directory where the hulls of the object distribution are persisted.
+            Default: None
 
         Notes
         -----
-            Will try to read the catalog using `astropy.fits` in `memap=True` mode.
+            Will try to read the catalog using `astropy.fits` in `memap=True` mode, or
+            memory-map the `.npy` files of the columnar cache.
 
         '''
-        self._catalog_path = catalog
-        self._catalog_name = os.path.split(catalog)[-1]
+        catalog_name = os.path.split(os.path.normpath(catalog))[-1]
         if suffix is not None and isinstance(suffix, str):
-            self.sweep_name = self._catalog_name.replace(suffix, '')
+            self.sweep_name = catalog_name.replace(suffix, '')
         else:
-            self.sweep_name = self._catalog_name
+            self.sweep_name = catalog_name
 
-        assert os.path.isfile(catalog), FileNotFoundError("Cannot find the sweep catalog!")
-
-        # Get the RA, Dec coordinates of the vertices
+        # Get the RA, Dec coordinates of the vertices, and the box only once
         self._vertices = sweep_to_box(self.sweep_name)
+        self._ra_min, self._dec_min = [float(value) for value in self._vertices.min(axis=0)]
+        self._ra_max, self._dec_max = [float(value) for value in self._vertices.max(axis=0)]
 
-        # Open the FITS file
-        self._hdu_list = self.open()
-        self.header = self._hdu_list[1].header
-        self._columns = self._get_columns()
-
-        # Read the catalog data.
-        self.data = None
-        self.obj_ra_range = None
-        self.obj_dec_range = None
-        if read_in:
-            self.load()
-
-        # Placeholder for selected objects
-        self.data_use = None
-        self.obj_concave = None
-        self.obj_convex = None
+        super(SweepCatalog, self).__init__(
+            catalog, read_in=read_in, columns=columns, cache_dir=cache_dir, ra='RA',
+            dec='DEC', hull_dir=hull_dir)
 
     def __repr__(self):
         return "Sweep Catalog: {0._catalog_name:s}".format(self)
 
-    def open(self):
-        ''' Open the FITS file as a HUDList.
-        '''
-        return fits.open(self._catalog_path, memmap=True)
+    def demography(self, verbose=True, chunk_rows=None, **kwargs):
+        ''' Demography of different types of objects in the catalog.
 
-    def load(self):
-        ''' Read in the FITS catalog as FITS record.
-        '''
-        self.data = self._hdu_list[1].data
-        self.obj_ra_range = [self.data['RA'].min(), self.data['RA'].max()]
-        self.obj_dec_range = [self.data['DEC'].min(), self.data['DEC'].max()]
-
-    def close(self):
-        ''' Close the HDUList of the FITS file.
-        '''
-        self._hdu_list.close()
-
-    def _get_columns(self):
-        ''' Get the columns names of the Sweep catalog.
-        '''
-        cards = np.asarray(self.header.cards)[:, 0]
-        return [self.header[key] for key in cards[
-            np.asarray(['TTYPE' in card for card in cards])]]
-
-    def has_column(self, col):
-        ''' Check whether the catalog has certain column.
+        The object types and the g, r, z band magnitudes are summarized in one pass over
+        these columns. The result can be merged with the ones of other sweeps, see
+        `damascus.stats.batch_sweep_stats`.
 
         Parameters
         ----------
-        col: `string`
-            Name of the column to check.
+        verbose: `bool`, optional
+            Print the number of objects of each type. Default: True
+        chunk_rows: `int`, optional
+            Read the catalog in blocks of this many rows. Default: None
+        **kwargs:
+            Other parameters passed to `damascus.stats.summarize`.
 
         Returns
         -------
-        has_column: `bool`
-            Whether the column is in the catalog or not.
-
-        '''
-        return col.upper().strip() in self.columns
+        stats: `damascus.stats.CatalogStats`
+            Counts and magnitude statistics of each object type.
 
-    def demography(self):
-        ''' Show the demography of different types of objects in the catalog.
         '''
-        if self.data is None:
-            self.load()
-        print("# There are {:d} objects in the catalog".format(len(self.data)))
-        for obj_type in self.types:
-            print("# {:s}: {:d}".format(
-                obj_type, self.select('TYPE', '==', obj_type, only_number=True)))
-
-    def select(self, col, oper, value, update=True, verbose=False, only_mask=False,
-               only_number=False):
-        ''' Select a sub-sample of objects according to certain rule.
-
-        Parameters
-        ----------
-        col: `string`
-            Name of the column used for selection.
-        oper: `string`
-            String representation of the operator. Allowed ones include
-            `[">", "<", ">=", "<=", "==", "!=']`
-        value:
-            Selection criteria.
-        verbose: `boolen`, optional
-            Show the number of selected objectss. Default: False
-        only_number: `boolen`, optional
-            Only return the number of selected objects.
-        only_number: `boolen`, optional
-            Only return the object mask.
-        update: `boolen`, optional
-            If `True`, will update the `data_use` attribute in new selection.
-            Otherwise will start again from the original `data`.
-
-        Note
-        ----
-            Will update the `self.data_use` attribute when `only_number=False`.
-
-        '''
-        # Check to make sure the column is available
-        col = col.upper().strip()
-        assert col in self._columns, KeyError("Wrong column name!")
-
-        opers_dict = {
-            '>': operator.gt, '<': operator.lt,
-            '>=': operator.ge, '<=': operator.le,
-            '==': operator.eq, '!=': operator.ne}
-        if self.data_use is None or not update:
-            mask = opers_dict[oper.strip()](self.data[col], value)
-        else:
-            mask = opers_dict[oper.strip()](self.data_use[col], value)
-
-        if only_mask:
-            return mask
+        from . import stats
 
+        summary = stats.summarize(self, chunk_rows=chunk_rows, **kwargs)
         if verbose:
-            print("{:s} {:s} {:s} selects {:d} objects".format(col, oper, str(value), mask.sum()))
-        if only_number:
-            return mask.sum()
-
-        if self.data_use is None or not update:
-            self.data_use = copy.deepcopy(self.data)[mask]
-        else:
-            self.data_use = self.data_use[mask]
+            print("# There are {:d} objects in the catalog".format(summary.n_objects))
+            for obj_type in summary.groups:
+                print("# {:s}: {:d}".format(obj_type, summary.counts[obj_type]))
+        return summary
 
     def cover(self, ra, dec, in_convex=False, in_concave=False):
         ''' Find out is the object covered or how many objects are covered in this sweep.
@@ -294,99 +493,13 @@ class SweepCatalog(object):
              Whether the object is covered, or a boolen mask for overlapped objects.
 
         '''
-        if not np.isscalar(ra):
-            assert len(ra) == len(dec), "RA & Dec array should have the same size."
-
         if not in_concave and not in_convex:
-            return ((ra >= self.ra_min) & (ra < self.ra_max) &
-                    (dec >= self.dec_min) & (dec < self.dec_max))
-        elif in_convex:
-            if self.obj_convex is None:
-                convex = path.Path(self.convex_hull())
-            else:
-                convex = path.Path(self.obj_convex)
-            if np.isscalar(ra):
-                return convex.contains_point([ra, dec])
-            else:
-                return convex.contains_points(np.vstack([ra, dec]).T)
-        elif in_concave:
-            if self.obj_concave is None:
-                concave = path.Path(self.concave_hull())
-            else:
-                concave = path.Path(self.obj_concave)
-            if np.isscalar(ra):
-                return concave.contains_point([ra, dec])
-            else:
-                return concave.contains_points(np.vstack([ra, dec]).T)
-        else:
-            raise Exception("You should only set either in_concave or in_convex = True")
-
-    def healpix_mask(self, mask_file, nest=True, verbose=False):
-        '''Match the catalog to a Healpix mask.
-
-        Parameters
-        ----------
-        mask_file: `string`
-            Path to the FITS format Healpix mask file.
-
-        Returns
-        -------
-        matched: `np.recarray`
-            Numpy array for the matched objects.
-        nest: bool, optional
-            If True, assume NESTED pixel ordering, otherwise, RING pixel ordering.
-            Default: True
-        verbose: bool, optional
-            Annouce progress. Default: False
-
-        '''
-        if self.data_use is None:
-            return hsc.filter_hsc_fdfc_mask(
-                self.data, mask_file, ra='RA', dec='DEC', nest=nest, verbose=verbose)
-        return hsc.filter_hsc_fdfc_mask(
-            self.data_use, mask_file, ra='RA', dec='DEC', nest=nest, verbose=verbose)
-
-    def convex_hull(self):
-        '''Get the convex hull of the object distribution.
-        '''
-        if self.data is None:
-            self.load()
-        self.obj_convex = shape.convex_hull(
-            np.vstack([self.data['RA'], self.data['DEC']]).T)
-        return self.obj_convex
-
-    def concave_hull(self, alpha=0.1, n_samples=10000):
-        '''Get the concave hull of the object distribution.
-
-        Note
-        ----
-            This is not perfect yet. Since we need to use random points, the
-            accuracy is not always great.
-
-        '''
-        if self.data is None:
-            self.load()
-        points = np.vstack([self.data['RA'], self.data['DEC']]).T
-
-        if len(points) <= n_samples:
-            points_use = points
-        else:
-            points_use = np.asarray(random.choices(points, k=n_samples))
-
-        self.obj_concave = shape.concave_hull(points_use, alpha=alpha)
-        return self.obj_concave
-
-    @property
-    def path(self):
-        '''Path to the Sweep catalog.
-        '''
-        return self._catalog_path
-
-    @property
-    def name(self):
-        '''Get the file name of the Sweep catalog.
-        '''
-        return self._catalog_name
+            if not np.isscalar(ra):
+                assert len(ra) == len(dec), "RA & Dec array should have the same size."
+            return ((ra >= self._ra_min) & (ra < self._ra_max) &
+                    (dec >= self._dec_min) & (dec < self._dec_max))
+        return super(SweepCatalog, self).cover(
+            ra, dec, in_convex=in_convex, in_concave=in_concave)
 
     @property
     def vertices(self):
@@ -398,25 +511,25 @@ class SweepCatalog(object):
     def ra_min(self):
         '''Get the minimum RA.
         '''
-        return self._vertices.min(axis=0)[0]
+        return self._ra_min
 
     @property
     def ra_max(self):
-        '''Get the minimum RA.
+        '''Get the maximum RA.
         '''
-        return self._vertices.max(axis=0)[0]
+        return self._ra_max
 
     @property
     def dec_min(self):
         '''Get the minimum Dec.
         '''
-        return self._vertices.min(axis=0)[1]
+        return self._dec_min
 
     @property
     def dec_max(self):
-        '''Get the minimum Dec.
+        '''Get the maximum Dec.
         '''
-        return self._vertices.max(axis=0)[1]
+        return self._dec_max
 
     @property
     def ra_range(self):
@@ -430,12 +543,6 @@ class SweepCatalog(object):
         '''
         return [self.dec_min, self.dec_max]
 
-    @property
-    def columns(self):
-        '''Get the list of column names of the catalog.
-        '''
-        return self._columns
-
     @property
     def types(self):
         '''Show the unique object types in this catalog.
@@ -443,4 +550,4 @@ class SweepCatalog(object):
         if self.data is None:
             print("Please load the catalog data in first...")
             return None
-        return np.unique(self.data['TYPE'])
+        return np.unique(self.get_column('TYPE'))
@@ -4,19 +4,233 @@
 
 import numpy as np
 
-__all__ = ['mag_to_flux', 'flux_to_mag', 'e1_e2_to_shape']
+__all__ = ['mag_to_flux', 'flux_to_mag', 'flux_to_mag_err', 'flux_to_asinh_mag',
+           'flux_to_asinh_mag_err', 'photometry', 'e1_e2_to_shape']
 
+# 2.5 / ln(10): converts the relative flux error into magnitude error
+MAG_ERR_COEF = 2.5 / np.log(10.0)
 
-def mag_to_flux(mag, zeropoint=27.0):
+# Softening parameter of the asinh magnitude in unit of the flux error
+ASINH_SOFTENING = 1.042
+
+# Floating point errors of the masked-out elements
+_IGNORE = {'divide': 'ignore', 'invalid': 'ignore', 'over': 'ignore'}
+
+
+def _zeropoint(zeropoint):
+    """Photometric zeropoint, also accepts the name of the survey: "hsc" or "decals".
+    """
+    if isinstance(zeropoint, str):
+        if zeropoint.lower() == 'hsc':
+            from .hsc import HSC_ZP
+            return HSC_ZP
+        if zeropoint.lower() == 'decals':
+            from .decals import DECALS_ZP
+            return DECALS_ZP
+        raise ValueError("# Wrong zeropoint: [hsc|decals] or a number")
+    return zeropoint
+
+def _output(values, out):
+    """Output buffer of the same shape as the input, float32 is kept as float32.
+    """
+    if out is not None:
+        return out
+    dtype = values.dtype if values.dtype.kind == 'f' else np.float64
+    return np.empty(values.shape, dtype=dtype)
+
+def _result(out, scalar):
+    """Return a scalar for a scalar input."""
+    return out[()] if scalar else out
+
+def mag_to_flux(mag, zeropoint=27.0, out=None):
     """Convert magnitude into flux unit.
     """
-    return 10.0 ** ((zeropoint - mag) / 2.5)
+    mag = np.asarray(mag)
+    out = _output(mag, out)
+    np.subtract(_zeropoint(zeropoint), mag, out=out)
+    np.multiply(out, 0.4, out=out)
+    np.power(10.0, out, out=out)
+    return _result(out, mag.ndim == 0)
 
-def flux_to_mag(flux, zeropoint=27.0):
+def flux_to_mag(flux, zeropoint=27.0, out=None, fill=np.nan):
     """Convert flux into magnitude unit.
+
+    Non-positive (and NaN) fluxes do not have a magnitude: they are set to `fill`
+    without any warning.
     """
-    # TODO: deal with negative values more gracefully
-    return -2.5 * np.log10(flux) + zeropoint
+    flux = np.asarray(flux)
+    out = _output(flux, out)
+    positive = flux > 0
+    np.copyto(out, fill, where=~positive)
+    # The masked-out values can still be evaluated when the input is cast to the dtype
+    # of the output buffer
+    with np.errstate(**_IGNORE):
+        np.log10(flux, out=out, where=positive)
+    np.multiply(out, -2.5, out=out, where=positive)
+    np.add(out, _zeropoint(zeropoint), out=out, where=positive)
+    return _result(out, flux.ndim == 0)
+
+def flux_to_mag_err(flux, flux_ivar, out=None, fill=np.nan):
+    """Convert flux and its inverse variance into magnitude error.
+
+    Set to `fill` when the flux or the inverse variance is not positive.
+    """
+    flux, flux_ivar = np.asarray(flux), np.asarray(flux_ivar)
+    out = _output(flux, out)
+    valid = (flux > 0) & (flux_ivar > 0)
+    np.copyto(out, fill, where=~valid)
+    # 2.5 / ln(10) / (flux / flux_err)
+    with np.errstate(**_IGNORE):
+        np.sqrt(flux_ivar, out=out, where=valid)
+        np.multiply(out, flux, out=out, where=valid)
+    np.divide(MAG_ERR_COEF, out, out=out, where=valid)
+    return _result(out, flux.ndim == 0)
+
+def _softening(softening, flux_ivar):
+    """Softening parameter of the asinh magnitude in flux unit.
+
+    When it is not provided, use 1.042 times the median flux error.
+    """
+    if softening is not None:
+        return float(softening)
+    if flux_ivar is None:
+        raise ValueError("# Need either the softening parameter or the flux inverse variance")
+    flux_ivar = np.asarray(flux_ivar)
+    flux_ivar = flux_ivar[flux_ivar > 0]
+    if flux_ivar.size == 0:
+        raise ValueError("# No valid flux inverse variance to derive the softening parameter")
+    return ASINH_SOFTENING / np.sqrt(np.median(flux_ivar))
+
+def flux_to_asinh_mag(flux, zeropoint=27.0, softening=None, flux_ivar=None, out=None):
+    """Convert flux into asinh magnitude (luptitude, Lupton et al. 1999).
+
+    The asinh magnitude is defined for zero and negative fluxes, and is the same as the
+    normal magnitude when the flux is much larger than the softening parameter `b`:
+        m = zeropoint - 2.5 / ln(10) * [asinh(flux / 2b) + ln(b)]
+
+    `softening` is in flux unit; when it is None, 1.042 times the median flux error
+    derived from `flux_ivar` is used.
+    """
+    flux = np.asarray(flux)
+    out = _output(flux, out)
+    softening = _softening(softening, flux_ivar)
+    np.divide(flux, 2.0 * softening, out=out)
+    np.arcsinh(out, out=out)
+    np.add(out, np.log(softening), out=out)
+    np.multiply(out, -MAG_ERR_COEF, out=out)
+    np.add(out, _zeropoint(zeropoint), out=out)
+    return _result(out, flux.ndim == 0)
+
+def flux_to_asinh_mag_err(flux, flux_ivar, softening=None, out=None, fill=np.nan):
+    """Convert flux and its inverse variance into the error of the asinh magnitude.
+
+    Set to `fill` when the inverse variance is not positive.
+    """
+    flux, flux_ivar = np.asarray(flux), np.asarray(flux_ivar)
+    out = _output(flux, out)
+    softening = _softening(softening, flux_ivar)
+    valid = flux_ivar > 0
+    np.copyto(out, fill, where=~valid)
+    # 2.5 / ln(10) * flux_err / sqrt(4b^2 + flux^2)
+    with np.errstate(**_IGNORE):
+        np.multiply(flux, flux, out=out, where=valid)
+        np.add(out, 4.0 * softening ** 2, out=out, where=valid)
+        np.multiply(out, flux_ivar, out=out, where=valid)
+    np.sqrt(out, out=out, where=valid)
+    np.divide(MAG_ERR_COEF, out, out=out, where=valid)
+    return _result(out, flux.ndim == 0)
+
+def _has_column(catalog, col):
+    """Whether the structured array, FITS table, or dict has the column."""
+    names = getattr(getattr(catalog, 'dtype', None), 'names', None)
+    if names is None and hasattr(catalog, 'names'):
+        names = catalog.names
+    if names is None:
+        names = list(catalog.keys())
+    return col in names
+
+def photometry(catalog, bands=('G', 'R', 'Z'), zeropoint='decals', errors=True,
+               asinh=False, softening=None, flux_prefix='FLUX_', ivar_prefix='FLUX_IVAR_',
+               dtype=np.float32, out=None, fill=np.nan):
+    """Magnitudes, errors, and asinh magnitudes of all the bands in one pass.
+
+    Parameters
+    ----------
+    catalog: `np.array`, `astropy.io.fits.FITS_rec`, or `dict`
+        Catalog with the `FLUX_*` and `FLUX_IVAR_*` columns.
+    bands: `list`, optional
+        Names of the bands. Default: ('G', 'R', 'Z')
+    zeropoint: `float` or `string`, optional
+        Photometric zeropoint, or "decals" (22.5) or "hsc" (27.0). Default: "decals"
+    errors: `bool`, optional
+        Also compute the errors when the inverse variance column is available.
+        Default: True
+    asinh: `bool`, optional
+        Also compute the asinh magnitudes (and errors). Default: False
+    softening: `float` or `dict`, optional
+        Softening parameter of the asinh magnitudes in flux unit, either one value or
+        one per band. Default: None, 1.042 times the median flux error of each band.
+    flux_prefix: `string`, optional
+        Prefix of the flux columns. Default: "FLUX_"
+    ivar_prefix: `string`, optional
+        Prefix of the inverse variance columns. Default: "FLUX_IVAR_"
+    dtype: `np.dtype`, optional
+        Data type of the output. Default: np.float32
+    out: `np.array`, optional
+        Preallocated output with the same fields, e.g. reused for all the blocks of a
+        catalog of the same size. Default: None
+    fill: `float`, optional
+        Value for the undefined magnitudes and errors. Default: np.nan
+
+    Returns
+    -------
+    phot: `np.array`
+        Structured array with `MAG_*`, `MAG_ERR_*`, `ASINH_MAG_*`, and
+        `ASINH_MAG_ERR_*` columns.
+
+    Examples
+    --------
+        >>> phot = photometry(sweep_obj.data, bands=['G', 'R', 'Z', 'W1'], asinh=True)
+
+    """
+    zeropoint = _zeropoint(zeropoint)
+    n_obj = len(catalog[flux_prefix + bands[0]])
+
+    columns = []
+    for band in bands:
+        has_ivar = errors and _has_column(catalog, ivar_prefix + band)
+        columns.append('MAG_' + band)
+        if has_ivar:
+            columns.append('MAG_ERR_' + band)
+        if asinh:
+            columns.append('ASINH_MAG_' + band)
+            if has_ivar:
+                columns.append('ASINH_MAG_ERR_' + band)
+    if out is None:
+        out = np.empty(n_obj, dtype=[(col, dtype) for col in columns])
+    elif len(out) != n_obj or list(out.dtype.names) != columns:
+        raise ValueError("# The output buffer does not match the catalog")
+
+    # Write directly into the fields of the output, no temporary array per band
+    for band in bands:
+        flux = catalog[flux_prefix + band]
+        flux_ivar = catalog[ivar_prefix + band] if _has_column(
+            catalog, ivar_prefix + band) else None
+        with_err = ('MAG_ERR_' + band) in out.dtype.names
+
+        flux_to_mag(flux, zeropoint=zeropoint, out=out['MAG_' + band], fill=fill)
+        if with_err:
+            flux_to_mag_err(flux, flux_ivar, out=out['MAG_ERR_' + band], fill=fill)
+        if asinh:
+            soft = _softening(
+                softening.get(band) if isinstance(softening, dict) else softening, flux_ivar)
+            flux_to_asinh_mag(flux, zeropoint=zeropoint, softening=soft,
+                              out=out['ASINH_MAG_' + band])
+            if with_err:
+                flux_to_asinh_mag_err(flux, flux_ivar, softening=soft,
+                                      out=out['ASINH_MAG_ERR_' + band], fill=fill)
+
+    return out
 
 def e1_e2_to_shape(e1, e2, shape_type='b_a'):
     """Convert the complex ellipticities to normal shape.
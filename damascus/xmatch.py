@@ -0,0 +1,294 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Cross-match DECaLS sweep catalogs to external reference catalogs.
+
+The reference catalog (e.g. HSC, COSMOS2020, or DESI BGS targets) is indexed with a
+KD-tree of unit vectors, so the matching radius is an exact angular separation. When
+going through many sweeps, the KD-tree is built once (in each worker process) and only
+queried for each sweep.
+
+"""
+
+import os
+
+import numpy as np
+
+from . import io
+from . import hsc
+from . import shared
+from . import instrument
+from .sweep import sweep_to_box, sweep_bright_galaxy_match
+
+__all__ = ['radec_to_xyz', 'SkyMatcher', 'crossmatch_sweep', 'batch_crossmatch_sweeps']
+
+
+def radec_to_xyz(ra, dec):
+    '''Convert RA, Dec in degree into unit vectors of shape (n,3).'''
+    ra, dec = np.radians(np.atleast_1d(ra)), np.radians(np.atleast_1d(dec))
+    cos_dec = np.cos(dec)
+    return np.vstack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)]).T
+
+
+def _arcsec_to_chord(radius):
+    '''Convert an angular separation in arcsec into the chord length on the unit sphere.'''
+    return 2.0 * np.sin(np.radians(radius / 3600.0) / 2.0)
+
+
+def _chord_to_arcsec(chord):
+    '''Convert the chord length on the unit sphere into angular separation in arcsec.'''
+    return np.degrees(2.0 * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))) * 3600.0
+
+
+class SkyMatcher(object):
+    '''Spherical KD-tree of a reference catalog.
+
+    Parameters
+    ----------
+    ra: `np.array`
+        RA of the reference objects in degree.
+    dec: `np.array`
+        Dec of the reference objects in degree.
+    index: `np.array`, optional
+        Indices reported for the reference objects, e.g. their rows in the full
+        reference catalog. Default: None, use `np.arange(len(ra))`.
+
+    Examples
+    --------
+        >>> matcher = SkyMatcher(hsc['ra'], hsc['dec'])
+        >>> idx_ref, sep = matcher.match_nearest(gal['RA'], gal['DEC'], radius=1.0)
+
+    '''
+    def __init__(self, ra, dec, index=None):
+        from scipy.spatial import cKDTree
+
+        self.index = np.arange(len(np.atleast_1d(ra))) if index is None else np.asarray(index)
+        self.tree = cKDTree(radec_to_xyz(ra, dec))
+
+    def __repr__(self):
+        return "Sky Matcher: {:d} reference objects".format(len(self))
+
+    def __len__(self):
+        return len(self.index)
+
+    def match_nearest(self, ra, dec, radius=1.0):
+        '''Find the nearest reference object within the radius.
+
+        Parameters
+        ----------
+        ra: `np.array`
+            RA of the objects in degree.
+        dec: `np.array`
+            Dec of the objects in degree.
+        radius: float, optional
+            Matching radius in arcsec. Default: 1.0
+
+        Returns
+        -------
+        idx_ref: `np.array`
+            Index of the nearest reference object. -1 if there is none within the radius.
+        sep: `np.array`
+            Separation in arcsec. `np.inf` if there is no match.
+
+        '''
+        if len(self) == 0:
+            n_obj = len(np.atleast_1d(ra))
+            return np.full(n_obj, -1, dtype=np.int64), np.full(n_obj, np.inf)
+
+        chord, idx = self.tree.query(
+            radec_to_xyz(ra, dec), k=1, distance_upper_bound=_arcsec_to_chord(radius))
+        matched = np.isfinite(chord)
+        idx_ref = np.full(len(idx), -1, dtype=np.int64)
+        idx_ref[matched] = self.index[idx[matched]]
+        sep = np.full(len(idx), np.inf)
+        sep[matched] = _chord_to_arcsec(chord[matched])
+
+        return idx_ref, sep
+
+    def match_within(self, ra, dec, radius=1.0):
+        '''Find all the pairs within the radius.
+
+        Returns
+        -------
+        idx_obj: `np.array`
+            Index of the object in the input arrays.
+        idx_ref: `np.array`
+            Index of the reference object.
+        sep: `np.array`
+            Separation in arcsec.
+
+        '''
+        if len(self) == 0 or len(np.atleast_1d(ra)) == 0:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+
+        pairs = type(self.tree)(radec_to_xyz(ra, dec)).sparse_distance_matrix(
+            self.tree, _arcsec_to_chord(radius), output_type='ndarray')
+        order = np.lexsort((pairs['v'], pairs['i']))
+        pairs = pairs[order]
+
+        return (pairs['i'].astype(np.int64), self.index[pairs['j']],
+                _chord_to_arcsec(pairs['v']))
+
+
+def _in_padded_box(sweep_name, ra, dec, radius):
+    '''Whether the objects are inside the box of the sweep padded by the radius.'''
+    box = sweep_to_box(os.path.split(sweep_name)[-1])
+    ra_min, ra_max = box[:, 0].min(), box[:, 0].max()
+    dec_min, dec_max = box[:, 1].min(), box[:, 1].max()
+
+    pad_dec = radius / 3600.0
+    cos_dec = np.cos(np.radians(min(max(abs(dec_min), abs(dec_max)) + pad_dec, 89.9)))
+    pad_ra = pad_dec / cos_dec
+
+    return (((ra - ra_min + pad_ra) % 360.0 <= (ra_max - ra_min + 2.0 * pad_ra)) &
+            (dec >= dec_min - pad_dec) & (dec <= dec_max + pad_dec))
+
+
+def crossmatch_sweep(sweep_cat, ref_ra, ref_dec, radius=1.0, nearest=True, matcher=None,
+                     **kwargs):
+    '''Select galaxies in one sweep and cross-match them to the reference catalog.
+
+    Parameters
+    ----------
+    sweep_cat: `string`
+        Path to the Sweep catalog.
+    ref_ra: `np.array`
+        RA of the reference objects in degree.
+    ref_dec: `np.array`
+        Dec of the reference objects in degree.
+    radius: float, optional
+        Matching radius in arcsec. Default: 1.0
+    nearest: bool, optional
+        Only keep the nearest reference object for each galaxy. Otherwise, keep all
+        the pairs within the radius. Default: True
+    matcher: `SkyMatcher`, optional
+        Matcher of the full reference catalog, built once for many sweeps; `ref_ra`
+        and `ref_dec` are then not used. Default: None, build a matcher of the
+        reference objects around the sweep.
+    **kwargs:
+        Selection parameters passed to `sweep_bright_galaxy_match`.
+
+    Returns
+    -------
+    matched: `np.array`
+        Selected galaxies that have a match. Repeated for each pair when
+        `nearest=False`. None if nothing is matched.
+    idx_ref: `np.array`
+        Index of the matched reference object.
+    sep: `np.array`
+        Separation in arcsec.
+
+    '''
+    kwargs.setdefault('verbose', False)
+    gal = sweep_bright_galaxy_match(sweep_cat, **kwargs)
+    if gal is None or len(gal) == 0:
+        return None, np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    if matcher is None:
+        # Only the reference objects around this sweep
+        use = np.flatnonzero(_in_padded_box(sweep_cat, ref_ra, ref_dec, radius))
+        matcher = SkyMatcher(ref_ra[use], ref_dec[use], index=use)
+
+    if nearest:
+        idx_ref, sep = matcher.match_nearest(gal['RA'], gal['DEC'], radius=radius)
+        idx_obj = np.flatnonzero(idx_ref >= 0)
+        idx_ref, sep = idx_ref[idx_obj], sep[idx_obj]
+    else:
+        idx_obj, idx_ref, sep = matcher.match_within(gal['RA'], gal['DEC'], radius=radius)
+
+    if len(idx_obj) == 0:
+        return None, idx_ref, sep
+    return gal[idx_obj], idx_ref, sep
+
+
+_XMATCH_ARGS = {}
+
+
+def _init_xmatch_worker(ref_ra, ref_dec, kwargs):
+    '''Build the matcher of the reference catalog once in the worker process.'''
+    _XMATCH_ARGS.update({'matcher': SkyMatcher(shared.attach(ref_ra), shared.attach(ref_dec)),
+                         'kwargs': shared.attach(kwargs)})
+
+
+def _crossmatch_sweep_worker(sweep_cat):
+    '''Cross-match one sweep inside a worker process.'''
+    return sweep_cat, crossmatch_sweep(
+        sweep_cat, None, None, matcher=_XMATCH_ARGS['matcher'], **_XMATCH_ARGS['kwargs'])
+
+
+def batch_crossmatch_sweeps(sweeps, ref_ra, ref_dec, radius=1.0, nearest=True,
+                            pattern='sweep-*.fits', n_workers=None, shared_memory=True,
+                            verbose=True, **kwargs):
+    '''Cross-match the selected galaxies in a list of sweeps to a reference catalog.
+
+    Parameters
+    ----------
+    sweeps: `list` or `string`
+        List of paths to the Sweep catalogs, or the directory that contains them.
+    ref_ra: `np.array`
+        RA of the reference objects in degree.
+    ref_dec: `np.array`
+        Dec of the reference objects in degree.
+    radius: float, optional
+        Matching radius in arcsec. Default: 1.0
+    nearest: bool, optional
+        Only keep the nearest reference object for each galaxy. Default: True
+    pattern: `string`, optional
+        Pattern used to find the Sweep catalogs when `sweeps` is a directory.
+        Default: "sweep-*.fits"
+    n_workers: `int`, optional
+        Number of worker processes. Default: number of CPUs.
+    shared_memory: `bool` or `string`, optional
+        Place the reference catalog (and mask) in shared memory once and attach them in
+        the workers without a copy. A directory uses a memory-mapped file there instead.
+        Default: True
+    verbose: `bool`, optional
+        Announce progress. Default: True
+    **kwargs:
+        Selection parameters passed to `sweep_bright_galaxy_match`.
+
+    Returns
+    -------
+    matched: `np.array`
+        Concatenated matched galaxies. None if nothing is matched.
+    idx_ref: `np.array`
+        Index of the matched reference object.
+    sep: `np.array`
+        Separation in arcsec.
+
+    '''
+    if isinstance(sweeps, str):
+        sweeps = sorted(io.find_files(sweeps, pattern, verbose=verbose))
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    n_workers = max(1, min(n_workers, len(sweeps)))
+
+    ref_ra = np.asarray(ref_ra, dtype=float)
+    ref_dec = np.asarray(ref_dec, dtype=float)
+    # Read the mask only once instead of once per Sweep catalog
+    if isinstance(kwargs.get('mask'), str):
+        kwargs['mask'] = hsc.FDFCMask.read(kwargs['mask'])
+    kwargs.update({'radius': radius, 'nearest': nearest})
+
+    if n_workers == 1:
+        _init_xmatch_worker(ref_ra, ref_dec, kwargs)
+        results = list(map(_crossmatch_sweep_worker, sweeps))
+    else:
+        import multiprocessing
+        with shared.share_initargs((ref_ra, ref_dec, kwargs), shared_memory) as initargs, \
+                multiprocessing.Pool(processes=n_workers, initializer=_init_xmatch_worker,
+                                     initargs=initargs) as pool:
+            results = list(instrument.merged(pool.imap(
+                instrument.worker(_crossmatch_sweep_worker), sweeps, chunksize=1)))
+
+    matched, idx_ref, sep = [], [], []
+    for sweep_cat, (gal, idx, dist) in results:
+        if verbose:
+            print("# {:s}: {:d} matches".format(os.path.split(sweep_cat)[-1], len(idx)))
+        if gal is not None:
+            matched.append(io.decode_table(gal))
+            idx_ref.append(idx)
+            sep.append(dist)
+
+    if not matched:
+        return None, np.zeros(0, dtype=np.int64), np.zeros(0)
+    return np.concatenate(matched), np.concatenate(idx_ref), np.concatenate(sep)
@@ -34,7 +34,6 @@ setup(
         "Operating System :: OS Independent",
         "Programming Language :: Python :: 3 :: Only",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
     ],
     keywords='astronomy, photometry',
@@ -44,8 +43,11 @@ setup(
     license='MIT',
     packages=find_packages(),
     install_requires=INSTALL_REQUIRES,
+    entry_points={
+        'console_scripts': ['damascus=damascus.cli:main'],
+    },
     include_package_data=True,
     zip_safe=False,
-    python_requires='>=3.6',
+    python_requires='>=3.7',
 )
 
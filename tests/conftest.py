@@ -0,0 +1,49 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Small synthetic sweep catalogs for the tests."""
+
+import numpy as np
+import pytest
+
+SWEEP_NAMES = ['sweep-150p000-160p005.fits', 'sweep-160p000-170p005.fits']
+
+
+def make_sweep(path, n_rows=2000, seed=1):
+    '''Write a sweep-like catalog with a logical and a scaled (TZERO) column.'''
+    from astropy.io import fits
+
+    from damascus.sweep import sweep_to_box
+
+    box = sweep_to_box(str(path))
+    rng = np.random.default_rng(seed)
+    columns = [
+        fits.Column(name='RA', format='D', array=rng.uniform(box[0, 0], box[1, 0], n_rows)),
+        fits.Column(name='DEC', format='D', array=rng.uniform(box[0, 1], box[2, 1], n_rows)),
+        fits.Column(name='TYPE', format='3A', array=rng.choice(
+            ['PSF', 'REX', 'EXP', 'DEV', 'DUP'], n_rows)),
+        fits.Column(name='BRIGHTSTARINBLOB', format='L', array=rng.random(n_rows) < 0.1),
+        fits.Column(name='NOBS_G', format='I', bzero=32768,
+                    array=rng.integers(0, 65535, n_rows).astype(np.uint16))]
+    for band in 'GRZ':
+        columns.append(fits.Column(name='FLUX_' + band, format='E',
+                                   array=10 ** rng.uniform(-1, 3, n_rows)))
+    fits.BinTableHDU.from_columns(columns).writeto(str(path), overwrite=True)
+    return str(path)
+
+
+@pytest.fixture
+def sweeps(tmp_path):
+    '''Paths to two synthetic sweep catalogs.'''
+    return [make_sweep(tmp_path / name, seed=ii) for ii, name in enumerate(SWEEP_NAMES)]
+
+
+@pytest.fixture
+def healpix_mask(tmp_path):
+    '''Path to a NSIDE 64 NESTED Healpix mask covering 150 < RA < 155.'''
+    import healpy as hp
+
+    nside = 64
+    ra, _ = hp.pix2ang(nside, np.arange(hp.nside2npix(nside)), nest=True, lonlat=True)
+    path = str(tmp_path / 'mask.fits')
+    hp.write_map(path, ((ra > 150) & (ra < 155)).astype(np.int16), nest=True, dtype=np.int16)
+    return path
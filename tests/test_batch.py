@@ -0,0 +1,71 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Resumable batch runs."""
+
+import os
+
+from damascus import batch
+
+
+def _started(manifest):
+    return {name: record['started'] for name, record in manifest.sweeps.items()}
+
+
+def test_resume_skips_done_sweeps(sweeps, tmp_path):
+    out_dir = str(tmp_path / 'batch')
+    first = batch.run_batch(sweeps, out_dir, g_mag=None, r_mag=None, verbose=False)
+    second = batch.run_batch(sweeps, out_dir, g_mag=None, r_mag=None, verbose=False)
+    assert second.n_done == len(sweeps)
+    assert _started(second) == _started(first)
+
+
+def test_resume_reprocesses_with_new_params(sweeps, tmp_path):
+    out_dir = str(tmp_path / 'batch')
+    first = batch.run_batch(sweeps, out_dir, g_mag=None, r_mag=None, verbose=False)
+    n_rows = {name: record['n_rows'] for name, record in first.sweeps.items()}
+
+    second = batch.run_batch(sweeps, out_dir, g_mag=20.0, r_mag=None, verbose=False)
+    assert second.n_done == len(sweeps)
+    assert second.params['kwargs']['g_mag'] == 20.0
+    for name, record in second.sweeps.items():
+        assert record['started'] != first.sweeps[name]['started']
+        assert record['n_rows'] < n_rows[name]
+
+
+def test_resume_reprocesses_with_new_mask(sweeps, healpix_mask, tmp_path):
+    out_dir = str(tmp_path / 'batch')
+    first = batch.run_batch(sweeps, out_dir, g_mag=None, r_mag=None, verbose=False)
+    second = batch.run_batch(sweeps, out_dir, mask=healpix_mask, g_mag=None, r_mag=None,
+                             verbose=False)
+    assert second.n_done == len(sweeps)
+    assert second.params['mask_identity'][0] == os.path.abspath(healpix_mask)
+    for name, record in second.sweeps.items():
+        assert record['started'] != first.sweeps[name]['started']
+
+    third = batch.run_batch(sweeps, out_dir, mask=healpix_mask, g_mag=None, r_mag=None,
+                            verbose=False)
+    assert _started(third) == _started(second)
+
+
+def test_run_batch_workers(sweeps, healpix_mask, tmp_path):
+    serial = batch.run_batch(sweeps, str(tmp_path / 'serial'), mask=healpix_mask,
+                             g_mag=None, verbose=False)
+    pool = batch.run_batch(sweeps, str(tmp_path / 'pool'), mask=healpix_mask, n_workers=2,
+                           g_mag=None, verbose=False)
+    assert pool.n_done == len(sweeps)
+    assert ({name: record['n_rows'] for name, record in pool.sweeps.items()} ==
+            {name: record['n_rows'] for name, record in serial.sweeps.items()})
+
+
+def test_resume_reprocesses_with_new_tuple_params(sweeps, tmp_path):
+    out_dir = str(tmp_path / 'batch')
+    first = batch.run_batch(sweeps, out_dir, columns=('RA', 'DEC'), verbose=False)
+    assert first.params['kwargs']['columns'] == ['RA', 'DEC']
+
+    second = batch.run_batch(sweeps, out_dir, columns=('RA', 'DEC'), verbose=False)
+    assert _started(second) == _started(first)
+
+    third = batch.run_batch(sweeps, out_dir, columns=('RA', 'DEC', 'FLUX_G'), verbose=False)
+    assert third.params['kwargs']['columns'] == ['RA', 'DEC', 'FLUX_G']
+    for name, record in third.sweeps.items():
+        assert record['started'] != first.sweeps[name]['started']
@@ -0,0 +1,81 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Persistent cache of the sweep selection results."""
+
+import os
+
+import numpy as np
+
+from damascus import io
+from damascus.cache import ResultCache, mask_identity
+from damascus.hsc import FDFCMask
+from damascus.sweep import sweep_bright_galaxy_match
+
+
+def test_key_changes_with_inputs(sweeps, healpix_mask, tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    key = cache.key(sweeps[0], {'no_dup': True}, mask=healpix_mask)
+    assert cache.key(sweeps[0], {'no_dup': True}, mask=healpix_mask) == key
+    assert cache.key(sweeps[1], {'no_dup': True}, mask=healpix_mask) != key
+    assert cache.key(sweeps[0], {'no_dup': False}, mask=healpix_mask) != key
+    assert cache.key(sweeps[0], {'no_dup': True}) != key
+
+    # Same mask content, different objects
+    mask = FDFCMask.read(healpix_mask)
+    assert mask_identity(mask) == mask_identity(FDFCMask(mask.bitmap.copy()))
+    assert mask_identity(mask.bitmap) == mask_identity(mask.bitmap.astype(np.int16))
+    assert mask_identity(~mask.bitmap) != mask_identity(mask.bitmap)
+
+    # The sweep file changed
+    os.utime(sweeps[0], ns=(0, 0))
+    assert cache.key(sweeps[0], {'no_dup': True}, mask=healpix_mask) != key
+
+
+def test_put_get_round_trip(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    data = np.zeros(10, dtype=[('RA', '>f8'), ('TYPE', 'S4')])
+    data['RA'] = np.arange(10)
+    cache.put('a', data)
+    cache.put('b', None)
+
+    found, cached = cache.get('a')
+    assert found and cached.dtype == data.dtype
+    np.testing.assert_array_equal(cached, data)
+    assert cache.get('b') == (True, None)
+    assert cache.get('c') == (False, None)
+
+    cache.clear()
+    assert cache.size == 0 and cache.get('a') == (False, None)
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    data = np.arange(1000, dtype=float)
+    for ii, key in enumerate('abc'):
+        cache.put(key, data)
+        os.utime(cache._path(key), ns=(ii * 10 ** 9, ii * 10 ** 9))
+    entry_size = cache.size // 3
+
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get('a')[0]
+    cache.max_bytes = 3 * entry_size
+    cache.put('d', data)
+    assert [cache.get(key)[0] for key in 'abcd'] == [True, False, True, True]
+    assert cache.size <= cache.max_bytes
+
+
+def test_cached_match_equals_uncached(sweeps, healpix_mask, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    for mask in (None, healpix_mask):
+        for g_mag, z_mag in [(24.0, 23.0), (22.0, 21.0)]:
+            expected = io.decode_table(sweep_bright_galaxy_match(
+                sweeps[0], mask=mask, g_mag=g_mag, z_mag=z_mag, verbose=False))
+            for _ in range(2):
+                result = sweep_bright_galaxy_match(
+                    sweeps[0], mask=mask, g_mag=g_mag, z_mag=z_mag, cache=cache_dir,
+                    verbose=False)
+                assert len(result) == len(expected) > 0
+                for col in expected.dtype.names:
+                    np.testing.assert_array_equal(result[col], expected[col])
+    # One entry per mask: the magnitude cuts are applied to the cached result
+    assert len(os.listdir(cache_dir)) == 2
@@ -0,0 +1,25 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Survey independent catalog."""
+
+import os
+
+from damascus.catalog import Catalog
+
+
+def test_concave_hull_memoized_with_seed(sweeps, tmp_path):
+    hull_dir = str(tmp_path / 'hulls')
+    catalog = Catalog(sweeps[0], hull_dir=hull_dir)
+    hull = catalog.concave_hull(n_samples=500, seed=1)
+    assert 'concave_0.1_500_1' in catalog._get_hulls()
+    assert os.listdir(hull_dir)
+    assert Catalog(sweeps[0], hull_dir=hull_dir).concave_hull(n_samples=500, seed=1) is not None
+    assert catalog.concave_hull(n_samples=500, seed=1) is hull
+
+
+def test_concave_hull_not_memoized_without_seed(sweeps, tmp_path):
+    hull_dir = str(tmp_path / 'hulls')
+    catalog = Catalog(sweeps[0], hull_dir=hull_dir)
+    assert catalog.concave_hull(n_samples=500, seed=None) is not None
+    assert catalog._get_hulls() == {}
+    assert not os.path.isdir(hull_dir) or not os.listdir(hull_dir)
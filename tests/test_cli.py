@@ -0,0 +1,26 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Command line interface."""
+
+import numpy as np
+from astropy.io import fits
+
+from damascus import cli, hsc
+
+
+def test_fdfc_filter_keeps_bool_column(sweeps, healpix_mask, tmp_path):
+    output = str(tmp_path / 'filtered.fits')
+    assert cli.main(['fdfc-filter', '--catalog', sweeps[0], '--mask', healpix_mask,
+                     '--out', output, '--quiet']) == 0
+
+    with fits.open(sweeps[0]) as hdu_list:
+        catalog = hdu_list[1].data
+        inside = hsc.FDFCMask.read(healpix_mask).contains(catalog['RA'], catalog['DEC'])
+        expected = catalog[inside].copy()
+    with fits.open(output) as hdu_list:
+        filtered = hdu_list[1].data.copy()
+
+    assert 0 < len(filtered) < len(inside)
+    assert 0 < filtered['BRIGHTSTARINBLOB'].sum() < len(filtered)
+    np.testing.assert_array_equal(filtered['BRIGHTSTARINBLOB'], expected['BRIGHTSTARINBLOB'])
+    np.testing.assert_array_equal(filtered['NOBS_G'], expected['NOBS_G'])
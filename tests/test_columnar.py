@@ -0,0 +1,63 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Columnar cache of the sweep catalogs."""
+
+import os
+
+import numpy as np
+from astropy.io import fits
+
+from conftest import make_sweep
+from damascus import io
+from damascus.catalog import Catalog
+
+
+def test_columnar_cache_matches_fits(sweeps, tmp_path):
+    cache_dir = str(tmp_path / 'columnar')
+    table_dirs = io.sweeps_to_columnar(sweeps, cache_dir, verbose=False)
+    for sweep_cat, table_dir in zip(sweeps, table_dirs):
+        assert io.columnar_is_current(table_dir, sweep_cat)
+        table = io.ColumnarTable(table_dir)
+        with fits.open(sweep_cat) as hdu_list:
+            data = hdu_list[1].data
+            assert len(table) == len(data)
+            for col in data.names:
+                np.testing.assert_array_equal(table[col], data[col])
+
+
+def test_columnar_cache_rebuilt_after_source_changes(sweeps, tmp_path):
+    cache_dir = str(tmp_path / 'columnar')
+    table_dir = io.fits_to_columnar(sweeps[0], cache_dir)
+    assert Catalog(sweeps[0], cache_dir=cache_dir).path == table_dir
+
+    # Regenerate the sweep with other objects
+    make_sweep(sweeps[0], n_rows=500, seed=42)
+    os.utime(sweeps[0], ns=(0, os.stat(table_dir).st_mtime_ns + 10 ** 9))
+    assert not io.columnar_is_current(table_dir, sweeps[0])
+    assert Catalog(sweeps[0], cache_dir=cache_dir).path == os.path.normpath(sweeps[0])
+
+    assert io.fits_to_columnar(sweeps[0], cache_dir) == table_dir
+    assert io.columnar_is_current(table_dir, sweeps[0])
+    table = io.ColumnarTable(table_dir)
+    assert len(table) == 500
+    np.testing.assert_array_equal(table['RA'], fits.getdata(sweeps[0])['RA'])
+
+
+def test_catalog_from_columnar_cache(sweeps, tmp_path):
+    cache_dir = str(tmp_path / 'columnar')
+    table_dir = io.fits_to_columnar(sweeps[0], cache_dir, columns=['RA', 'DEC', 'TYPE',
+                                                                    'FLUX_R', 'NOBS_G'])
+    table = io.ColumnarTable(table_dir)
+    assert table.names == ['RA', 'DEC', 'TYPE', 'FLUX_R', 'NOBS_G']
+    assert table.header['NAXIS2'] == len(table)
+
+    cached, direct = Catalog(sweeps[0], cache_dir=cache_dir), Catalog(sweeps[0])
+    assert cached.path == table_dir
+    for catalog in (cached, direct):
+        catalog.select('TYPE', '!=', 'PSF')
+        catalog.select('FLUX_R', '>', 1.0)
+    for col in ('RA', 'NOBS_G', 'TYPE'):
+        np.testing.assert_array_equal(cached.data_use[col], direct.data_use[col])
+
+    rows = table[np.arange(len(table)) % 3 == 0]
+    np.testing.assert_array_equal(rows['NOBS_G'], fits.getdata(sweeps[0])['NOBS_G'][::3])
@@ -0,0 +1,54 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""The logical and scaled FITS columns survive the selection and the outputs."""
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from damascus import io, sweep
+
+
+def _read(path):
+    with fits.open(path) as hdu_list:
+        return hdu_list[1].data.copy()
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_batch_output_keeps_bool_column(sweeps, tmp_path, n_workers):
+    single = np.concatenate([io.decode_table(sweep.sweep_bright_galaxy_match(
+        sweep_cat, g_mag=None, r_mag=None, z_mag=None, verbose=False))
+        for sweep_cat in sweeps])
+    output = str(tmp_path / 'matched.fits')
+    batch = sweep.batch_sweep_bright_galaxy_match(
+        sweeps, n_workers=n_workers, g_mag=None, r_mag=None, z_mag=None, output=output,
+        verbose=False)
+
+    flag = np.asarray(single['BRIGHTSTARINBLOB'], dtype=bool)
+    assert 0 < flag.sum() < len(flag)
+    np.testing.assert_array_equal(batch['BRIGHTSTARINBLOB'], flag)
+    np.testing.assert_array_equal(_read(output)['BRIGHTSTARINBLOB'], flag)
+    np.testing.assert_array_equal(_read(output)['NOBS_G'], single['NOBS_G'])
+
+
+def test_run_batch_outputs_keep_bool_column(sweeps, tmp_path):
+    from damascus import batch
+
+    out_dir = str(tmp_path / 'batch')
+    manifest = batch.run_batch(sweeps, out_dir, g_mag=None, r_mag=None, z_mag=None,
+                               verbose=False)
+    output = str(tmp_path / 'collected.fits')
+    collected = batch.collect_outputs(manifest, output=output)
+
+    expected = np.concatenate([io.decode_table(_read(output_file))
+                               for output_file in manifest.outputs])
+    flag = expected['BRIGHTSTARINBLOB']
+    assert 0 < flag.sum() < len(flag)
+    for catalog in (collected, _read(output)):
+        np.testing.assert_array_equal(catalog['BRIGHTSTARINBLOB'], flag)
+        np.testing.assert_array_equal(catalog['NOBS_G'], expected['NOBS_G'])
+
+    single = io.decode_table(sweep.sweep_bright_galaxy_match(
+        sweeps[0], g_mag=None, r_mag=None, z_mag=None, verbose=False))
+    np.testing.assert_array_equal(
+        _read(manifest.outputs[0])['BRIGHTSTARINBLOB'], single['BRIGHTSTARINBLOB'])
@@ -0,0 +1,120 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""HSC footprint masks and polygons."""
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from damascus import hsc
+
+NSIDE = 64
+
+
+def _field(x_range, y_range, face=4):
+    '''NESTED pixels of a rectangle of pixels inside one base pixel.'''
+    import healpy as hp
+
+    x, y = np.meshgrid(np.arange(*x_range), np.arange(*y_range))
+    return hp.xyf2pix(NSIDE, x.ravel(), y.ravel(), face, nest=True)
+
+
+@pytest.fixture
+def comb_hole():
+    '''A square field, and the same field with a comb-shaped hole inside.'''
+    filled = np.zeros(12 * NSIDE ** 2, dtype=bool)
+    filled[_field((8, 40), (8, 40))] = True
+
+    holed = filled.copy()
+    holed[_field((12, 14), (12, 36))] = False
+    for tooth in range(12, 36, 4):
+        holed[_field((12, 36), (tooth, tooth + 2))] = False
+    return filled, holed
+
+
+def test_polygon_outer_border_with_jagged_hole(comb_hole):
+    filled, holed = comb_hole
+    expected = hsc.get_fdfc_polygons(filled, verbose=False)
+    borders = hsc.get_fdfc_polygons(holed, verbose=False)
+
+    assert list(borders) == [1]
+    # The hole has a longer border than the field itself
+    assert len(borders[1]) == len(expected[1]) == 4 * 32
+    assert set(map(tuple, np.round(borders[1], 8))) == set(map(tuple, np.round(expected[1], 8)))
+
+
+def test_fdfc_mask_matches_healpy(healpix_mask, sweeps):
+    import healpy as hp
+
+    bitmap = hp.read_map(healpix_mask, nest=True) > 0
+    mask = hsc.FDFCMask.read(healpix_mask)
+    assert mask.nside == NSIDE and mask.n_pixels == bitmap.sum()
+    np.testing.assert_array_equal(mask.pixels, np.flatnonzero(bitmap))
+
+    with fits.open(sweeps[0]) as hdu_list:
+        catalog = hdu_list[1].data.copy()
+    expected = bitmap[hp.ang2pix(NSIDE, catalog['RA'], catalog['DEC'], nest=True, lonlat=True)]
+    np.testing.assert_array_equal(mask.contains(catalog['RA'], catalog['DEC']), expected)
+    assert 0 < expected.sum() < len(expected)
+
+    matched = hsc.filter_hsc_fdfc_mask(catalog, healpix_mask)
+    np.testing.assert_array_equal(matched['RA'], catalog['RA'][expected])
+
+
+def test_fdfc_mask_cache(healpix_mask, tmp_path):
+    cache = str(tmp_path / 'mask.npz')
+    mask = hsc.FDFCMask.read(healpix_mask, cache=cache)
+    cached = hsc.FDFCMask.read(healpix_mask, cache=cache)
+    np.testing.assert_array_equal(cached.bitmap, mask.bitmap)
+    assert cached.digest == mask.digest == hsc.FDFCMask.load(cache).digest
+    assert hsc.FDFCMask.read(cache).n_pixels == mask.n_pixels
+    assert hsc.FDFCMask(~mask.bitmap).digest != mask.digest
+
+
+@pytest.fixture
+def two_fields():
+    '''A 20x10 and a 6x6 rectangle of pixels, in different base pixels.'''
+    bitmap = np.zeros(12 * NSIDE ** 2, dtype=bool)
+    bitmap[_field((10, 30), (20, 30), face=5)] = True
+    bitmap[_field((40, 46), (40, 46), face=6)] = True
+    return bitmap
+
+
+def test_fdfc_polygons_fields_and_vertices(two_fields):
+    import healpy as hp
+    from matplotlib.path import Path
+
+    borders = hsc.get_fdfc_polygons(two_fields, verbose=False)
+    assert list(borders) == [1, 2]
+    # One vertex per pixel corner along the perimeter of each rectangle
+    assert [len(borders[field]) for field in borders] == [2 * (20 + 10), 2 * (6 + 6)]
+
+    pixels = np.flatnonzero(two_fields)
+    corners = hp.vec2ang(np.transpose(hp.boundaries(NSIDE, pixels, step=1, nest=True),
+                                      (0, 2, 1)).reshape(-1, 3), lonlat=True)
+    corners = set(zip(np.round(corners[0] % 360, 8), np.round(corners[1], 8)))
+    for border in borders.values():
+        assert set(zip(np.round(border[:, 0] % 360, 8), np.round(border[:, 1], 8))) <= corners
+
+    # The pixel centers of each field are inside its own border only
+    first = _field((10, 30), (20, 30), face=5)
+    ra, dec = hp.pix2ang(NSIDE, first, nest=True, lonlat=True)
+    assert Path(borders[1]).contains_points(np.vstack([ra, dec]).T).all()
+    assert not Path(borders[2]).contains_points(np.vstack([ra, dec]).T).any()
+
+
+def test_fdfc_polygons_deterministic(two_fields, tmp_path):
+    import healpy as hp
+
+    borders = hsc.get_fdfc_polygons(two_fields, verbose=False)
+    again = hsc.get_fdfc_polygons(hsc.FDFCMask(two_fields), verbose=False)
+    assert list(again) == list(borders)
+    for field in borders:
+        np.testing.assert_array_equal(again[field], borders[field])
+
+    mask_file = str(tmp_path / 'fields.fits')
+    hp.write_map(mask_file, two_fields.astype(np.int16), nest=True, dtype=np.int16)
+    from_file = hsc.get_fdfc_polygons(mask_file, verbose=False)
+    np.testing.assert_allclose(from_file[2], borders[2])
+
+    assert list(hsc.get_fdfc_polygons(two_fields, min_pixels=100, verbose=False)) == [1]
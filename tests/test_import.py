@@ -0,0 +1,59 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Light-weight imports and lazy loading of the heavy dependencies."""
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['astropy', 'healpy', 'scipy', 'matplotlib', 'sklearn']
+
+ENTRY_POINTS = [
+    'import damascus',
+    'from damascus.utils import mag_to_flux',
+    'from damascus.sweep import sweep_to_box',
+    'from damascus.index import SweepIndex',
+    'from damascus.batch import shard_sweeps',
+    'import damascus.cli',
+]
+
+
+def _run(code):
+    '''Run the code in a fresh interpreter and return what it prints as JSON.'''
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [PACKAGE_DIR] + [p for p in os.environ.get('PYTHONPATH', '').split(os.pathsep) if p]))
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize('entry_point', ENTRY_POINTS)
+def test_no_heavy_modules_on_import(entry_point):
+    loaded = _run("import sys, json\n{:s}\nprint(json.dumps([m for m in {!r} "
+                  "if m in sys.modules]))".format(entry_point, HEAVY_MODULES))
+    assert loaded == []
+
+
+def test_lazy_attributes_resolve():
+    import damascus
+
+    before, modules, after, healpy_used = _run(
+        "import sys, json, types, numpy, damascus\n"
+        "before = [m for m in {0!r} if m in sys.modules]\n"
+        "modules = {{name: isinstance(getattr(damascus, name), types.ModuleType) "
+        "for name in damascus._SUBMODULES}}\n"
+        "after = [m for m in {0!r} if m in sys.modules]\n"
+        "damascus.hsc.FDFCMask(numpy.ones(12, dtype=bool))\n"
+        "print(json.dumps([before, modules, after, 'healpy' in sys.modules]))".format(
+            HEAVY_MODULES))
+    assert before == [] and after == []
+    assert modules == {name: True for name in damascus._SUBMODULES}
+    # The heavy dependencies are loaded on first use
+    assert healpy_used
+    assert set(damascus.__all__) <= set(dir(damascus))
+    with pytest.raises(AttributeError):
+        damascus.not_a_module
@@ -0,0 +1,78 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Spatial index of the sweep footprints."""
+
+import os
+
+import numpy as np
+import pytest
+
+from damascus.index import SweepIndex
+
+SWEEP_LIST = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'damascus', 'data', 'decals', 'dr8', 'decals_dr8_sweeps.list')
+
+
+@pytest.fixture(scope='module')
+def index():
+    return SweepIndex.from_list(SWEEP_LIST)
+
+
+def _brute_force(index, ra, dec):
+    '''Sweep of each point by testing all the boxes.'''
+    boxes = index.boxes
+    inside = ((ra[:, None] >= boxes[:, 0]) & (ra[:, None] < boxes[:, 1]) &
+              (dec[:, None] >= boxes[:, 2]) & (dec[:, None] < boxes[:, 3]))
+    assert inside.sum(axis=1).max() <= 1
+    return np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+
+
+def test_query_points_matches_brute_force(index):
+    rng = np.random.default_rng(2)
+    ra, dec = rng.uniform(0, 360, 20000), rng.uniform(-40, 40, 20000)
+    # Points on the box edges
+    ra = np.concatenate([ra, index.boxes[:, 0], index.boxes[:, 0]])
+    dec = np.concatenate([dec, index.boxes[:, 2], index.boxes[:, 3] - 1e-9])
+
+    sweep_id = index.query_points(ra, dec)
+    np.testing.assert_array_equal(sweep_id, _brute_force(index, ra, dec))
+    assert (sweep_id >= 0).any() and (sweep_id < 0).any()
+
+    groups = index.group_points(ra, dec)
+    assert sum(len(points) for points in groups.values()) == (sweep_id >= 0).sum()
+    for sweep, points in groups.items():
+        assert (sweep_id[points] == index.sweeps.index(sweep)).all()
+    assert index.query_points(-210.0, 2.0)[0] == index.query_points(150.0, 2.0)[0]
+
+
+def test_overlap_polygon_matches_sampling(index):
+    from matplotlib.path import Path
+
+    polygon = np.array([[151.3, 0.7], [173.2, 3.1], [166.0, 13.9], [155.5, 9.2]])
+    x, y = np.meshgrid(np.arange(150, 175, 0.05), np.arange(0, 15, 0.05))
+    points = np.vstack([x.ravel(), y.ravel()]).T
+    points = points[Path(polygon).contains_points(points)]
+    sampled = {index.sweeps[ii] for ii in _brute_force(index, points[:, 0], points[:, 1])
+               if ii >= 0}
+
+    overlap = set(index.overlap_polygon(polygon))
+    assert sampled <= overlap
+    boxes = index.boxes[[index.sweeps.index(sweep) for sweep in overlap]]
+    assert (boxes[:, 1] > 151.3).all() and (boxes[:, 0] < 173.2).all()
+    assert (boxes[:, 3] > 0.7).all() and (boxes[:, 2] < 13.9).all()
+    assert set(index.overlap_polygon({1: polygon, 2: polygon + [30, 0]})) >= overlap
+
+
+def test_overlap_healpix(index, healpix_mask):
+    import healpy as hp
+
+    from damascus.hsc import FDFCMask
+
+    mask = FDFCMask.read(healpix_mask)
+    ra, dec = hp.pix2ang(mask.nside, mask.pixels, nest=True, lonlat=True)
+    expected = {index.sweeps[ii] for ii in _brute_force(index, ra, dec) if ii >= 0}
+
+    overlap = index.overlap_healpix(healpix_mask)
+    assert expected <= set(overlap)
+    boxes = index.boxes[[index.sweeps.index(sweep) for sweep in overlap]]
+    assert (boxes[:, 1] > 149).all() and (boxes[:, 0] < 156).all()
@@ -0,0 +1,29 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Instrumentation of the pipeline stages."""
+
+import pytest
+
+from damascus import instrument, sweep
+
+
+def test_merge_adds_statistics():
+    with instrument.profile(show=False):
+        with instrument.stage('test.stage', rows_in=10):
+            pass
+        instrument.merge({'test.stage': {'calls': 2, 'time': 1.0, 'rows_in': 5,
+                                         'rows_out': 3, 'bytes': 0}})
+        stats = instrument.summary()['test.stage']
+    assert stats['calls'] == 3
+    assert stats['rows_in'] == 15
+    assert stats['time'] >= 1.0
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_profile_covers_worker_processes(sweeps, n_workers):
+    with instrument.profile(show=False):
+        sweep.batch_sweep_bright_galaxy_match(
+            sweeps, n_workers=n_workers, g_mag=None, r_mag=None, z_mag=None, verbose=False)
+        stats = instrument.summary()
+    assert stats['sweep.match_select']['calls'] == len(sweeps)
+    assert stats['catalog.open']['calls'] == len(sweeps)
@@ -0,0 +1,108 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Multi-order coverage maps."""
+
+import numpy as np
+import pytest
+
+from damascus.moc import MOC
+
+
+def _random_pixels(order, seed, n_blobs=40):
+    '''Clumped set of NESTED pixels, so the ranges span several pixels.'''
+    rng = np.random.default_rng(seed)
+    n_pix = 12 * 4 ** order
+    starts = rng.integers(0, n_pix - 64, n_blobs)
+    lengths = rng.integers(1, 64, n_blobs)
+    pixels = {int(p) for s, n in zip(starts, lengths) for p in range(s, s + n)}
+    pixels |= {int(p) for p in rng.integers(0, n_pix, 200)}
+    return pixels
+
+
+def _upgrade_set(pixels, n_levels):
+    return {(p << (2 * n_levels)) + k for p in pixels for k in range(4 ** n_levels)}
+
+
+@pytest.fixture
+def pixel_sets():
+    return _random_pixels(5, seed=1), _random_pixels(6, seed=2)
+
+
+def test_set_operations_match_python_sets(pixel_sets):
+    set_a, set_b = pixel_sets
+    moc_a, moc_b = MOC.from_pixels(sorted(set_a), 5), MOC.from_pixels(sorted(set_b), 6)
+    fine_a = _upgrade_set(set_a, 1)
+
+    for result, expected in [(moc_a | moc_b, fine_a | set_b), (moc_a & moc_b, fine_a & set_b),
+                             (moc_a - moc_b, fine_a - set_b), (moc_b - moc_a, set_b - fine_a)]:
+        assert result.order == 6
+        assert set(result.pixels.tolist()) == expected
+        assert result.n_pixels == len(expected)
+
+    assert set((~moc_a).pixels.tolist()) == set(range(12 * 4 ** 5)) - set_a
+    assert (~~moc_a) == moc_a and (moc_a | ~moc_a).sky_fraction == 1.0
+    assert (moc_a & moc_b) == (moc_b & moc_a) and (moc_a - moc_a).n_pixels == 0
+
+
+def test_resolution_changes(pixel_sets):
+    set_a, _ = pixel_sets
+    moc = MOC.from_pixels(sorted(set_a), 5)
+
+    assert set(moc.degrade(3).pixels.tolist()) == {p >> 4 for p in set_a}
+    assert set(moc.upgrade(7).pixels.tolist()) == _upgrade_set(set_a, 2)
+    assert moc.upgrade(7) == moc and moc.upgrade(7).area == pytest.approx(moc.area)
+    assert moc.degrade(5) == moc
+    with pytest.raises(ValueError):
+        moc.upgrade(4)
+    with pytest.raises(ValueError):
+        moc.degrade(6)
+
+    # A coarse pixel is only covered if all its sub-pixels are
+    coarse = np.arange(12 * 4 ** 4)
+    expected = [all((p << 2) + k in set_a for k in range(4)) for p in coarse]
+    np.testing.assert_array_equal(moc.contains_pixels(coarse, order=4), expected)
+    fine = np.arange(12 * 4 ** 6)
+    np.testing.assert_array_equal(moc.contains_pixels(fine, order=6),
+                                  [p >> 2 in set_a for p in fine])
+
+
+def test_orders_round_trip(pixel_sets):
+    set_a, _ = pixel_sets
+    moc = MOC.from_pixels(sorted(set_a), 5)
+    orders = moc.to_orders()
+    assert MOC.from_orders(orders) == moc
+    assert sum(len(p) * 4 ** (5 - order) for order, p in orders.items()) == len(set_a)
+
+    # Fewest pixels: no four sibling pixels at any order
+    for order, pixels in orders.items():
+        if order > 0:
+            _, counts = np.unique(pixels >> 2, return_counts=True)
+            assert (counts < 4).all()
+
+    assert MOC.from_orders({}).n_pixels == 0
+    assert MOC.from_orders({0: [3]}).pixels.tolist() == [3]
+
+
+def test_contains_and_maps(pixel_sets, tmp_path):
+    import healpy as hp
+
+    set_a, _ = pixel_sets
+    moc = MOC.from_pixels(sorted(set_a), 5)
+    bitmap = moc.to_map()
+    assert set(np.flatnonzero(bitmap).tolist()) == set_a
+    np.testing.assert_array_equal(moc.to_map(order=4), moc.degrade(4).to_map())
+
+    rng = np.random.default_rng(3)
+    ra, dec = rng.uniform(0, 360, 50000), np.degrees(np.arcsin(rng.uniform(-1, 1, 50000)))
+    expected = bitmap[hp.ang2pix(moc.nside, ra, dec, nest=True, lonlat=True)]
+    np.testing.assert_array_equal(moc.contains(ra, dec), expected)
+
+    ring = np.zeros_like(bitmap)
+    ring[hp.nest2ring(moc.nside, sorted(set_a))] = True
+    assert MOC.from_map(ring, nest=False) == moc == MOC.from_mask(bitmap)
+
+    moc_file = str(tmp_path / 'test.moc.npz')
+    moc.save(moc_file)
+    loaded = MOC.from_mask(moc_file)
+    assert loaded == moc and loaded.order == moc.order and loaded.digest == moc.digest
+    assert MOC.from_pixels(sorted(set_a), 6).digest != moc.digest
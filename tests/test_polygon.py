@@ -0,0 +1,78 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Point-in-polygon engine."""
+
+import numpy as np
+import pytest
+from matplotlib.path import Path
+
+from damascus.polygon import PolygonIndex
+
+
+def _star(ra, dec, n_tips=7, r_in=0.5, r_out=2.0):
+    angle = np.linspace(0, 2 * np.pi, 2 * n_tips, endpoint=False)
+    radius = np.where(np.arange(2 * n_tips) % 2, r_in, r_out)
+    return np.vstack([ra + radius * np.cos(angle), dec + radius * np.sin(angle)]).T
+
+
+@pytest.fixture
+def polygons():
+    # The second star overlaps the first one
+    return {11: _star(30.0, 5.0), 12: _star(31.5, 5.5, n_tips=5),
+            13: _star(200.0, -40.0, n_tips=12, r_in=1.0, r_out=3.0)}
+
+
+def _expected(polygons, ra, dec, default=-1):
+    '''First polygon that contains each point, with matplotlib.'''
+    field_id = np.full(len(ra), default)
+    for key in reversed(list(polygons)):
+        field_id[Path(polygons[key]).contains_points(np.vstack([ra, dec]).T)] = key
+    return field_id
+
+
+def _points(n_points=20000, seed=7):
+    rng = np.random.default_rng(seed)
+    ra = np.concatenate([rng.uniform(27, 35, n_points), rng.uniform(196, 204, n_points)])
+    dec = np.concatenate([rng.uniform(2, 9, n_points), rng.uniform(-44, -36, n_points)])
+    return ra, dec
+
+
+@pytest.mark.parametrize('n_threads, chunk_size', [(1, 1000000), (1, 777), (4, 1000000),
+                                                   (3, 5000)])
+def test_query_matches_matplotlib(polygons, n_threads, chunk_size):
+    ra, dec = _points()
+    index = PolygonIndex(polygons)
+    field_id = index.query(ra, dec, n_threads=n_threads, chunk_size=chunk_size)
+    np.testing.assert_array_equal(field_id, _expected(polygons, ra, dec))
+    assert set(np.unique(field_id)) == {-1, 11, 12, 13}
+    np.testing.assert_array_equal(index.contains(ra, dec), field_id >= 0)
+
+
+@pytest.mark.parametrize('n_strips', [1, 3, 50])
+def test_query_independent_of_strips(polygons, n_strips):
+    ra, dec = _points(n_points=5000)
+    field_id = PolygonIndex(polygons, n_strips=n_strips).query(ra, dec, default=0)
+    np.testing.assert_array_equal(field_id, _expected(polygons, ra, dec, default=0))
+
+
+def test_input_types_and_scalars(polygons):
+    single = PolygonIndex(polygons[13])
+    assert len(single) == 1 and single.query(200.0, -40.0)[0] == 0
+    assert single.contains(200.0, -40.0) and not single.contains(30.0, 5.0)
+    listed = PolygonIndex(list(polygons.values()))
+    assert listed.query([30.0, 200.0], [5.0, -40.0]).tolist() == [0, 2]
+    assert len(PolygonIndex(polygons).query([], [])) == 0
+
+
+def test_polygon_across_ra_zero():
+    # Unwrapped border as returned by get_fdfc_polygons
+    polygon = _star(0.5, 1.0)
+    ra, dec = _points(n_points=2000)
+    ra, dec = ra[:2000] - 31.0, dec[:2000] - 4.0
+    expected = Path(polygon).contains_points(np.vstack([ra, dec]).T)
+    assert 0 < expected.sum() and (ra[expected] < 0).any()
+
+    index = PolygonIndex([polygon])
+    np.testing.assert_array_equal(index.contains(ra % 360.0, dec), expected)
+    np.testing.assert_array_equal(PolygonIndex([polygon + [360.0, 0.0]]).contains(
+        ra % 360.0, dec), expected)
@@ -0,0 +1,84 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Reading the sweeps ahead in background threads."""
+
+import threading
+
+import numpy as np
+import pytest
+from conftest import make_sweep
+
+from damascus import io, sweep
+from damascus.sweep import (SweepCatalog, batch_sweep_bright_galaxy_match, iter_prefetch,
+                            sweep_bright_galaxy_match)
+
+
+@pytest.fixture
+def many_sweeps(tmp_path):
+    '''Five sweeps, more than the number read ahead.'''
+    names = ['sweep-{:03d}p000-{:03d}p005.fits'.format(ra, ra + 10)
+             for ra in range(140, 190, 10)]
+    return [make_sweep(tmp_path / name, n_rows=500, seed=ii) for ii, name in enumerate(names)]
+
+
+def test_iter_prefetch_order_and_content(many_sweeps, tmp_path):
+    inputs = many_sweeps[:2] + [str(tmp_path / 'missing.fits')] + many_sweeps[2:]
+    results = list(iter_prefetch(inputs, read_ahead=2, columns=['RA', 'TYPE']))
+    assert [sweep_cat for sweep_cat, _ in results] == inputs
+    assert results[2][1] is None
+
+    for sweep_cat, sweep_obj in results[:2] + results[3:]:
+        expected = SweepCatalog(sweep_cat, read_in=True, columns=['RA', 'TYPE'])
+        assert sweep_obj.path == expected.path
+        np.testing.assert_array_equal(sweep_obj.data['RA'], expected.data['RA'])
+        np.testing.assert_array_equal(sweep_obj.data['TYPE'], expected.data['TYPE'])
+
+
+def test_iter_prefetch_reads_at_most_read_ahead(many_sweeps, monkeypatch):
+    started, lock = [], threading.Lock()
+    load = SweepCatalog.load
+
+    def _load(self, *args, **kwargs):
+        with lock:
+            started.append(self.path)
+        return load(self, *args, **kwargs)
+
+    monkeypatch.setattr(SweepCatalog, 'load', _load)
+    prefetch = iter_prefetch(many_sweeps, read_ahead=2)
+    for ii, (sweep_cat, sweep_obj) in enumerate(prefetch):
+        # The current catalog, plus at most two read ahead
+        assert len(started) <= min(ii + 3, len(many_sweeps))
+        assert sweep_obj is not None
+    assert len(started) == len(many_sweeps)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'columns': ['RA', 'DEC']}, {'no_rex': True,
+                                                                     'z_mag': 20.0}])
+def test_batch_read_ahead_matches_serial(many_sweeps, healpix_mask, kwargs):
+    for mask in (None, healpix_mask):
+        expected = batch_sweep_bright_galaxy_match(
+            many_sweeps, mask=mask, n_workers=1, read_ahead=0, verbose=False, **kwargs)
+        result = batch_sweep_bright_galaxy_match(
+            many_sweeps, mask=mask, n_workers=1, read_ahead=2, verbose=False, **kwargs)
+        expected, result = io.decode_table(expected), io.decode_table(result)
+        assert result.dtype.names == expected.dtype.names and len(result) > 0
+        for col in expected.dtype.names:
+            np.testing.assert_array_equal(result[col], expected[col])
+
+
+def test_prefetched_catalog_matches_path(many_sweeps, healpix_mask):
+    (sweep_cat, sweep_obj), = iter_prefetch(many_sweeps[1:2], read_ahead=1)
+    expected = io.decode_table(sweep_bright_galaxy_match(
+        sweep_cat, mask=healpix_mask, verbose=False))
+    result = io.decode_table(sweep_bright_galaxy_match(
+        sweep_obj, mask=healpix_mask, verbose=False))
+    for col in expected.dtype.names:
+        np.testing.assert_array_equal(result[col], expected[col])
+
+
+def test_no_read_ahead_when_not_loading(many_sweeps, tmp_path):
+    for kwargs in ({'cache': str(tmp_path / 'cache')}, {'chunk_rows': 100}):
+        assert list(sweep._prefetched(many_sweeps, 2, kwargs)) == [
+            (sweep_cat, None) for sweep_cat in many_sweeps]
+    assert list(sweep._prefetched(many_sweeps, 0, {})) == [
+        (sweep_cat, None) for sweep_cat in many_sweeps]
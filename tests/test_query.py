@@ -0,0 +1,69 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Lazy compound-predicate queries."""
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from damascus import query
+from damascus.catalog import Catalog
+from damascus.query import Query, col
+
+
+@pytest.fixture
+def table():
+    rng = np.random.default_rng(5)
+    data = np.zeros(1000, dtype=[('TYPE', 'S4'), ('FLUX_R', '>f4'), ('N', 'i4')])
+    data['TYPE'] = rng.choice([b'PSF', b'REX ', b'EXP', b'DEV '], len(data))
+    data['FLUX_R'] = rng.normal(1.0, 1.0, len(data))
+    data['N'] = rng.integers(0, 10, len(data))
+    return data
+
+
+def test_mask_matches_numpy(table):
+    result = Query(table).where(col('TYPE') != 'PSF', ('FLUX_R', '>=', 0.5), col('N') < 7)
+    expected = ((np.char.rstrip(table['TYPE']) != b'PSF') & (table['FLUX_R'] >= 0.5) &
+                (table['N'] < 7))
+    np.testing.assert_array_equal(result.mask(), expected)
+    assert result.count() == expected.sum()
+    assert result.columns == ['TYPE', 'FLUX_R', 'N']
+
+    fetched = result.fetch(columns=['FLUX_R', 'N'])
+    assert fetched.dtype.names == ('FLUX_R', 'N')
+    assert fetched.dtype['FLUX_R'].isnative
+    np.testing.assert_array_equal(fetched['FLUX_R'], table['FLUX_R'][expected])
+    np.testing.assert_array_equal(result.fetch(), table[expected])
+
+
+def test_trailing_spaces_and_immutability(table):
+    base = Query(table)
+    rex = base.where(col('TYPE') == 'REX')
+    assert base.predicates == [] and base.count() == len(table)
+    assert rex.count() == (np.char.rstrip(table['TYPE']) == b'REX').sum() > 0
+    with pytest.raises(ValueError):
+        query.Predicate('N', '=>', 1)
+
+
+def test_project_rows_and_columns(table):
+    index = np.array([3, 1, 4])
+    projected = query.project(table, ['N', 'TYPE'], mask=index)
+    np.testing.assert_array_equal(projected['N'], table['N'][index])
+    np.testing.assert_array_equal(projected['TYPE'], table['TYPE'][index])
+
+
+def test_catalog_where_matches_select(sweeps):
+    catalog = Catalog(sweeps[0])
+    catalog.select('TYPE', '!=', 'PSF')
+    catalog.select('FLUX_R', '>', 1.0)
+    expected = catalog.data_use
+
+    result = Catalog(sweeps[0]).where(col('TYPE') != 'PSF', ('FLUX_R', '>', 1.0))
+    np.testing.assert_array_equal(result.fetch(columns=['RA'])['RA'], expected['RA'])
+
+    projected = Catalog(sweeps[0], columns=['TYPE', 'FLUX_R'])
+    fetched = projected.where(col('type') != 'PSF', ('flux_r', '>', 1.0)).fetch(
+        columns=['RA', 'DEC'])
+    np.testing.assert_array_equal(fetched['DEC'], expected['DEC'])
+    with fits.open(sweeps[0]) as hdu_list:
+        assert len(fetched) < len(hdu_list[1].data)
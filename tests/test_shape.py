@@ -0,0 +1,84 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Shape related functions."""
+
+import numpy as np
+import pytest
+from matplotlib.path import Path
+from scipy.spatial import Delaunay
+
+from damascus.shape import alpha_shape, concave_hull, convex_hull, points_in_polygon
+
+
+def _loop_alpha_edges(points, alpha, only_outer):
+    '''Edges kept by the original per-triangle loop of `alpha_shape`.'''
+    edges = set()
+
+    def add_edge(i, j):
+        if (i, j) in edges or (j, i) in edges:
+            if only_outer:
+                edges.discard((j, i))
+                edges.discard((i, j))
+            return
+        edges.add((i, j))
+
+    for ia, ib, ic in Delaunay(points).simplices:
+        pa, pb, pc = points[ia], points[ib], points[ic]
+        a = np.sqrt((pa[0] - pb[0]) ** 2 + (pa[1] - pb[1]) ** 2)
+        b = np.sqrt((pb[0] - pc[0]) ** 2 + (pb[1] - pc[1]) ** 2)
+        c = np.sqrt((pc[0] - pa[0]) ** 2 + (pc[1] - pa[1]) ** 2)
+        s = (a + b + c) / 2.0
+        area = np.sqrt(s * (s - a) * (s - b) * (s - c))
+        if a * b * c / (4.0 * area) < alpha:
+            add_edge(ia, ib)
+            add_edge(ib, ic)
+            add_edge(ic, ia)
+    return {frozenset(edge) for edge in edges}
+
+
+def _boundary_edges(boundaries):
+    return {frozenset(edge) for boundary in boundaries for edge in boundary}
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(3)
+    points = rng.uniform(0, 1, size=(400, 2))
+    # Carve a notch so that the alpha shape is not convex
+    return points[~((points[:, 0] > 0.4) & (points[:, 0] < 0.6) & (points[:, 1] > 0.5))]
+
+
+@pytest.mark.parametrize('alpha', [0.05, 0.1, 10.0])
+@pytest.mark.parametrize('only_outer', [True, False])
+def test_alpha_shape_matches_loop(points, alpha, only_outer):
+    boundaries = alpha_shape(points, alpha, only_outer=only_outer)
+    assert _boundary_edges(boundaries) == _loop_alpha_edges(points, alpha, only_outer)
+
+
+def test_alpha_shape_boundaries_are_closed(points):
+    boundaries = alpha_shape(points, 0.1)
+    assert [len(b) for b in boundaries] == sorted((len(b) for b in boundaries), reverse=True)
+    for boundary in boundaries:
+        for (_, j), (k, _) in zip(boundary, boundary[1:] + boundary[:1]):
+            assert j == k
+
+
+def test_alpha_shape_large_alpha_is_convex_hull(points):
+    boundary = alpha_shape(points, np.inf)[0]
+    hull = convex_hull(points)
+    assert {tuple(p) for p in points[[i for i, _ in boundary]]} == {tuple(p) for p in hull}
+
+
+def test_concave_hull_excludes_notch(points):
+    hull = concave_hull(points, alpha=0.1)
+    inside = Path(hull).contains_points([[0.5, 0.9], [0.5, 0.2]])
+    assert inside.tolist() == [False, True]
+
+
+def test_points_in_polygon_matches_matplotlib():
+    rng = np.random.default_rng(5)
+    angle = np.linspace(0, 2 * np.pi, 25, endpoint=False)
+    radius = np.where(np.arange(25) % 2, 0.4, 1.0)
+    polygon = np.vstack([radius * np.cos(angle), radius * np.sin(angle)]).T
+    test = rng.uniform(-1.1, 1.1, size=(5000, 2))
+    assert np.array_equal(points_in_polygon(test, polygon), Path(polygon).contains_points(test))
@@ -0,0 +1,117 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Sparse Healpix masks."""
+
+import numpy as np
+import pytest
+
+from damascus.hsc import FDFCMask
+from damascus.sparse import SparseHealpixMask
+
+NSIDE = 64
+COVERAGE_ORDER = 2
+
+
+@pytest.fixture
+def bitmap():
+    '''NESTED map with one fully covered, one partially covered, and empty coarse pixels.'''
+    chunk = 4 ** (6 - COVERAGE_ORDER)
+    bitmap = np.zeros(12 * NSIDE ** 2, dtype=bool)
+    bitmap[5 * chunk:6 * chunk] = True
+    bitmap[7 * chunk:7 * chunk + chunk // 3] = True
+    bitmap[7 * chunk + chunk // 2::7][:chunk // 14] = True
+    return bitmap
+
+
+def _centers(pixels):
+    import healpy as hp
+    return hp.pix2ang(NSIDE, pixels, nest=True, lonlat=True)
+
+
+def test_contains_matches_fdfc_mask(bitmap):
+    dense = FDFCMask(bitmap)
+    sparse = SparseHealpixMask.from_map(bitmap, coverage_order=COVERAGE_ORDER)
+    chunk = 4 ** (6 - COVERAGE_ORDER)
+
+    # Fully covered, partially covered (inside and outside), and empty coarse pixels
+    pixels = np.concatenate([np.arange(5 * chunk, 6 * chunk, 17),
+                             np.arange(7 * chunk, 8 * chunk, 3),
+                             np.arange(0, 12 * NSIDE ** 2, 101)])
+    ra, dec = _centers(pixels)
+    np.testing.assert_array_equal(sparse.contains(ra, dec), dense.contains(ra, dec))
+    assert sparse.contains(ra, dec).any() and not sparse.contains(ra, dec).all()
+
+    for pixel in [5 * chunk + 3, 7 * chunk + 1, 7 * chunk + chunk // 2 + 1, 7 * chunk + 2,
+                  0, 11 * chunk]:
+        ra, dec = _centers(pixel)
+        inside = sparse.contains(float(ra), float(dec))
+        assert isinstance(inside, bool)
+        assert inside == bool(dense.contains(float(ra), float(dec)))
+        assert sparse.contains_pixels(pixel) == bitmap[pixel]
+
+
+def test_construction_paths_agree(bitmap, tmp_path):
+    import healpy as hp
+
+    from damascus.moc import MOC
+
+    reference = SparseHealpixMask.from_map(bitmap, coverage_order=COVERAGE_ORDER)
+    moc = MOC.from_map(bitmap)
+
+    ring = np.zeros(len(bitmap), dtype=np.int16)
+    ring[hp.nest2ring(NSIDE, np.flatnonzero(bitmap))] = 1
+    path = str(tmp_path / 'mask.fits')
+    hp.write_map(path, ring, nest=False, dtype=np.int16)
+
+    blocks = SparseHealpixMask.__new__(SparseHealpixMask)
+    blocks._setup(NSIDE, COVERAGE_ORDER)
+    blocks._add_ranges(moc.ranges, block_pixels=7)
+    blocks._finish()
+
+    for mask in (SparseHealpixMask.from_mask(moc, coverage_order=COVERAGE_ORDER),
+                 SparseHealpixMask.read(path, coverage_order=COVERAGE_ORDER), blocks):
+        np.testing.assert_array_equal(mask.pixels, np.flatnonzero(bitmap))
+        assert mask.digest == reference.digest
+        assert len(mask.chunks) == len(reference.chunks) == 1
+    assert reference.to_moc() == moc
+    assert reference.n_pixels == bitmap.sum()
+
+
+def test_random_map_matches_fdfc_mask(tmp_path):
+    from damascus.moc import MOC
+
+    rng = np.random.default_rng(4)
+    bitmap = rng.random(12 * NSIDE ** 2) < 0.3
+    bitmap[:4 ** (6 - COVERAGE_ORDER) * 3] = True
+    dense = FDFCMask(bitmap)
+    sparse = SparseHealpixMask(np.flatnonzero(bitmap), NSIDE, coverage_order=COVERAGE_ORDER)
+
+    assert sparse.n_pixels == dense.n_pixels and sparse.area == pytest.approx(
+        dense.n_pixels * 4 * np.pi * (180 / np.pi) ** 2 / len(bitmap))
+    np.testing.assert_array_equal(sparse.pixels, dense.pixels)
+    ra, dec = rng.uniform(0, 360, 20000), np.degrees(np.arcsin(rng.uniform(-1, 1, 20000)))
+    np.testing.assert_array_equal(sparse.contains(ra, dec), dense.contains(ra, dec))
+    assert MOC.from_mask(sparse) == MOC.from_map(bitmap)
+
+    # Round trip through the cache file
+    cache = str(tmp_path / 'sparse.npz')
+    sparse.save(cache)
+    loaded = SparseHealpixMask.read(cache)
+    assert loaded.digest == sparse.digest and loaded.nbytes == sparse.nbytes
+    np.testing.assert_array_equal(loaded.contains(ra, dec), dense.contains(ra, dec))
+
+
+def test_read_cache_and_empty_mask(bitmap, tmp_path):
+    import healpy as hp
+
+    path, cache = str(tmp_path / 'mask.fits'), str(tmp_path / 'mask.npz')
+    hp.write_map(path, bitmap.astype(np.int16), nest=True, dtype=np.int16)
+    mask = SparseHealpixMask.read(path, coverage_order=COVERAGE_ORDER, cache=cache)
+    cached = SparseHealpixMask.read(path, coverage_order=COVERAGE_ORDER, cache=cache)
+    assert cached.digest == mask.digest and cached.n_pixels == bitmap.sum()
+    # Only the full and the partial coverage pixels take memory
+    assert mask.nbytes < bitmap.nbytes // 4
+
+    empty = SparseHealpixMask.from_map(np.zeros_like(bitmap), coverage_order=COVERAGE_ORDER)
+    assert empty.n_pixels == 0 and len(empty.pixels) == 0 and empty.to_moc().n_pixels == 0
+    assert not empty.contains(10.0, 10.0) and not empty.contains([10.0], [10.0]).any()
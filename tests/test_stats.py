@@ -0,0 +1,129 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Single-pass, mergeable summary statistics."""
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from damascus import io, utils
+from damascus.stats import CatalogStats, ColumnStats, batch_sweep_stats, summarize
+from damascus.sweep import SweepCatalog
+
+
+def _read(sweep_cat):
+    with fits.open(sweep_cat) as hdu_list:
+        return io.decode_table(hdu_list[1].data)
+
+
+def _assert_same(result, expected):
+    assert result.n_objects == expected.n_objects and result.counts == expected.counts
+    for col in expected.columns:
+        assert sorted(result.stats[col]) == sorted(expected.stats[col])
+        for name, stats in expected.stats[col].items():
+            other = result.stats[col][name]
+            assert (other.n, other.n_invalid) == (stats.n, stats.n_invalid)
+            assert (other.min, other.max) == (stats.min, stats.max)
+            assert other.mean == pytest.approx(stats.mean, rel=1e-12)
+            assert other.m2 == pytest.approx(stats.m2, rel=1e-9)
+            np.testing.assert_array_equal(other.counts, stats.counts)
+
+
+def test_column_merge_matches_numpy():
+    rng = np.random.default_rng(9)
+    values = rng.normal(22.0, 1.5, 30000)
+    values[::97] = np.nan
+    values[::101] = np.inf
+    valid = values[np.isfinite(values)]
+
+    blocks = np.split(values, [10, 5000, 5001, 17000])
+    merged = ColumnStats()
+    for block in blocks:
+        merged.merge(ColumnStats().update(block))
+    single = ColumnStats().update(values)
+
+    for stats in (merged, single):
+        assert stats.n == len(valid) and stats.n_invalid == len(values) - len(valid)
+        assert stats.min == valid.min() and stats.max == valid.max()
+        assert stats.mean == pytest.approx(valid.mean(), rel=1e-12)
+        assert stats.std ** 2 == pytest.approx(np.var(valid), rel=1e-10)
+        np.testing.assert_array_equal(
+            stats.counts, np.bincount(np.searchsorted(stats.edges, valid, side='right'),
+                                      minlength=len(stats.edges) + 1))
+
+    # Precision of the histogram: the bin width
+    np.testing.assert_allclose(merged.percentile([5, 50, 95]),
+                               np.percentile(valid, [5, 50, 95]), atol=0.02)
+    assert abs(merged.count_below(21.0) - (valid < 21.0).sum()) <= merged.counts.max()
+    assert merged.percentile(0) == valid.min() and merged.percentile(100) == valid.max()
+
+    restored = ColumnStats.from_dict(merged.to_dict())
+    assert (restored.n, restored.mean, restored.m2) == (merged.n, merged.mean, merged.m2)
+    empty = ColumnStats().update([np.nan])
+    assert empty.n == 0 and empty.n_invalid == 1 and np.isnan(empty.percentile(50))
+    assert ColumnStats.from_dict(empty.to_dict()).n_invalid == 1
+    with pytest.raises(ValueError):
+        merged.merge(ColumnStats(edges=[20.0, 21.0]))
+
+
+def test_catalog_stats_match_numpy(sweeps):
+    tables = [_read(sweep_cat) for sweep_cat in sweeps]
+    merged = CatalogStats().update(tables[0]).merge(CatalogStats().update(tables[1]))
+    _assert_same(merged, CatalogStats().update(np.concatenate(tables)))
+    _assert_same(CatalogStats().update(tables[0]) + CatalogStats().update(tables[1]), merged)
+
+    table = np.concatenate(tables)
+    obj_type = np.char.strip(table['TYPE'].astype(str))
+    assert merged.counts == {name: int((obj_type == name).sum()) for name in set(obj_type)}
+    for name in merged.groups:
+        mag = utils.flux_to_mag(table['FLUX_R'][obj_type == name].astype(float),
+                                zeropoint=22.5)
+        stats = merged.stats['FLUX_R'][name]
+        assert stats.n == len(mag) and stats.mean == pytest.approx(mag.mean())
+        assert stats.std ** 2 == pytest.approx(np.var(mag))
+
+    total = merged.total('FLUX_G')
+    mag_g = utils.flux_to_mag(table['FLUX_G'].astype(float), zeropoint=22.5)
+    assert total.n == len(table) and total.mean == pytest.approx(mag_g.mean())
+
+    with pytest.raises(ValueError):
+        merged.merge(CatalogStats(by=None))
+
+
+def test_summarize_blocks_mask_and_json(sweeps, healpix_mask, tmp_path):
+    from damascus.hsc import FDFCMask
+
+    expected = CatalogStats().update(_read(sweeps[0]))
+    _assert_same(summarize(sweeps[0]), expected)
+    _assert_same(summarize(sweeps[0], chunk_rows=333), expected)
+
+    table, mask = _read(sweeps[0]), FDFCMask.read(healpix_mask)
+    inside = mask.contains(table['RA'], table['DEC'])
+    assert 0 < inside.sum() < len(table)
+    _assert_same(summarize(sweeps[0], mask=healpix_mask, chunk_rows=500),
+                 CatalogStats().update(table[inside]))
+
+    json_file = str(tmp_path / 'stats.json')
+    expected.save(json_file)
+    _assert_same(CatalogStats.load(json_file), expected)
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_batch_sweep_stats_matches_single_pass(sweeps, healpix_mask, n_workers):
+    tables = [_read(sweep_cat) for sweep_cat in sweeps]
+    expected = CatalogStats(by=None, zeropoint=None, edges=np.linspace(0, 1000, 101))
+    expected.update(np.concatenate(tables))
+    result = batch_sweep_stats(sweeps, n_workers=n_workers, by=None, zeropoint=None,
+                               edges=np.linspace(0, 1000, 101), verbose=False)
+    _assert_same(result, expected)
+
+    masked = batch_sweep_stats(sweeps, n_workers=n_workers, mask=healpix_mask, verbose=False)
+    assert masked.n_objects == sum(summarize(s, mask=healpix_mask).n_objects for s in sweeps)
+
+
+def test_demography(sweeps):
+    table = _read(sweeps[1])
+    summary = SweepCatalog(sweeps[1]).demography(verbose=False, chunk_rows=700)
+    names, counts = np.unique(np.char.strip(table['TYPE'].astype(str)), return_counts=True)
+    assert summary.counts == dict(zip(names.tolist(), counts.tolist()))
+    _assert_same(summary, CatalogStats().update(table))
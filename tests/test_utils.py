@@ -0,0 +1,136 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Photometry kernels."""
+
+import warnings
+
+import numpy as np
+import pytest
+
+from damascus import utils
+
+MAG_ERR_COEF = 2.5 / np.log(10.0)
+
+
+@pytest.fixture
+def fluxes():
+    rng = np.random.default_rng(11)
+    flux = rng.lognormal(1.0, 2.0, 20000) * rng.choice([1, 1, 1, -1], 20000)
+    flux[:5] = [0.0, np.nan, -np.inf, np.inf, 1e-30]
+    ivar = rng.uniform(0.1, 10.0, 20000)
+    ivar[10:20] = 0.0
+    return flux, ivar
+
+
+def test_mag_flux_match_formula(fluxes):
+    flux, _ = fluxes
+    positive = flux > 0
+    with np.errstate(all='raise'):
+        mag = utils.flux_to_mag(flux, zeropoint=22.5)
+    np.testing.assert_allclose(mag[positive], -2.5 * np.log10(flux[positive]) + 22.5)
+    assert np.isnan(mag[~positive]).all()
+    assert (utils.flux_to_mag(flux, fill=99.0)[~positive] == 99.0).all()
+
+    mags = np.linspace(15, 30, 100)
+    np.testing.assert_allclose(utils.mag_to_flux(mags, zeropoint=22.5),
+                               10.0 ** ((22.5 - mags) / 2.5))
+    np.testing.assert_allclose(utils.flux_to_mag(utils.mag_to_flux(mags)), mags)
+    assert utils.mag_to_flux(22.5, zeropoint='decals') == 1.0
+    with pytest.raises(ValueError):
+        utils.mag_to_flux(22.5, zeropoint='sdss')
+
+
+def test_errors_match_formula(fluxes):
+    flux, ivar = fluxes
+    valid = (flux > 0) & (ivar > 0)
+    with np.errstate(all='raise'):
+        err = utils.flux_to_mag_err(flux, ivar)
+    np.testing.assert_allclose(err[valid], MAG_ERR_COEF / (flux[valid] * np.sqrt(ivar[valid])))
+    assert np.isnan(err[~valid]).all()
+
+    finite = np.isfinite(flux)
+    b = 0.3
+    asinh = utils.flux_to_asinh_mag(flux[finite], zeropoint=22.5, softening=b)
+    np.testing.assert_allclose(
+        asinh, 22.5 - MAG_ERR_COEF * (np.arcsinh(flux[finite] / (2 * b)) + np.log(b)))
+    asinh_err = utils.flux_to_asinh_mag_err(flux, ivar, softening=b)
+    ok = ivar > 0
+    np.testing.assert_allclose(
+        asinh_err[ok], MAG_ERR_COEF / np.sqrt(ivar[ok] * (4 * b ** 2 + flux[ok] ** 2)))
+
+    # The asinh magnitude is the normal magnitude for bright objects
+    bright = np.array([1e4, 1e5])
+    np.testing.assert_allclose(utils.flux_to_asinh_mag(bright, softening=b),
+                               utils.flux_to_mag(bright), atol=1e-6)
+
+    # Default softening from the median flux error
+    np.testing.assert_allclose(
+        utils.flux_to_asinh_mag(flux, flux_ivar=ivar),
+        utils.flux_to_asinh_mag(flux, softening=1.042 / np.sqrt(np.median(ivar[ivar > 0]))))
+    with pytest.raises(ValueError):
+        utils.flux_to_asinh_mag(flux)
+
+
+def test_out_buffers_scalars_and_dtype(fluxes):
+    flux, ivar = fluxes
+    # No warning from the masked-out elements when the input is cast to the output
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        for dtype in (np.float32, np.float64):
+            # The tiny flux really overflows the float32 magnitude error
+            values = np.delete(flux, 4)
+            for values in (values, values.astype(np.float32)):
+                buffer = np.empty(len(values), dtype=dtype)
+                utils.flux_to_mag(values, out=buffer)
+                utils.flux_to_mag_err(values, np.abs(values), out=buffer)
+                utils.flux_to_asinh_mag_err(values, np.abs(values), softening=1.0, out=buffer)
+
+    out = np.empty(len(flux))
+    assert utils.flux_to_mag(flux, out=out) is out
+    np.testing.assert_array_equal(out, utils.flux_to_mag(flux))
+    assert utils.flux_to_mag_err(flux, ivar, out=out) is out
+
+    assert utils.flux_to_mag(flux.astype(np.float32)).dtype == np.float32
+    assert utils.flux_to_mag(np.arange(1, 4)).dtype == np.float64
+    assert np.isscalar(utils.flux_to_mag(10.0)) and np.isnan(utils.flux_to_mag(-1.0))
+    assert utils.flux_to_mag(10.0, zeropoint=22.5) == pytest.approx(20.0)
+
+
+def test_photometry_matches_per_band(fluxes):
+    flux, ivar = fluxes
+    catalog = {'FLUX_G': flux, 'FLUX_IVAR_G': ivar, 'FLUX_R': flux[::-1].copy(),
+               'FLUX_IVAR_R': ivar[::-1].copy(), 'FLUX_Z': np.abs(flux)}
+    phot = utils.photometry(catalog, asinh=True, softening={'G': 0.2, 'R': 0.3, 'Z': 0.4},
+                            dtype=np.float64)
+    assert phot.dtype.names == (
+        'MAG_G', 'MAG_ERR_G', 'ASINH_MAG_G', 'ASINH_MAG_ERR_G', 'MAG_R', 'MAG_ERR_R',
+        'ASINH_MAG_R', 'ASINH_MAG_ERR_R', 'MAG_Z', 'ASINH_MAG_Z')
+    for band, soft in zip('GRZ', [0.2, 0.3, 0.4]):
+        np.testing.assert_array_equal(
+            phot['MAG_' + band], utils.flux_to_mag(catalog['FLUX_' + band], zeropoint=22.5))
+        np.testing.assert_array_equal(
+            phot['ASINH_MAG_' + band],
+            utils.flux_to_asinh_mag(catalog['FLUX_' + band], zeropoint=22.5, softening=soft))
+    np.testing.assert_array_equal(
+        phot['MAG_ERR_R'], utils.flux_to_mag_err(catalog['FLUX_R'], catalog['FLUX_IVAR_R']))
+
+    # Reuse of the output buffer, and float32 output
+    assert utils.photometry(catalog, asinh=True, softening=0.2, dtype=np.float64,
+                            out=phot) is phot
+    np.testing.assert_array_equal(phot['ASINH_MAG_R'], utils.flux_to_asinh_mag(
+        catalog['FLUX_R'], zeropoint=22.5, softening=0.2))
+    single = utils.photometry(catalog, bands=['G'], errors=False)
+    assert single.dtype.names == ('MAG_G',) and single['MAG_G'].dtype == np.float32
+    with pytest.raises(ValueError):
+        utils.photometry(catalog, out=single)
+
+
+def test_photometry_on_sweep(sweeps):
+    from astropy.io import fits
+
+    with fits.open(sweeps[0]) as hdu_list:
+        catalog = hdu_list[1].data
+        phot = utils.photometry(catalog, dtype=np.float64)
+        np.testing.assert_allclose(
+            phot['MAG_Z'], utils.flux_to_mag(np.asarray(catalog['FLUX_Z'], dtype=float),
+                                             zeropoint=22.5))
@@ -0,0 +1,69 @@
+# Licensed under MIT license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Cross-match of the sweeps to a reference catalog."""
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from damascus import xmatch
+
+
+@pytest.fixture
+def reference(sweeps):
+    '''Every other object of the sweeps, shifted by 0.3 arcsec in Dec.'''
+    ra, dec = [], []
+    for sweep_cat in sweeps:
+        with fits.open(sweep_cat) as hdu_list:
+            ra.append(hdu_list[1].data['RA'][::2])
+            dec.append(hdu_list[1].data['DEC'][::2] + 0.3 / 3600.0)
+    return np.concatenate(ra), np.concatenate(dec)
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_batch_crossmatch_keeps_bool_column(sweeps, reference, n_workers):
+    ref_ra, ref_dec = reference
+    matched, idx_ref, sep = xmatch.batch_crossmatch_sweeps(
+        sweeps, ref_ra, ref_dec, radius=1.0, n_workers=n_workers, verbose=False,
+        g_mag=None, r_mag=None, z_mag=None)
+
+    single = [xmatch.crossmatch_sweep(sweep_cat, ref_ra, ref_dec, radius=1.0,
+                                      g_mag=None, r_mag=None, z_mag=None)
+              for sweep_cat in sweeps]
+    flag = np.concatenate([np.asarray(gal['BRIGHTSTARINBLOB']) for gal, _, _ in single])
+    assert 0 < flag.sum() < len(flag)
+    np.testing.assert_array_equal(matched['BRIGHTSTARINBLOB'], flag)
+    np.testing.assert_array_equal(idx_ref, np.concatenate([idx for _, idx, _ in single]))
+    np.testing.assert_allclose(sep, 0.3, rtol=1e-3)
+
+
+@pytest.mark.parametrize('nearest', [True, False])
+def test_prebuilt_matcher(sweeps, reference, nearest):
+    ref_ra, ref_dec = reference
+    matcher = xmatch.SkyMatcher(ref_ra, ref_dec)
+    for sweep_cat in sweeps:
+        gal, idx_ref, sep = xmatch.crossmatch_sweep(
+            sweep_cat, ref_ra, ref_dec, radius=2.0, nearest=nearest, g_mag=None)
+        gal_pre, idx_pre, sep_pre = xmatch.crossmatch_sweep(
+            sweep_cat, None, None, radius=2.0, nearest=nearest, matcher=matcher, g_mag=None)
+        np.testing.assert_array_equal(gal_pre['RA'], gal['RA'])
+        np.testing.assert_array_equal(idx_pre, idx_ref)
+        np.testing.assert_allclose(sep_pre, sep)
+
+
+def test_batch_crossmatch_reads_mask_once(sweeps, reference, healpix_mask, monkeypatch):
+    from damascus import hsc
+
+    ref_ra, ref_dec = reference
+    expected = xmatch.batch_crossmatch_sweeps(
+        sweeps, ref_ra, ref_dec, n_workers=1, verbose=False, mask=hsc.FDFCMask.read(healpix_mask))
+
+    n_reads = []
+    read = hsc.FDFCMask.read.__func__
+    monkeypatch.setattr(hsc.FDFCMask, 'read', classmethod(
+        lambda cls, *args, **kwargs: n_reads.append(args) or read(cls, *args, **kwargs)))
+    matched, idx_ref, _ = xmatch.batch_crossmatch_sweeps(
+        sweeps, ref_ra, ref_dec, n_workers=1, verbose=False, mask=healpix_mask)
+    assert len(n_reads) == 1
+    assert 0 < len(matched)
+    np.testing.assert_array_equal(idx_ref, expected[1])